@@ -1,5 +1,5 @@
 from django.contrib import admin
-from .models import Page, Block, Comment
+from .models import Page, Block, Comment, Upload
 
 
 @admin.register(Page)
@@ -28,3 +28,9 @@ class CommentAdmin(admin.ModelAdmin):
     def content_preview(self, obj):
         return obj.content[:50]
     content_preview.short_description = 'Содержимое'
+
+
+@admin.register(Upload)
+class UploadAdmin(admin.ModelAdmin):
+    list_display = ['file_name', 'owner', 'block', 'received', 'size', 'updated_at']
+    list_filter = ['updated_at']
@@ -5,3 +5,14 @@ class ContentConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'content'
     verbose_name = 'Контент'
+    
+    def ready(self):
+        from django.db.models.signals import post_migrate
+        from . import signals
+        from .search import ensure_search_schema
+        post_migrate.connect(ensure_search_schema, sender=self)
+        
+        from django.conf import settings
+        if settings.PROFILING_ENABLED:
+            from .profiling import instrument_serializers
+            instrument_serializers()
@@ -6,6 +6,7 @@ from rest_framework_simplejwt.tokens import RefreshToken
 from django.contrib.auth import authenticate
 from django.contrib.auth.models import User
 from .auth_serializers import RegisterSerializer, UserSerializer
+from .authentication import forget_user, revoke_access_token
 
 
 @api_view(['POST'])
@@ -56,7 +57,9 @@ def login(request):
 @permission_classes([IsAuthenticated])
 def me(request):
     """Получить информацию о текущем пользователе"""
-    return Response(UserSerializer(request.user).data)
+    # В кэше аутентификации только id и is_active: остальные поля читаются одним запросом
+    user = User.objects.get(pk=request.user.pk)
+    return Response(UserSerializer(user).data)
 
 
 @api_view(['POST'])
@@ -68,6 +71,10 @@ def logout(request):
         if refresh_token:
             token = RefreshToken(refresh_token)
             token.blacklist()
+        # Текущий access-токен перестает действовать сразу, а не по истечении срока
+        if request.auth is not None:
+            revoke_access_token(request.auth)
+        forget_user(request.user.id)
         return Response({'message': 'Успешный выход'}, status=status.HTTP_200_OK)
     except Exception as e:
         return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
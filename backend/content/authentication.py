@@ -0,0 +1,143 @@
+"""JWT-аутентификация с кэшем пользователя и отзыва токенов.
+
+Стандартный JWTAuthentication на каждый запрос читает строку User из базы.
+Здесь нужные для проверки поля пользователя берутся из кэша Django (общего
+Redis в продакшене) на AUTH_USER_CACHE_TIMEOUT секунд: id, is_active и хеш
+для проверки отзыва токена, но не сам пароль и не остальные поля. Запись
+сбрасывается при изменении пользователя (смена пароля, блокировка) и при выходе. Отозванные при выходе access-токены
+и состояние blacklist refresh-токенов тоже хранятся в кэше по jti. Отзыв при этом
+записывается и в blacklist в базе, а отрицательный ответ («не отозван») кэшируется
+не дольше AUTH_USER_CACHE_TIMEOUT: кэш в памяти процесса (без Redis) не видит
+отметок, поставленных другими процессами.
+"""
+import time
+from datetime import datetime, timezone
+
+from django.conf import settings
+from django.core.cache import cache
+from django.utils.translation import gettext_lazy as _
+from rest_framework_simplejwt.authentication import JWTAuthentication
+from rest_framework_simplejwt.exceptions import AuthenticationFailed, InvalidToken, TokenError
+from rest_framework_simplejwt.serializers import TokenRefreshSerializer
+from rest_framework_simplejwt.settings import api_settings
+from rest_framework_simplejwt.token_blacklist.models import BlacklistedToken, OutstandingToken
+from rest_framework_simplejwt.tokens import RefreshToken
+from rest_framework_simplejwt.utils import get_md5_hash_password
+
+
+def user_key(user_id):
+    # Не auth:user: под старым ключом лежали объекты User целиком
+    return f'auth:user-state:{user_id}'
+
+
+def revoked_key(jti):
+    return f'auth:revoked:{jti}'
+
+
+def blacklisted_key(jti):
+    return f'auth:blacklisted:{jti}'
+
+
+def token_lifetime(token):
+    """Сколько секунд токен еще действителен: дольше хранить его состояние незачем"""
+    return max(1, int(token['exp'] - time.time()))
+
+
+def unrevoked_timeout(token):
+    """Сколько секунд помнить, что токен не отозван: в других процессах его могут отозвать в любой момент"""
+    return min(token_lifetime(token), settings.AUTH_USER_CACHE_TIMEOUT)
+
+
+def is_blacklisted(key, jti, token):
+    """Есть ли jti в blacklist: из кэша, а при промахе — из базы с кэшированием ответа"""
+    blacklisted = cache.get(key)
+    if blacklisted is None:
+        blacklisted = BlacklistedToken.objects.filter(token__jti=jti).exists()
+        # add, а не set: не затирает отметку, которую успели поставить после запроса
+        cache.add(key, blacklisted, token_lifetime(token) if blacklisted else unrevoked_timeout(token))
+    return blacklisted
+
+
+def forget_user(user_id):
+    """Сбрасывает кэшированного пользователя: следующий запрос прочитает его из базы"""
+    cache.delete(user_key(user_id))
+
+
+def revoke_access_token(token):
+    """Отзывает access-токен до истечения его срока (выход из системы).
+    
+    Кроме кэша токен попадает в blacklist в базе: без общего кэша остальные
+    процессы узнают об отзыве оттуда.
+    """
+    jti = token[api_settings.JTI_CLAIM]
+    outstanding, _ = OutstandingToken.objects.get_or_create(jti=jti, defaults={
+        'user_id': token.get(api_settings.USER_ID_CLAIM),
+        'token': str(token),
+        'created_at': datetime.fromtimestamp(token['iat'], tz=timezone.utc) if 'iat' in token else None,
+        'expires_at': datetime.fromtimestamp(token['exp'], tz=timezone.utc),
+    })
+    BlacklistedToken.objects.get_or_create(token=outstanding)
+    cache.set(revoked_key(jti), True, token_lifetime(token))
+
+
+def cached_user(user_model, pk, is_active):
+    """Пользователь из кэша: загружены только pk и is_active, остальные поля читаются из базы при обращении"""
+    return user_model.from_db(
+        None, [user_model._meta.pk.attname, 'is_active'], [pk, is_active]
+    )
+
+
+class CachedJWTAuthentication(JWTAuthentication):
+    """JWTAuthentication без запроса к базе, пока пользователь есть в кэше"""
+    
+    def get_user(self, validated_token):
+        try:
+            user_id = validated_token[api_settings.USER_ID_CLAIM]
+        except KeyError:
+            raise InvalidToken(_('Token contained no recognizable user identification'))
+        
+        # Пользователь и отметка об отзыве токена — одним обращением к кэшу
+        jti = validated_token[api_settings.JTI_CLAIM]
+        keys = [user_key(user_id), revoked_key(jti)]
+        cached = cache.get_many(keys)
+        revoked = cached.get(keys[1])
+        if revoked is None and not settings.AUTH_CACHE_SHARED:
+            # Кэш только этого процесса: отзыв в другом процессе виден лишь в базе
+            revoked = is_blacklisted(keys[1], jti, validated_token)
+        if revoked:
+            raise AuthenticationFailed(_('Token is revoked'), code='token_revoked')
+        state = cached.get(keys[0])
+        if state is None:
+            try:
+                user = self.user_model.objects.get(**{api_settings.USER_ID_FIELD: user_id})
+            except self.user_model.DoesNotExist:
+                raise AuthenticationFailed(_('User not found'), code='user_not_found')
+            state = (user.pk, user.is_active, get_md5_hash_password(user.password))
+            cache.set(keys[0], state, settings.AUTH_USER_CACHE_TIMEOUT)
+        pk, is_active, password_hash = state
+        
+        if not is_active:
+            raise AuthenticationFailed(_('User is inactive'), code='user_inactive')
+        if api_settings.CHECK_REVOKE_TOKEN and validated_token.get(
+            api_settings.REVOKE_TOKEN_CLAIM
+        ) != password_hash:
+            raise AuthenticationFailed(_("The user's password has been changed."), code='password_changed')
+        return cached_user(self.user_model, pk, is_active)
+
+
+class CachedRefreshToken(RefreshToken):
+    """Refresh-токен, проверяющий blacklist через кэш.
+    
+    Токен попадает в blacklist один раз и навсегда: положительный ответ хранится
+    до истечения токена. Сигнал на BlacklistedToken обновляет только кэш своего
+    процесса, поэтому отрицательный — не дольше AUTH_USER_CACHE_TIMEOUT.
+    """
+    
+    def check_blacklist(self):
+        jti = self.payload[api_settings.JTI_CLAIM]
+        if is_blacklisted(blacklisted_key(jti), jti, self.payload):
+            raise TokenError(_('Token is blacklisted'))
+
+
+class CachedTokenRefreshSerializer(TokenRefreshSerializer):
+    token_class = CachedRefreshToken
@@ -0,0 +1,43 @@
+from django.conf import settings
+from django.core.cache import cache
+from django.utils.cache import get_conditional_response
+from django.utils.http import http_date
+
+
+def page_etag(page):
+    """Сильный ETag по ревизии страницы: меняется при любом изменении ее содержимого"""
+    return f'"{page.id}.{page.revision}"'
+
+
+def not_modified_response(request, page):
+    """304 Not Modified, если у клиента актуальная версия страницы, иначе None"""
+    return get_conditional_response(
+        request,
+        etag=page_etag(page),
+        last_modified=int(page.last_modified.timestamp()),
+    )
+
+
+def set_validators(response, page, cache_control='private, no-cache'):
+    """Добавляет к ответу ETag, Last-Modified и Cache-Control"""
+    response['ETag'] = page_etag(page)
+    response['Last-Modified'] = http_date(page.last_modified.timestamp())
+    response['Cache-Control'] = cache_control
+    return response
+
+
+def cached_public_data(request, page, token, kind, build):
+    """Сериализованные данные публичной страницы из кэша по (token, revision, адрес сайта).
+    
+    Ревизия входит в ключ, поэтому запись страницы, ее блоков или комментариев
+    делает старые записи недостижимыми без явной очистки кэша. Абсолютные URL
+    (share_url, файлы) строятся по Host запроса, поэтому схема и хост — тоже часть
+    ключа; хост уже проверен по ALLOWED_HOSTS, так что вариантов немного.
+    """
+    origin = f'{request.scheme}://{request.get_host()}'
+    key = f'content:public:{kind}:{token}:{page.revision}:{origin}'
+    data = cache.get(key)
+    if data is None:
+        data = build()
+        cache.set(key, data, settings.PUBLIC_PAGE_CACHE_TIMEOUT)
+    return data
@@ -0,0 +1,266 @@
+"""Журнал изменений блоков: отмена, повтор и состояние страницы на момент времени.
+
+Каждое изменение блоков страницы одним запросом — запись HistoryEntry со списком
+операций insert/update/move/delete. insert и delete хранят блок целиком, update и
+move — только изменившиеся поля (before/after); delete хранит и комментарии блоков,
+отмена удаления возвращает их. Отмена и повтор применяют операции
+через ORM (сигналы обновляют ревизии и рассылают события) и сами пишутся в журнал,
+поэтому состояние на момент T — ближайший более ранний снимок PageSnapshot плюс
+проигрывание записей после него. Снимки делает и старые записи удаляет
+manage.py compact_history; первый снимок страницы берется перед первой записью.
+"""
+from datetime import datetime
+
+from django.db import transaction
+from django.db.models import Exists, Max, OuterRef
+
+from .models import Page, Block, Comment, DeletedBlock, HistoryEntry, PageSnapshot
+
+# Поля состояния блока (parent — id родителя, file — имя файла в хранилище)
+STATE_FIELDS = (
+    'block_type', 'content', 'format', 'file', 'file_name', 'file_type', 'file_size',
+    'file_variants', 'checked', 'order', 'parent',
+)
+# Уменьшенные копии пересчитывает media_worker, в изменения они не попадают
+DIFF_FIELDS = tuple(name for name in STATE_FIELDS if name != 'file_variants')
+MOVE_FIELDS = {'order', 'parent'}
+
+
+def block_state(block):
+    """Состояние блока без id"""
+    state = {name: getattr(block, name) for name in STATE_FIELDS if name not in ('file', 'parent')}
+    state['file'] = block.file.name or ''
+    state['parent'] = block.parent_id
+    return state
+
+
+def page_states(queryset):
+    """Состояния блоков одним запросом: [{id, поля...}]"""
+    states = list(queryset.order_by().values('id', *STATE_FIELDS))
+    for state in states:
+        state['file'] = state['file'] or ''
+    return states
+
+
+def subtree_states(page_id, block_ids):
+    """Блоки с потомками (их удалит каскад): сначала самые глубокие, корни последними.
+    
+    Один запрос на уровень вложенности и один на комментарии (ключ 'comments'
+    у блоков, где они есть). Отмена идет в обратном порядке и восстанавливает
+    родителей раньше детей.
+    """
+    blocks = Block.objects.filter(page_id=page_id)
+    levels = [page_states(blocks.filter(id__in=block_ids))]
+    while levels[-1]:
+        levels.append(page_states(blocks.filter(parent_id__in=[state['id'] for state in levels[-1]])))
+    states = [state for level in reversed(levels) for state in level]
+    by_id = {state['id']: state for state in states}
+    comments = Comment.objects.filter(block_id__in=list(by_id)).order_by('created_at', 'id')
+    for block_id, content, created_at in comments.values_list('block_id', 'content', 'created_at'):
+        by_id[block_id].setdefault('comments', []).append(
+            {'content': content, 'created_at': created_at.isoformat()}
+        )
+    return states
+
+
+def restore_comments(block_id, comments):
+    """Комментарии удаленного блока (из subtree_states) с прежним временем создания"""
+    created = Comment.objects.bulk_create([Comment(block_id=block_id, content=item['content']) for item in comments])
+    # auto_now_add перезаписывает время при создании, прежнее возвращается отдельным UPDATE
+    for comment, item in zip(created, comments):
+        comment.created_at = datetime.fromisoformat(item['created_at'])
+    Comment.objects.bulk_update(created, ['created_at'])
+
+
+def take_snapshot(page_id):
+    """Снимок текущего состояния страницы; вызывается в транзакции"""
+    # Блокировка страницы: запись журнала не вклинится между чтением блоков и entry_id
+    Page.objects.select_for_update().filter(id=page_id).values_list('id').first()
+    entry_id = HistoryEntry.objects.filter(page_id=page_id).aggregate(last=Max('id'))['last'] or 0
+    return PageSnapshot.objects.create(
+        page_id=page_id, entry_id=entry_id, blocks=page_states(Block.objects.filter(page_id=page_id))
+    )
+
+
+class Journal:
+    """Операции одного изменения страницы; запись в базу — save() в той же транзакции"""
+    
+    def __init__(self, page_id, user=None, action='edit'):
+        self.page_id = page_id
+        self.user = user if user is not None and user.is_authenticated else None
+        self.action = action
+        self.operations = []
+        self.entry = None
+    
+    @classmethod
+    def start(cls, page_id, user=None, action='edit'):
+        """Журнал изменения; вызывается до записи блоков.
+        
+        У страницы без снимков сначала снимается исходное состояние: оно
+        действует с последнего изменения страницы, сделанного до журнала.
+        """
+        page = (
+            Page.objects.filter(id=page_id)
+            .annotate(has_snapshot=Exists(PageSnapshot.objects.filter(page=OuterRef('id'))))
+            .values('has_snapshot', 'created_at', 'revised_at').get()
+        )
+        if not page['has_snapshot']:
+            # Записей еще нет, поэтому entry_id=0. Параллельная запись, попавшая в снимок, при
+            # проигрывании ничего не испортит: операции хранят значения полей, а не приращения
+            PageSnapshot.objects.create(
+                page_id=page_id, blocks=page_states(Block.objects.filter(page_id=page_id)),
+                created_at=page['revised_at'] or page['created_at'],
+            )
+        return cls(page_id, user, action)
+    
+    def insert(self, block):
+        self.operations.append({'op': 'insert', 'id': block.id, 'after': block_state(block)})
+    
+    def update(self, before, block):
+        """Изменение блока относительно состояния before (block_state до записи)"""
+        self.change(block.id, before, block_state(block))
+    
+    def change(self, block_id, before, after):
+        changed = [name for name in DIFF_FIELDS if name in after and before.get(name) != after[name]]
+        if changed:
+            self.operations.append({
+                'op': 'move' if set(changed) <= MOVE_FIELDS else 'update',
+                'id': block_id,
+                'before': {name: before.get(name) for name in changed},
+                'after': {name: after[name] for name in changed},
+            })
+    
+    def delete(self, states):
+        """Удаление блоков (states — subtree_states до удаления)"""
+        for state in states:
+            before = dict(state)
+            self.operations.append({'op': 'delete', 'id': before.pop('id'), 'before': before})
+    
+    def save(self, force=False):
+        """Запись журнала; без операций — только с force (отмена, которой нечего менять)"""
+        if self.operations or force:
+            self.entry = HistoryEntry.objects.create(
+                page_id=self.page_id, user=self.user, action=self.action, operations=self.operations
+            )
+        return self.entry
+
+
+def inverse(operations):
+    """Операции, отменяющие operations"""
+    result = []
+    for operation in reversed(operations):
+        if operation['op'] == 'insert':
+            result.append({'op': 'delete', 'id': operation['id'], 'before': operation['after']})
+        elif operation['op'] == 'delete':
+            result.append({'op': 'insert', 'id': operation['id'], 'after': operation['before']})
+        else:
+            result.append({**operation, 'before': operation['after'], 'after': operation['before']})
+    return result
+
+
+def apply(journal, operations):
+    """Применяет операции к блокам страницы и записывает в journal то, что изменилось.
+    
+    Операции над блоками, которых уже (или еще) нет, пропускаются.
+    """
+    blocks = Block.objects.filter(page_id=journal.page_id).in_bulk({operation['id'] for operation in operations})
+    for operation in operations:
+        block = blocks.get(operation['id'])
+        if operation['op'] == 'insert':
+            if block is not None:
+                continue
+            fields = dict(operation['after'])
+            parent_id = fields.pop('parent')
+            comments = fields.pop('comments', None)
+            # Блок возвращается с прежним id: на него ссылаются дети и остальной журнал
+            block = Block(id=operation['id'], page_id=journal.page_id, parent_id=parent_id, **fields)
+            block.save(force_insert=True)
+            if comments:
+                restore_comments(block.id, comments)
+            DeletedBlock.objects.filter(page_id=journal.page_id, block_id=block.id).delete()
+            blocks[block.id] = block
+            journal.insert(block)
+        elif block is None:
+            continue
+        elif operation['op'] == 'delete':
+            states = subtree_states(journal.page_id, [block.id])
+            block.delete()
+            for state in states:
+                blocks.pop(state['id'], None)
+            journal.delete(states)
+        else:
+            before = block_state(block)
+            for name, value in operation['after'].items():
+                setattr(block, 'parent_id' if name == 'parent' else name, value)
+            block.save()
+            journal.update(before, block)
+
+
+def undo(page_id, user=None):
+    """Отменяет последнее неотмененное изменение страницы; None, если отменять нечего"""
+    with transaction.atomic():
+        Page.objects.select_for_update().filter(id=page_id).values_list('id').first()
+        entry = (
+            HistoryEntry.objects.filter(page_id=page_id, action__in=('edit', 'redo'), undone=False)
+            .order_by('-id').first()
+        )
+        if entry is None:
+            return None
+        journal = Journal.start(page_id, user, action='undo')
+        apply(journal, inverse(entry.operations))
+        undo_entry = journal.save(force=True)
+        entry.undone = True
+        entry.undone_by = undo_entry.id
+        entry.save(update_fields=['undone', 'undone_by'])
+    return undo_entry
+
+
+def redo(page_id, user=None):
+    """Повторяет последнее отмененное изменение, если после отмены страницу не меняли"""
+    with transaction.atomic():
+        Page.objects.select_for_update().filter(id=page_id).values_list('id').first()
+        history = HistoryEntry.objects.filter(page_id=page_id)
+        last_edit = history.filter(action='edit').aggregate(last=Max('id'))['last'] or 0
+        entry = history.filter(undone=True, undone_by__gt=last_edit).order_by('-undone_by').first()
+        if entry is None:
+            return None
+        journal = Journal.start(page_id, user, action='redo')
+        apply(journal, entry.operations)
+        redo_entry = journal.save(force=True)
+        entry.undone_by = None
+        entry.save(update_fields=['undone_by'])
+    return redo_entry
+
+
+def replay(states, operations):
+    """Применяет операции к состояниям {id: поля} в памяти"""
+    for operation in operations:
+        if operation['op'] == 'insert':
+            states[operation['id']] = {
+                name: value for name, value in operation['after'].items() if name != 'comments'
+            }
+        elif operation['op'] == 'delete':
+            states.pop(operation['id'], None)
+        elif operation['id'] in states:
+            states[operation['id']].update(operation['after'])
+
+
+def page_as_of(page_id, moment):
+    """Блоки страницы на момент moment в порядке вывода; None, если история не сохранилась.
+    
+    Проигрываются только записи после ближайшего снимка, поэтому время
+    ограничено частотой снимков compact_history, а не возрастом страницы.
+    """
+    snapshot = (
+        PageSnapshot.objects.filter(page_id=page_id, created_at__lte=moment)
+        .order_by('-entry_id', '-id').first()
+    )
+    if snapshot is None:
+        return None
+    states = {state['id']: state for state in snapshot.blocks}
+    entries = HistoryEntry.objects.filter(page_id=page_id, id__gt=snapshot.entry_id, created_at__lte=moment)
+    for operations in entries.order_by('id').values_list('operations', flat=True).iterator():
+        replay(states, operations)
+    blocks = [{'id': block_id, **state} for block_id, state in states.items()]
+    blocks.sort(key=lambda block: (block['order'], block['id']))
+    return blocks
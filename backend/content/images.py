@@ -0,0 +1,230 @@
+"""Производные изображений: уменьшенные копии WebP/AVIF и заглушки blurhash.
+
+Копии строит фоновый воркер (manage.py media_worker) по очереди MediaJob;
+описание копий хранится рядом с файлом (Block.file_variants, Page.cover_variants),
+поэтому сериализаторы отдают srcset без дополнительных запросов.
+"""
+import io
+import math
+from pathlib import PurePosixPath
+
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from PIL import Image, ImageOps
+
+from .models import Page, Block, MediaJob
+from .storage import touch
+
+try:
+    # AVIF есть в Pillow >= 11.2, для старых версий — плагин pillow-avif-plugin
+    import pillow_avif  # noqa: F401
+except ImportError:
+    pass
+
+IMAGE_EXTENSIONS = {'.jpg', '.jpeg', '.png', '.webp', '.gif', '.bmp', '.tif', '.tiff', '.avif'}
+
+# Качество сжатия по форматам; AVIF при том же качестве заметно меньше WebP
+QUALITY = {'avif': 60, 'webp': 80}
+
+BASE83 = '0123456789ABCDEFGHIJKLMNOPQRSTUVWXYZabcdefghijklmnopqrstuvwxyz#$%*+,-.:;=?@[]^_{|}~'
+
+
+def variant_formats():
+    """Форматы копий, которые умеет сохранять установленный Pillow"""
+    Image.init()
+    return [name for name in ('avif', 'webp') if name.upper() in Image.SAVE]
+
+
+def is_image(name, content_type=''):
+    if content_type.startswith('image/'):
+        return content_type != 'image/svg+xml'
+    return PurePosixPath(name).suffix.lower() in IMAGE_EXTENSIONS
+
+
+def needs_variants(file, content_type, variants):
+    """Для файла еще нет копий (новая загрузка или замена файла)"""
+    return bool(file) and is_image(file.name, content_type) and variants.get('source') != file.name
+
+
+def no_variants(name):
+    """Описание для файла, у которого копий не будет (SVG, файл без расширения изображения).
+
+    Хранится как обычное описание, поэтому enqueue_missing не ставит файл в очередь снова.
+    """
+    return {'source': name, 'sources': {}}
+
+
+def encode83(value, length):
+    return ''.join(BASE83[value // 83 ** (length - index - 1) % 83] for index in range(length))
+
+
+def srgb_to_linear(value):
+    value /= 255
+    return value / 12.92 if value <= 0.04045 else ((value + 0.055) / 1.055) ** 2.4
+
+
+def linear_to_srgb(value):
+    value = min(max(value, 0), 1)
+    if value <= 0.0031308:
+        return int(value * 12.92 * 255 + 0.5)
+    return int((1.055 * value ** (1 / 2.4) - 0.055) * 255 + 0.5)
+
+
+def blurhash(image, x_components=4, y_components=3):
+    """Строка blurhash (https://blurha.sh) по уменьшенной до 32px копии изображения"""
+    small = image.convert('RGB')
+    small.thumbnail((32, 32))
+    width, height = small.size
+    pixels = [tuple(srgb_to_linear(channel) for channel in pixel) for pixel in small.getdata()]
+
+    factors = []
+    for j in range(y_components):
+        cos_y = [math.cos(math.pi * j * y / height) for y in range(height)]
+        for i in range(x_components):
+            cos_x = [math.cos(math.pi * i * x / width) for x in range(width)]
+            normalisation = 1 if i == 0 and j == 0 else 2
+            total = [0.0, 0.0, 0.0]
+            for y in range(height):
+                for x in range(width):
+                    basis = cos_x[x] * cos_y[y]
+                    pixel = pixels[y * width + x]
+                    for channel in range(3):
+                        total[channel] += basis * pixel[channel]
+            scale = normalisation / (width * height)
+            factors.append([value * scale for value in total])
+
+    dc, ac = factors[0], factors[1:]
+    result = encode83(x_components - 1 + (y_components - 1) * 9, 1)
+    if ac:
+        quantised_max = max(0, min(82, int(max(abs(value) for factor in ac for value in factor) * 166 - 0.5)))
+        maximum = (quantised_max + 1) / 166
+    else:
+        quantised_max, maximum = 0, 1
+    result += encode83(quantised_max, 1)
+    result += encode83((linear_to_srgb(dc[0]) << 16) + (linear_to_srgb(dc[1]) << 8) + linear_to_srgb(dc[2]), 4)
+    for factor in ac:
+        quantised = [
+            max(0, min(18, int(math.copysign(abs(value / maximum) ** 0.5, value) * 9 + 9.5)))
+            for value in factor
+        ]
+        result += encode83(quantised[0] * 19 * 19 + quantised[1] * 19 + quantised[2], 2)
+    return result
+
+
+def build_variants(name):
+    """Сохраняет уменьшенные копии файла хранилища name и возвращает их описание"""
+    with default_storage.open(name, 'rb') as source:
+        image = Image.open(source)
+        image = ImageOps.exif_transpose(image)
+        image = image.convert('RGBA' if 'A' in image.getbands() else 'RGB')
+    width, height = image.size
+
+    widths = [size for size in settings.IMAGE_VARIANT_WIDTHS if size < width]
+    if width <= max(settings.IMAGE_VARIANT_WIDTHS):
+        widths.append(width)
+
+    stem = PurePosixPath(name).with_suffix('')
+    formats = variant_formats()
+    sources = {image_format: [] for image_format in formats}
+    for size in widths:
+        resized = None
+        for image_format in formats:
+            target = f'derivatives/{stem}-{size}w.{image_format}'
+            # Имя источника уникально для содержимого, так что готовую копию можно взять как есть
+            if default_storage.exists(target):
+                touch(default_storage, target)
+            else:
+                if resized is None:
+                    resized = image if size == width else image.resize(
+                        (size, max(1, round(height * size / width))), Image.LANCZOS
+                    )
+                buffer = io.BytesIO()
+                resized.save(buffer, format=image_format.upper(), quality=QUALITY[image_format])
+                target = default_storage.save(target, ContentFile(buffer.getvalue()))
+            sources[image_format].append([size, target])
+
+    return {
+        'source': name,
+        'width': width,
+        'height': height,
+        'blurhash': blurhash(image),
+        'sources': sources,
+    }
+
+
+def srcset(name, variants, url):
+    """srcset по форматам для актуальных копий файла name, иначе None; url(формат, ширина) — адрес копии"""
+    if not name or variants.get('source') != name or 'blurhash' not in variants:
+        return None
+    return {
+        image_format: ', '.join(f'{url(image_format, size)} {size}w' for size, name in sizes)
+        for image_format, sizes in variants['sources'].items()
+    }
+
+
+def placeholder(name, variants):
+    """Размеры и blurhash, чтобы показать заглушку до загрузки изображения"""
+    if not name or variants.get('source') != name or 'blurhash' not in variants:
+        return None
+    return {key: variants[key] for key in ('width', 'height', 'blurhash')}
+
+
+# Вид задачи → (модель, поле файла, поле с описанием копий)
+TARGETS = {
+    'block': (Block, 'file', 'file_variants'),
+    'cover': (Page, 'cover_image', 'cover_variants'),
+}
+
+
+def process_job(job):
+    """Строит копии для объекта задачи; файл, замененный за время работы, не трогается"""
+    model, file_field, variants_field = TARGETS[job.kind]
+    fields = [file_field] + (['file_type'] if job.kind == 'block' else [])
+    row = model.objects.filter(id=job.object_id).values_list(*fields).first()
+    if row is None or not row[0]:
+        return
+    name = row[0]
+    if not is_image(*row):
+        model.objects.filter(id=job.object_id, **{file_field: name}).update(**{variants_field: no_variants(name)})
+        return
+    variants = build_variants(name)
+    updated = model.objects.filter(id=job.object_id, **{file_field: name}).update(**{variants_field: variants})
+    if updated:
+        # Ревизия меняет ETag и ключи кэша, клиенты получают srcset при синхронизации
+        if job.kind == 'block':
+            block = Block.objects.filter(id=job.object_id)
+            Page.bump_revision(block.values('page_id'), block)
+        else:
+            Page.bump_revision([job.object_id])
+
+
+def enqueue_missing(limit):
+    """Ставит в очередь изображения, загруженные до появления копий; возвращает число разобранных файлов.
+
+    Файлы, которые не проходят is_image, в очередь не попадают: им сразу записывается
+    no_variants, иначе воркер находил бы их снова на каждом круге.
+    """
+    queued = MediaJob.objects.values('object_id')
+    blocks = list(
+        Block.objects.filter(block_type='image').exclude(file='').exclude(file__isnull=True)
+        .exclude(file_variants__has_key='source').exclude(id__in=queued.filter(kind='block'))
+        .values_list('id', 'file', 'file_type')[:limit]
+    )
+    covers = list(
+        Page.objects.exclude(cover_image='').exclude(cover_image__isnull=True)
+        .exclude(cover_variants__has_key='source').exclude(id__in=queued.filter(kind='cover'))
+        .values_list('id', 'cover_image')[:limit]
+    )
+    jobs = []
+    for kind, rows in (('block', blocks), ('cover', covers)):
+        model, file_field, variants_field = TARGETS[kind]
+        for object_id, *file in rows:
+            if is_image(*file):
+                jobs.append(MediaJob(kind=kind, object_id=object_id))
+            else:
+                model.objects.filter(id=object_id, **{file_field: file[0]}).update(
+                    **{variants_field: no_variants(file[0])}
+                )
+    MediaJob.objects.bulk_create(jobs, ignore_conflicts=True)
+    return len(blocks) + len(covers)
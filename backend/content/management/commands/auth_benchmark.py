@@ -0,0 +1,55 @@
+import time
+
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+from rest_framework.request import Request
+from rest_framework.test import APIRequestFactory
+from rest_framework_simplejwt.authentication import JWTAuthentication
+from rest_framework_simplejwt.tokens import AccessToken
+
+from content.authentication import CachedJWTAuthentication, forget_user
+from content.management.commands.write_benchmark import quantiles
+
+
+class Command(BaseCommand):
+    help = 'Бенчмарк JWT-аутентификации: пользователь из базы против пользователя из кэша'
+    
+    def add_arguments(self, parser):
+        parser.add_argument('--requests', type=int, default=2000, help='Запросов на вариант')
+    
+    def handle(self, *args, **options):
+        self.stdout.write(
+            f'База: {connection.vendor}, кэш: {settings.CACHES["default"]["BACKEND"].rsplit(".", 1)[-1]}'
+        )
+        user = User.objects.create_user(username=f'auth-benchmark-{int(time.time())}')
+        try:
+            factory = APIRequestFactory()
+            request = factory.get('/api/pages/', HTTP_AUTHORIZATION=f'Bearer {AccessToken.for_user(user)}')
+            results = {}
+            for name, authentication in (
+                ('JWTAuthentication', JWTAuthentication()),
+                ('CachedJWTAuthentication', CachedJWTAuthentication()),
+            ):
+                forget_user(user.id)
+                timings = []
+                with CaptureQueriesContext(connection) as queries:
+                    for _ in range(options['requests']):
+                        started = time.perf_counter()
+                        authentication.authenticate(Request(request))
+                        timings.append((time.perf_counter() - started) * 1000)
+                results[name] = timings
+                self.stdout.write(
+                    f'{name}: {quantiles(timings)}, '
+                    f'запросов к базе: {len(queries) / options["requests"]:.2f} на запрос'
+                )
+            
+            saved = sum(results['JWTAuthentication']) - sum(results['CachedJWTAuthentication'])
+            self.stdout.write(self.style.SUCCESS(
+                f'Экономия: {saved / options["requests"]:.3f} мс на запрос'
+            ))
+        finally:
+            forget_user(user.id)
+            user.delete()
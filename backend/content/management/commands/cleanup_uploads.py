@@ -0,0 +1,35 @@
+from datetime import timedelta
+from pathlib import Path
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from content.models import Upload
+
+
+class Command(BaseCommand):
+    help = 'Удаляет брошенные загрузки по частям и их временные файлы'
+    
+    def add_arguments(self, parser):
+        parser.add_argument('--hours', type=int, default=24, help='Сколько часов загрузка может простаивать')
+    
+    def handle(self, *args, **options):
+        cutoff = timezone.now() - timedelta(hours=options['hours'])
+        stale = list(Upload.objects.filter(updated_at__lt=cutoff))
+        for upload in stale:
+            upload.discard()
+        
+        # Файлы загрузок, удаленных вместе с блоком или страницей
+        orphans = 0
+        temp_dir = Path(settings.UPLOAD_TEMP_DIR)
+        if temp_dir.exists():
+            active = {upload.part_path.name for upload in Upload.objects.only('id')}
+            for path in temp_dir.glob('*.part'):
+                if path.name not in active and path.stat().st_mtime < cutoff.timestamp():
+                    path.unlink(missing_ok=True)
+                    orphans += 1
+        
+        self.stdout.write(self.style.SUCCESS(
+            f'Удалено загрузок: {len(stale)}, временных файлов без загрузки: {orphans}'
+        ))
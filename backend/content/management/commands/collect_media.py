@@ -0,0 +1,106 @@
+import posixpath
+from collections import Counter
+from datetime import timedelta
+
+from django.core.files.storage import default_storage
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from content.models import Page, Block, HistoryEntry, PageSnapshot
+from content.storage import content_storage
+
+# Каталоги медиа, в которых лежат файлы блоков, обложек и их копий
+MEDIA_DIRECTORIES = ('blobs', 'derivatives', 'blocks', 'covers')
+
+
+def walk(storage, directory):
+    """Все файлы каталога хранилища рекурсивно"""
+    if not storage.exists(directory):
+        return
+    directories, files = storage.listdir(directory)
+    for name in files:
+        yield posixpath.join(directory, name)
+    for name in directories:
+        yield from walk(storage, posixpath.join(directory, name))
+
+
+def add_file(references, name, variants):
+    if not name:
+        return
+    references[name] += 1
+    for sizes in (variants or {}).get('sources', {}).values():
+        references.update(variant for size, variant in sizes)
+
+
+def count_references():
+    """Сколько раз на каждый файл ссылаются блоки и страницы (вместе с копиями изображений)"""
+    references = Counter()
+    for model, file_field, variants_field in (
+        (Block, 'file', 'file_variants'),
+        (Page, 'cover_image', 'cover_variants'),
+    ):
+        rows = model.objects.exclude(**{file_field: ''}).exclude(**{f'{file_field}__isnull': True})
+        for name, variants in rows.values_list(file_field, variants_field).iterator():
+            add_file(references, name, variants)
+    return references
+
+
+def history_references():
+    """Файлы блоков из журнала изменений и снимков страниц.
+    
+    Отмена удаления и состояние на момент времени вернут блок с тем же файлом,
+    поэтому такие файлы не удаляются, пока compact_history не удалит записи.
+    """
+    references = Counter()
+    for operations in HistoryEntry.objects.values_list('operations', flat=True).iterator():
+        for operation in operations:
+            for state in (operation.get('before'), operation.get('after')):
+                if state:
+                    add_file(references, state.get('file'), state.get('file_variants'))
+    for blocks in PageSnapshot.objects.values_list('blocks', flat=True).iterator():
+        for state in blocks:
+            add_file(references, state.get('file'), state.get('file_variants'))
+    return references
+
+
+class Command(BaseCommand):
+    help = 'Удаляет файлы медиа, на которые не ссылается ни один блок или страница'
+    
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--hours', type=int, default=24,
+            help='Не трогать файлы моложе (загрузки, еще не привязанные к блоку)'
+        )
+        parser.add_argument('--dry-run', action='store_true', help='Только показать, что будет удалено')
+    
+    def handle(self, *args, **options):
+        cutoff = timezone.now() - timedelta(hours=options['hours'])
+        # Сначала ссылки, потом файлы: файл, созданный между шагами, моложе cutoff
+        references = count_references()
+        kept = history_references()
+        
+        removed, freed = 0, 0
+        for directory in MEDIA_DIRECTORIES:
+            for name in walk(default_storage, directory):
+                if references[name] or kept[name] or default_storage.get_modified_time(name) >= cutoff:
+                    continue
+                freed += default_storage.size(name)
+                removed += 1
+                if options['dry_run']:
+                    self.stdout.write(f'  {name}')
+                else:
+                    default_storage.delete(name)
+        
+        shared = {
+            name: count for name, count in references.items()
+            if count > 1 and name.startswith(f'{content_storage.PREFIX}/') and default_storage.exists(name)
+        }
+        saved = sum((count - 1) * default_storage.size(name) for name, count in shared.items())
+        self.stdout.write(
+            f'Файлов в использовании: {len(references)}, общих: {len(shared)} '
+            f'(экономия {saved / 1024 / 1024:.1f} МБ)'
+        )
+        action = 'К удалению' if options['dry_run'] else 'Удалено'
+        self.stdout.write(self.style.SUCCESS(
+            f'{action}: {removed} файлов, {freed / 1024 / 1024:.1f} МБ'
+        ))
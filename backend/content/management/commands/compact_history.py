@@ -0,0 +1,58 @@
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.db.models import Count, F, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+from django.utils import timezone
+
+from content import history
+from content.models import HistoryEntry, PageSnapshot
+
+
+class Command(BaseCommand):
+    help = 'Снимки страниц с длинным журналом изменений и удаление записей журнала старше срока хранения'
+    
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--every', type=int, default=settings.HISTORY_SNAPSHOT_EVERY,
+            help='Снимок, если после последнего накопилось столько записей'
+        )
+        parser.add_argument(
+            '--days', type=int, default=settings.HISTORY_RETENTION_DAYS,
+            help='Сколько дней хранить записи журнала'
+        )
+    
+    def handle(self, *args, **options):
+        # Записи после последнего снимка страницы, по страницам
+        latest = PageSnapshot.objects.filter(page=OuterRef('page')).order_by('-entry_id').values('entry_id')[:1]
+        pending = (
+            HistoryEntry.objects.annotate(base=Coalesce(Subquery(latest), 0))
+            .filter(id__gt=F('base')).values('page').annotate(count=Count('id'))
+            .filter(count__gte=options['every']).values_list('page', flat=True)
+        )
+        snapshots = 0
+        for page_id in list(pending):
+            with transaction.atomic():
+                history.take_snapshot(page_id)
+            snapshots += 1
+        
+        # Основой остается последний снимок до срока: записи до него и более старые снимки не нужны
+        cutoff = timezone.now() - timedelta(days=options['days'])
+        entries = 0
+        stale_pages = HistoryEntry.objects.filter(created_at__lt=cutoff).values_list('page', flat=True).order_by().distinct()
+        for page_id in list(stale_pages):
+            base = (
+                PageSnapshot.objects.filter(page_id=page_id, created_at__lte=cutoff)
+                .order_by('-entry_id', '-id').first()
+            )
+            if base is None:
+                continue
+            with transaction.atomic():
+                entries += HistoryEntry.objects.filter(page_id=page_id, id__lte=base.entry_id).delete()[0]
+                PageSnapshot.objects.filter(page_id=page_id, entry_id__lte=base.entry_id).exclude(id=base.id).delete()
+        
+        self.stdout.write(self.style.SUCCESS(
+            f'Новых снимков: {snapshots}, удалено записей журнала: {entries}'
+        ))
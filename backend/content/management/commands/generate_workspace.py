@@ -0,0 +1,51 @@
+import time
+
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+
+from content.synthetic import WorkspaceGenerator
+
+
+class Command(BaseCommand):
+    help = 'Генерирует пользователей, деревья страниц, блоки, комментарии и медиа для нагрузочных проверок'
+    
+    def add_arguments(self, parser):
+        parser.add_argument('--users', type=int, default=100)
+        parser.add_argument('--pages-per-user', type=int, default=20)
+        parser.add_argument('--depth', type=int, default=4, help='Максимальная глубина дерева страниц')
+        parser.add_argument('--blocks', type=int, default=1_000_000, help='Всего блоков')
+        parser.add_argument('--nested-rate', type=float, default=0.15, help='Вероятность вложенного блока')
+        parser.add_argument('--comment-rate', type=float, default=0.05, help='Доля блоков с комментариями')
+        parser.add_argument('--batch-size', type=int, default=5000)
+        parser.add_argument('--seed', type=int, default=42)
+        parser.add_argument('--prefix', default='synthetic', help='Префикс имен пользователей')
+        parser.add_argument('--delete', action='store_true', help='Удалить ранее сгенерированные данные с этим префиксом')
+    
+    def handle(self, *args, **options):
+        users = User.objects.filter(username__startswith=f'{options["prefix"]}-')
+        if options['delete']:
+            count = users.count()
+            users.delete()
+            self.stdout.write(self.style.SUCCESS(f'Удалено пользователей с их данными: {count}'))
+            return
+        if users.exists():
+            raise CommandError(f'Данные с префиксом {options["prefix"]} уже есть: --delete или другой --prefix')
+        
+        generator = WorkspaceGenerator(
+            prefix=options['prefix'], seed=options['seed'], batch_size=options['batch_size'],
+            nested_rate=options['nested_rate'], comment_rate=options['comment_rate'],
+            progress=lambda message: self.stdout.write(f'\r{message}', ending=''),
+        )
+        started = time.perf_counter()
+        users = generator.users(options['users'])
+        pages = generator.page_trees(users, options['pages_per_user'], options['depth'])
+        self.stdout.write(f'Пользователей: {len(users)}, страниц: {len(pages)} ({time.perf_counter() - started:.1f} с)')
+        
+        blocks_started = time.perf_counter()
+        created = generator.fill_blocks(generator.block_counts(pages, options['blocks']))
+        elapsed = time.perf_counter() - blocks_started
+        self.stdout.write('')
+        self.stdout.write(self.style.SUCCESS(
+            f'Блоков: {created} за {elapsed:.1f} с ({created / max(elapsed, 1e-9):.0f}/с), '
+            f'всего {time.perf_counter() - started:.1f} с'
+        ))
@@ -0,0 +1,63 @@
+import io
+import time
+
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand
+from rest_framework.parsers import JSONParser
+from rest_framework.renderers import JSONRenderer
+from rest_framework.request import Request
+from rest_framework.test import APIRequestFactory
+
+from content.management.commands.write_benchmark import quantiles
+from content.models import Page, Block
+from content.renderers import FastJSONParser, FastJSONRenderer, orjson
+from content.serializers import BlockSerializer, block_list_data
+from content.synthetic import WorkspaceGenerator
+
+
+class Command(BaseCommand):
+    help = 'Бенчмарк списка блоков: сериализация, рендеринг и разбор JSON, DRF против быстрого пути'
+    
+    def add_arguments(self, parser):
+        parser.add_argument('--blocks', type=int, default=10_000)
+        parser.add_argument('--repeat', type=int, default=10, help='Повторов на вариант')
+        parser.add_argument('--seed', type=int, default=42)
+        parser.add_argument('--keep', action='store_true', help='Не удалять созданные данные')
+    
+    def handle(self, *args, **options):
+        if orjson is None:
+            self.stdout.write(self.style.WARNING('orjson не установлен: быстрые классы работают через json'))
+        user = User.objects.create_user(username=f'json-benchmark-{int(time.time())}')
+        try:
+            page = Page.objects.create(title='Большая страница', owner=user)
+            generator = WorkspaceGenerator(prefix=user.username, seed=options['seed'], comment_rate=0.05)
+            generator.fill_blocks([(page, options['blocks'])])
+            
+            request = Request(APIRequestFactory().get('/api/blocks/', HTTP_HOST='localhost'))
+            request.user = user
+            context = {'request': request}
+            blocks = Block.objects.filter(page=page).order_by('order', 'created_at')
+            data = block_list_data(blocks, context)
+            content = JSONRenderer().render(data)
+            self.stdout.write(f'Блоков: {len(data)}, ответ: {len(content) / 1024:.0f} КБ')
+            
+            variants = {
+                'BlockSerializer': lambda: BlockSerializer(
+                    blocks.prefetch_related('comments'), many=True, context=context
+                ).data,
+                'block_list_data': lambda: block_list_data(blocks, context),
+                'JSONRenderer': lambda: JSONRenderer().render(data),
+                'FastJSONRenderer': lambda: FastJSONRenderer().render(data),
+                'JSONParser': lambda: JSONParser().parse(io.BytesIO(content)),
+                'FastJSONParser': lambda: FastJSONParser().parse(io.BytesIO(content)),
+            }
+            for name, run in variants.items():
+                timings = []
+                for _ in range(options['repeat']):
+                    started = time.perf_counter()
+                    run()
+                    timings.append((time.perf_counter() - started) * 1000)
+                self.stdout.write(f'{name:>16}: {quantiles(timings)}')
+        finally:
+            if not options['keep']:
+                user.delete()
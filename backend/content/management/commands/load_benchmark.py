@@ -0,0 +1,247 @@
+import http.client
+import json
+import random
+import re
+import secrets
+import statistics
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import urlsplit
+
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+from django.test import Client
+from django.test.utils import CaptureQueriesContext
+from rest_framework_simplejwt.tokens import AccessToken
+
+from content.management.commands.write_benchmark import quantiles
+from content.models import Page, Block
+from content.synthetic import WorkspaceGenerator
+
+SERVER_TIMING_QUERIES = re.compile(r'desc="(\d+) queries"')
+
+
+class InProcessClient:
+    """Запросы через django.test.Client в этом процессе; SQL считается напрямую"""
+    
+    concurrency_safe = False
+    
+    def __init__(self, token):
+        self.client = Client(HTTP_HOST='localhost', HTTP_AUTHORIZATION=f'Bearer {token}')
+    
+    def request(self, method, path, body=None):
+        with CaptureQueriesContext(connection) as queries:
+            started = time.perf_counter()
+            response = self.client.generic(
+                method, path, json.dumps(body) if body is not None else '', content_type='application/json'
+            )
+            elapsed = (time.perf_counter() - started) * 1000
+        return response.status_code, elapsed, len(queries), len(response.content)
+
+
+class HttpClient:
+    """Запросы к запущенному серверу; соединение keep-alive на поток.
+    
+    Число SQL берется из Server-Timing, если на сервере включен PROFILING=1.
+    """
+    
+    concurrency_safe = True
+    
+    def __init__(self, url, token):
+        parts = urlsplit(url)
+        self.connection_class = http.client.HTTPSConnection if parts.scheme == 'https' else http.client.HTTPConnection
+        self.netloc = parts.netloc
+        self.prefix = parts.path.rstrip('/')
+        self.headers = {'Authorization': f'Bearer {token}', 'Content-Type': 'application/json'}
+        self.local = threading.local()
+    
+    def request(self, method, path, body=None):
+        if getattr(self.local, 'connection', None) is None:
+            self.local.connection = self.connection_class(self.netloc, timeout=60)
+        started = time.perf_counter()
+        try:
+            self.local.connection.request(
+                method, self.prefix + path, json.dumps(body) if body is not None else None, self.headers
+            )
+            response = self.local.connection.getresponse()
+            content = response.read()
+        except (http.client.HTTPException, OSError):
+            self.local.connection.close()
+            self.local.connection = None
+            raise
+        elapsed = (time.perf_counter() - started) * 1000
+        match = SERVER_TIMING_QUERIES.search(response.getheader('Server-Timing', ''))
+        return response.status, elapsed, int(match.group(1)) if match else None, len(content)
+
+
+class Command(BaseCommand):
+    help = 'Нагрузочный бенчмарк API: заполняет базу и измеряет p50/p95/p99, пропускную способность и SQL'
+    
+    SCENARIOS = ('pages', 'blocks', 'reorder', 'duplicate', 'public_page', 'public_blocks')
+    
+    def add_arguments(self, parser):
+        parser.add_argument('--url', help='Адрес запущенного сервера (http://127.0.0.1:8000); без него — в процессе')
+        parser.add_argument('--scenarios', nargs='+', choices=self.SCENARIOS, default=list(self.SCENARIOS))
+        parser.add_argument('--requests', type=int, default=100, help='Запросов на сценарий')
+        parser.add_argument('--concurrency', type=int, default=8, help='Параллельных клиентов (только с --url)')
+        parser.add_argument('--users', type=int, default=1000, help='Пользователей с небольшими страницами')
+        parser.add_argument('--depth', type=int, default=5, help='Глубина дерева страниц')
+        parser.add_argument('--fanout', type=int, default=3, help='Подстраниц у каждой страницы дерева')
+        parser.add_argument('--blocks', type=int, default=10_000, help='Блоков на большой странице')
+        parser.add_argument('--seed', type=int, default=42)
+        parser.add_argument('--save', help='Сохранить результаты в JSON')
+        parser.add_argument('--compare', help='JSON прошлого запуска: ошибка, если p95 вырос больше допустимого')
+        parser.add_argument('--max-regression', type=float, default=20, help='Допустимый рост p95, %%')
+        parser.add_argument('--keep', action='store_true', help='Не удалять созданные данные')
+    
+    def handle(self, *args, **options):
+        rng = random.Random(options['seed'])
+        prefix = f'load-benchmark-{int(time.time())}'
+        started = time.perf_counter()
+        try:
+            data = self.seed(prefix, options)
+            self.stdout.write(f'Заполнение: {time.perf_counter() - started:.1f} с')
+            token = str(AccessToken.for_user(data['user']))
+            if options['url']:
+                client = HttpClient(options['url'], token)
+            else:
+                client = InProcessClient(token)
+            
+            results = {}
+            for name in options['scenarios']:
+                results[name] = self.run(client, self.scenario(name, data, rng), options)
+                self.report(name, results[name])
+        finally:
+            if not options['keep']:
+                self.stdout.write('Удаление тестовых данных...')
+                User.objects.filter(username__startswith=prefix).delete()
+        
+        if options['save']:
+            with open(options['save'], 'w') as output:
+                json.dump(results, output, indent=2)
+        if options['compare']:
+            self.compare(results, options['compare'], options['max_regression'])
+    
+    def seed(self, prefix, options):
+        """Пользователи, глубокое дерево страниц, большая страница с комментариями и медиа"""
+        generator = WorkspaceGenerator(prefix=prefix, seed=options['seed'])
+        # По странице с парой десятков блоков у каждого пользователя: таблицы не пустые
+        others = generator.users(options['users'])
+        pages = generator.page_trees(others, per_user=1, depth=1)
+        generator.fill_blocks([(page, 20) for page in pages])
+        
+        user = User.objects.create_user(username=f'{prefix}-owner')
+        with transaction.atomic():
+            # Дерево страниц владельца: fanout ** depth страниц на нижнем уровне
+            level = generator.create_pages([
+                Page(title=generator.words(3), owner=user) for _ in range(options['fanout'])
+            ])
+            for _ in range(options['depth'] - 1):
+                level = generator.create_pages([
+                    Page(title=generator.words(3), owner=user, parent=parent)
+                    for parent in level for _ in range(options['fanout'])
+                ])
+            big, medium = generator.create_pages([
+                Page(title='Большая страница', owner=user, is_public=True, share_token=secrets.token_urlsafe(24)[:32]),
+                Page(title='Средняя страница', owner=user),
+            ])
+        generator.fill_blocks([(big, options['blocks']), (medium, 200)])
+        
+        return {
+            'user': user,
+            'big': big,
+            'medium': medium,
+            'medium_blocks': list(Block.objects.filter(page=medium).values_list('id', flat=True)),
+        }
+    
+    def scenario(self, name, data, rng):
+        """Функция, возвращающая (метод, путь, тело) очередного запроса"""
+        big, medium = data['big'], data['medium']
+        if name == 'pages':
+            return lambda: ('GET', '/api/pages/', None)
+        if name == 'blocks':
+            return lambda: ('GET', f'/api/blocks/?page={big.id}', None)
+        if name == 'reorder':
+            def reorder():
+                moved = rng.sample(data['medium_blocks'], 20)
+                orders = [{'id': block_id, 'order': rng.randint(1, 200) * Block.ORDER_GAP} for block_id in moved]
+                return 'POST', '/api/blocks/reorder/', {'page': medium.id, 'blocks': orders}
+            return reorder
+        if name == 'duplicate':
+            return lambda: ('POST', f'/api/pages/{medium.id}/duplicate/', None)
+        if name == 'public_page':
+            return lambda: ('GET', f'/api/public/share/{big.share_token}/', None)
+        return lambda: ('GET', f'/api/public/share/{big.share_token}/blocks/', None)
+    
+    def run(self, client, next_request, options):
+        """Замкнутый цикл: каждый клиент отправляет следующий запрос сразу после ответа"""
+        total = options['requests']
+        concurrency = options['concurrency'] if client.concurrency_safe else 1
+        lock = threading.Lock()
+        sent = 0
+        timings, queries, sizes, errors = [], [], [], 0
+        
+        def worker():
+            nonlocal sent, errors
+            while True:
+                with lock:
+                    if sent >= total:
+                        return
+                    sent += 1
+                    method, path, body = next_request()
+                try:
+                    status_code, elapsed, query_count, size = client.request(method, path, body)
+                except (http.client.HTTPException, OSError):
+                    status_code, elapsed, query_count, size = None, None, None, 0
+                with lock:
+                    if status_code is None or status_code >= 400:
+                        errors += 1
+                        continue
+                    timings.append(elapsed)
+                    sizes.append(size)
+                    if query_count is not None:
+                        queries.append(query_count)
+        
+        started = time.perf_counter()
+        with ThreadPoolExecutor(concurrency) as executor:
+            for future in [executor.submit(worker) for _ in range(concurrency)]:
+                future.result()
+        elapsed = time.perf_counter() - started
+        
+        result = {
+            'requests': total,
+            'errors': errors,
+            'throughput': len(timings) / elapsed,
+            'queries': sum(queries) / len(queries) if queries else None,
+            'bytes': sum(sizes) / len(sizes) if sizes else 0,
+        }
+        if len(timings) >= 2:
+            values = statistics.quantiles(timings, n=100)
+            result.update(p50=values[49], p95=values[94], p99=values[98])
+        result['summary'] = quantiles(timings)
+        return result
+    
+    def report(self, name, result):
+        queries = f'{result["queries"]:.1f}' if result['queries'] is not None else '—'
+        style = self.style.SUCCESS if not result['errors'] else self.style.ERROR
+        self.stdout.write(style(
+            f'{name:>14}: {result["summary"]}, {result["throughput"]:.1f} запр/с, '
+            f'SQL: {queries}, ответ: {result["bytes"] / 1024:.1f} КБ, ошибок: {result["errors"]}'
+        ))
+    
+    def compare(self, results, path, max_regression):
+        """Сравнение p95 с прошлым запуском"""
+        with open(path) as baseline_file:
+            baseline = json.load(baseline_file)
+        regressions = []
+        for name, result in results.items():
+            before = baseline.get(name, {}).get('p95')
+            if before and result.get('p95'):
+                change = (result['p95'] - before) / before * 100
+                self.stdout.write(f'{name:>14}: p95 {before:.1f} → {result["p95"]:.1f} мс ({change:+.0f}%)')
+                if change > max_regression:
+                    regressions.append(f'{name} ({change:+.0f}%)')
+        if regressions:
+            raise CommandError(f'p95 вырос больше чем на {max_regression:g}%: {", ".join(regressions)}')
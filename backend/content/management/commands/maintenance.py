@@ -0,0 +1,34 @@
+import time
+
+from django.conf import settings
+from django.core.management import call_command
+from django.core.management.base import BaseCommand
+from django.db import close_old_connections
+
+# Команды обслуживания по порядку: сначала журнал и отметки, затем файлы —
+# collect_media не удаляет файлы, на которые еще ссылается журнал
+TASKS = ['compact_history', 'prune_deleted_blocks', 'cleanup_uploads', 'collect_media']
+
+
+class Command(BaseCommand):
+    help = 'Периодическое обслуживание: снимки и очистка журнала, отметки удалений, брошенные загрузки, ненужные файлы'
+    
+    def add_arguments(self, parser):
+        parser.add_argument('--once', action='store_true', help='Выполнить все задачи один раз и завершиться')
+        parser.add_argument(
+            '--interval', type=float, default=settings.MAINTENANCE_INTERVAL,
+            help='Пауза между запусками (с)'
+        )
+    
+    def handle(self, *args, **options):
+        while True:
+            for task in TASKS:
+                try:
+                    call_command(task, stdout=self.stdout, stderr=self.stderr)
+                except Exception as error:
+                    # Ошибка одной задачи не останавливает остальные
+                    self.stderr.write(f'{task}: {error}')
+            if options['once']:
+                break
+            close_old_connections()
+            time.sleep(options['interval'])
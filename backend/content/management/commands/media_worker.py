@@ -0,0 +1,46 @@
+import time
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand
+from django.db import close_old_connections
+from django.utils import timezone
+
+from content.images import enqueue_missing, process_job
+from content.models import MediaJob
+
+
+class Command(BaseCommand):
+    help = 'Фоновый воркер: уменьшенные копии изображений блоков и обложек'
+    
+    def add_arguments(self, parser):
+        parser.add_argument('--once', action='store_true', help='Разобрать очередь и завершиться')
+        parser.add_argument('--batch-size', type=int, default=10)
+        parser.add_argument('--sleep', type=float, default=2, help='Пауза, когда очередь пуста (с)')
+    
+    def handle(self, *args, **options):
+        # Задачи воркера, упавшего посреди обработки, возвращаются в очередь
+        MediaJob.objects.filter(
+            status='running', updated_at__lt=timezone.now() - timedelta(minutes=10)
+        ).update(status='pending')
+        
+        while True:
+            jobs = MediaJob.claim(options['batch_size'])
+            for job in jobs:
+                try:
+                    process_job(job)
+                except Exception as error:
+                    job.fail(error)
+                    self.stderr.write(f'{job}: {error}')
+                else:
+                    job.delete()
+            if jobs:
+                self.stdout.write(f'Обработано задач: {len(jobs)}')
+                continue
+            # Очередь пуста — понемногу добираем изображения, загруженные раньше
+            if enqueue_missing(options['batch_size']):
+                continue
+            if options['once']:
+                break
+            # Как после запроса: закрыть соединение, если оно устарело или сломано
+            close_old_connections()
+            time.sleep(options['sleep'])
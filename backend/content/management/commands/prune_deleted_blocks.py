@@ -0,0 +1,34 @@
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.db.models import Max
+from django.db.models.functions import Greatest
+from django.utils import timezone
+
+from content.models import Page, DeletedBlock
+
+
+class Command(BaseCommand):
+    help = 'Удаляет отметки об удаленных блоках старше срока хранения'
+    
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--days', type=int, default=settings.DELETED_BLOCKS_RETENTION_DAYS,
+            help='Сколько дней хранить отметки'
+        )
+    
+    def handle(self, *args, **options):
+        cutoff = timezone.now() - timedelta(days=options['days'])
+        stale = list(
+            DeletedBlock.objects.filter(deleted_at__lt=cutoff)
+            .values('page').annotate(last=Max('revision')).values_list('page', 'last')
+        )
+        removed = 0
+        for page_id, revision in stale:
+            # Сначала граница, потом удаление: /sync не увидит страницу без отметок и без границы
+            with transaction.atomic():
+                Page.objects.filter(id=page_id).update(pruned_revision=Greatest('pruned_revision', revision))
+                removed += DeletedBlock.objects.filter(page_id=page_id, revision__lte=revision).delete()[0]
+        self.stdout.write(self.style.SUCCESS(f'Удалено отметок: {removed}, страниц: {len(stale)}'))
@@ -0,0 +1,69 @@
+import random
+import statistics
+import time
+
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from content.models import Page, Block
+from content.search import search
+from content.synthetic import WORDS
+
+
+class Command(BaseCommand):
+    help = 'Бенчмарк полнотекстового поиска: создает блоки и измеряет время запросов'
+    
+    def add_arguments(self, parser):
+        parser.add_argument('--blocks', type=int, default=1_000_000, help='Количество блоков')
+        parser.add_argument('--pages', type=int, default=1000, help='Количество страниц')
+        parser.add_argument('--batch-size', type=int, default=5000)
+        parser.add_argument('--queries', type=int, default=200, help='Количество поисковых запросов')
+        parser.add_argument('--seed', type=int, default=42)
+        parser.add_argument('--keep', action='store_true', help='Не удалять созданные данные')
+    
+    def handle(self, *args, **options):
+        rng = random.Random(options['seed'])
+        user = User.objects.create_user(username=f'search-benchmark-{int(time.time())}')
+        try:
+            self.seed(user, rng, options)
+            self.measure(user, rng, options['queries'])
+        finally:
+            if not options['keep']:
+                self.stdout.write('Удаление тестовых данных...')
+                user.delete()
+    
+    def seed(self, user, rng, options):
+        pages = Page.objects.bulk_create([
+            Page(title=' '.join(rng.choices(WORDS, k=3)), owner=user) for _ in range(options['pages'])
+        ])
+        started = time.perf_counter()
+        created = 0
+        while created < options['blocks']:
+            size = min(options['batch_size'], options['blocks'] - created)
+            with transaction.atomic():
+                Block.objects.bulk_create([
+                    Block(
+                        page=rng.choice(pages),
+                        content=' '.join(rng.choices(WORDS, k=rng.randint(5, 25))),
+                        order=created + i,
+                    )
+                    for i in range(size)
+                ])
+            created += size
+            self.stdout.write(f'\rБлоков: {created}/{options["blocks"]}', ending='')
+        self.stdout.write(f'\nЗаполнение (с обновлением индекса): {time.perf_counter() - started:.1f} с')
+    
+    def measure(self, user, rng, queries):
+        timings = []
+        for _ in range(queries):
+            query = ' '.join(rng.sample(WORDS, k=rng.randint(1, 2)))
+            started = time.perf_counter()
+            search(user, query)
+            timings.append((time.perf_counter() - started) * 1000)
+        timings.sort()
+        quantiles = statistics.quantiles(timings, n=100)
+        self.stdout.write(self.style.SUCCESS(
+            f'Запросов: {queries}, p50={quantiles[49]:.1f} мс, '
+            f'p95={quantiles[94]:.1f} мс, p99={quantiles[98]:.1f} мс, max={timings[-1]:.1f} мс'
+        ))
@@ -0,0 +1,105 @@
+import random
+import time
+
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand
+from django.db import connection, transaction
+from django.test.utils import CaptureQueriesContext
+from rest_framework.renderers import JSONRenderer
+from rest_framework.request import Request
+from rest_framework.test import APIRequestFactory
+from rest_framework_simplejwt.tokens import AccessToken
+
+from content.management.commands.load_benchmark import InProcessClient
+from content.management.commands.write_benchmark import quantiles
+from content.models import Page, Block
+from content.serializers import BlockSerializer
+
+
+class Command(BaseCommand):
+    help = 'Бенчмарк дерева блоков: ?tree=1 против плоского списка и загрузки по уровням вложенности'
+    
+    def add_arguments(self, parser):
+        parser.add_argument('--blocks', type=int, default=10_000)
+        parser.add_argument('--depth', type=int, default=50, help='Максимальная глубина вложенности')
+        parser.add_argument('--repeat', type=int, default=10, help='Запросов на вариант')
+        parser.add_argument('--seed', type=int, default=42)
+        parser.add_argument('--keep', action='store_true', help='Не удалять созданные данные')
+    
+    def handle(self, *args, **options):
+        user = User.objects.create_user(username=f'tree-benchmark-{int(time.time())}')
+        try:
+            page = Page.objects.create(title='Глубоко вложенные блоки', owner=user)
+            depth = self.fill(page, options)
+            self.stdout.write(f'Блоков: {options["blocks"]}, глубина: {depth}')
+            
+            client = InProcessClient(str(AccessToken.for_user(user)))
+            variants = {
+                'плоский список': lambda: client.request('GET', f'/api/blocks/?page={page.id}'),
+                '?tree=1': lambda: client.request('GET', f'/api/blocks/?page={page.id}&tree=1'),
+                'по уровням': lambda: self.by_levels(page, user),
+            }
+            for name, run in variants.items():
+                timings = []
+                for _ in range(options['repeat']):
+                    status_code, elapsed, queries, size = run()
+                    timings.append(elapsed)
+                self.stdout.write(
+                    f'{name:>15}: {quantiles(timings)}, SQL: {queries}, ответ: {size / 1024:.0f} КБ'
+                )
+        finally:
+            if not options['keep']:
+                user.delete()
+    
+    def fill(self, page, options):
+        """Случайное дерево: чаще всего блок вкладывается в предыдущий, поэтому ветки глубокие"""
+        rng = random.Random(options['seed'])
+        depths, parents = [], []
+        for index in range(options['blocks']):
+            choice = rng.random()
+            if index == 0 or choice < 0.05:
+                parent = None
+            elif choice < 0.9 and depths[index - 1] < options['depth'] - 1:
+                parent = index - 1
+            else:
+                parent = rng.randrange(index)
+                while depths[parent] >= options['depth'] - 1:
+                    parent = parents[parent]
+            parents.append(parent)
+            depths.append(0 if parent is None else depths[parent] + 1)
+        
+        # Уровень за уровнем: вложенным блокам нужны id родителей
+        blocks = [
+            Block(page=page, content=f'Блок {index}', block_type='list', order=(index + 1) * Block.ORDER_GAP)
+            for index in range(options['blocks'])
+        ]
+        with transaction.atomic():
+            for level in range(max(depths) + 1):
+                created = [index for index, block_depth in enumerate(depths) if block_depth == level]
+                for index in created:
+                    if parents[index] is not None:
+                        blocks[index].parent_id = blocks[parents[index]].id
+                Block.objects.bulk_create([blocks[index] for index in created])
+        return max(depths) + 1
+    
+    def by_levels(self, page, user):
+        """Рекурсивная загрузка: корни, затем дети каждого уровня отдельным запросом"""
+        request = Request(APIRequestFactory().get('/api/blocks/'))
+        request.user = user
+        queryset = Block.objects.filter(page=page).prefetch_related('comments')
+        with CaptureQueriesContext(connection) as queries:
+            started = time.perf_counter()
+            tree = BlockSerializer(queryset.filter(parent=None), many=True, context={'request': request}).data
+            level = {node['id']: node for node in tree}
+            while level:
+                children = BlockSerializer(
+                    queryset.filter(parent_id__in=list(level)), many=True, context={'request': request}
+                ).data
+                for node in level.values():
+                    node['children'] = []
+                for node in children:
+                    level[node['parent']]['children'].append(node)
+                level = {node['id']: node for node in children}
+            content = JSONRenderer().render(tree)
+            elapsed = (time.perf_counter() - started) * 1000
+        return 200, elapsed, len(queries), len(content)
@@ -0,0 +1,115 @@
+import statistics
+import threading
+import time
+
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand
+from django.db import connection, transaction, OperationalError
+
+from content.models import Page, Block
+
+
+def quantiles(timings):
+    """p50/p95/p99 в миллисекундах"""
+    if len(timings) < 2:
+        return '—'
+    values = statistics.quantiles(timings, n=100)
+    return f'p50={values[49]:.1f} мс, p95={values[94]:.1f} мс, p99={values[98]:.1f} мс'
+
+
+class Command(BaseCommand):
+    help = 'Бенчмарк параллельной записи блоков: сравнивает один поток с несколькими'
+    
+    def add_arguments(self, parser):
+        parser.add_argument('--threads', type=int, default=8, help='Количество пишущих потоков')
+        parser.add_argument('--writes', type=int, default=200, help='Записей на поток')
+        parser.add_argument('--readers', type=int, default=2, help='Читающих потоков во время записи')
+        parser.add_argument('--keep', action='store_true', help='Не удалять созданные данные')
+    
+    def handle(self, *args, **options):
+        if connection.vendor == 'sqlite' and connection.is_in_memory_db():
+            self.stderr.write('Нужна файловая или серверная база: потоки не видят общую базу в памяти')
+            return
+        self.stdout.write(
+            f'База: {connection.vendor} ({connection.settings_dict["ENGINE"]}), '
+            f'CONN_MAX_AGE={connection.settings_dict["CONN_MAX_AGE"]}'
+        )
+        user = User.objects.create_user(username=f'write-benchmark-{int(time.time())}')
+        try:
+            pages = [
+                Page.objects.create(title=f'Бенчмарк {index}', owner=user)
+                for index in range(options['threads'])
+            ]
+            serial = self.run(pages[:1], options['writes'], readers=0)
+            parallel = self.run(pages, options['writes'], readers=options['readers'])
+            
+            self.stdout.write(
+                f'1 поток: {serial["rate"]:.0f} записей/с, {quantiles(serial["writes"])}'
+            )
+            self.stdout.write(
+                f'{len(pages)} потоков: {parallel["rate"]:.0f} записей/с, {quantiles(parallel["writes"])}'
+            )
+            if options['readers']:
+                self.stdout.write(f'Чтение во время записи: {quantiles(parallel["reads"])}')
+            style = self.style.SUCCESS if not parallel['errors'] else self.style.ERROR
+            self.stdout.write(style(
+                f'Ускорение: x{parallel["rate"] / serial["rate"]:.2f}, '
+                f'ошибок блокировки: {serial["errors"] + parallel["errors"]}'
+            ))
+        finally:
+            if not options['keep']:
+                self.stdout.write('Удаление тестовых данных...')
+                user.delete()
+    
+    def run(self, pages, writes, readers):
+        """Запускает по потоку записи на страницу и читателей, пока идет запись"""
+        result = {'writes': [], 'reads': [], 'errors': 0}
+        lock = threading.Lock()
+        writing = threading.Event()
+        start = threading.Barrier(len(pages) + readers + 1)
+        
+        def writer(page):
+            timings, errors = [], 0
+            start.wait()
+            for index in range(writes):
+                started = time.perf_counter()
+                try:
+                    with transaction.atomic():
+                        block = Block.objects.create(page=page, content=f'Блок {index}', order=index)
+                        block.content = f'Блок {index} (изменен)'
+                        block.save(update_fields=['content', 'updated_at'])
+                except OperationalError:
+                    errors += 1
+                    continue
+                timings.append((time.perf_counter() - started) * 1000)
+            connection.close()
+            with lock:
+                result['writes'].extend(timings)
+                result['errors'] += errors
+        
+        def reader(page):
+            timings = []
+            start.wait()
+            while writing.is_set():
+                started = time.perf_counter()
+                list(Block.objects.filter(page=page).values('id', 'content')[:100])
+                timings.append((time.perf_counter() - started) * 1000)
+            connection.close()
+            with lock:
+                result['reads'].extend(timings)
+        
+        writers = [threading.Thread(target=writer, args=(page,)) for page in pages]
+        readers = [threading.Thread(target=reader, args=(pages[index % len(pages)],)) for index in range(readers)]
+        writing.set()
+        for thread in writers + readers:
+            thread.start()
+        start.wait()
+        started = time.perf_counter()
+        for thread in writers:
+            thread.join()
+        elapsed = time.perf_counter() - started
+        writing.clear()
+        for thread in readers:
+            thread.join()
+        result['rate'] = len(result['writes']) / elapsed
+        return result
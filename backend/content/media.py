@@ -0,0 +1,75 @@
+"""Защищенная раздача медиа блоков и обложек.
+
+Права проверяет Django (владелец страницы или токен публичной ссылки),
+а сами байты отдает nginx по X-Accel-Redirect: sendfile, Range для видео и аудио,
+ETag и Last-Modified — без участия воркера приложения.
+"""
+import hashlib
+import mimetypes
+import posixpath
+from urllib.parse import quote, urlencode
+
+from django.conf import settings
+from django.core.files.storage import default_storage
+from django.http import FileResponse, HttpResponse
+from django.urls import reverse
+from django.utils.http import content_disposition_header
+
+from .authentication import CachedJWTAuthentication
+
+# Открываются в браузере, остальное скачивается
+INLINE_TYPES = ('image/', 'video/', 'audio/')
+
+
+class QueryTokenAuthentication(CachedJWTAuthentication):
+    """JWT из ?token=: <img> и <video> не умеют передавать заголовок Authorization"""
+    
+    def authenticate(self, request):
+        raw_token = request.query_params.get('token')
+        if not raw_token:
+            return None
+        validated_token = self.get_validated_token(raw_token)
+        return self.get_user(validated_token), validated_token
+
+
+def version(name):
+    """Короткий отпечаток имени файла: URL меняется вместе с файлом, старый можно кэшировать навсегда"""
+    return hashlib.sha256(name.encode()).hexdigest()[:12]
+
+
+def media_url(kind, object_id, name, request=None, share_token=None, image_format=None, width=None):
+    """URL защищенного файла объекта; для публичной страницы — с токеном ссылки"""
+    if image_format:
+        url = reverse('media_variant', args=[kind, object_id, image_format, width])
+    else:
+        url = reverse('media_file', args=[kind, object_id])
+    query = {'v': version(name)}
+    if share_token:
+        query['share'] = share_token
+    url = f'{url}?{urlencode(query)}'
+    return request.build_absolute_uri(url) if request else url
+
+
+def serve(request, name, content_type='', file_name='', as_attachment=None):
+    """Ответ с файлом хранилища: X-Accel-Redirect за nginx, иначе (разработка) сам файл"""
+    content_type = content_type or mimetypes.guess_type(name)[0] or 'application/octet-stream'
+    file_name = file_name or posixpath.basename(name)
+    if as_attachment is None:
+        as_attachment = not content_type.startswith(INLINE_TYPES)
+
+    if settings.MEDIA_ACCEL_REDIRECT:
+        response = HttpResponse(content_type=content_type)
+        response['X-Accel-Redirect'] = settings.MEDIA_ACCEL_REDIRECT + quote(name)
+        response['Content-Disposition'] = content_disposition_header(as_attachment, file_name)
+    else:
+        response = FileResponse(
+            default_storage.open(name, 'rb'), content_type=content_type,
+            as_attachment=as_attachment, filename=file_name
+        )
+
+    # С актуальной версией в URL содержимое по этому адресу уже не изменится
+    if request.GET.get('v') == version(name):
+        response['Cache-Control'] = 'private, max-age=31536000, immutable'
+    else:
+        response['Cache-Control'] = 'private, no-cache'
+    return response
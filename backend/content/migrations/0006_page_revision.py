@@ -0,0 +1,23 @@
+# Generated by Django 5.0.1 on 2026-10-17 20:08
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('content', '0005_page_background_color'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='page',
+            name='revised_at',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='page',
+            name='revision',
+            field=models.PositiveBigIntegerField(default=0),
+        ),
+    ]
@@ -0,0 +1,41 @@
+# Generated by Django 5.0.1 on 2026-10-17 20:11
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('content', '0006_page_revision'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DeletedBlock',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('block_id', models.BigIntegerField()),
+                ('revision', models.PositiveBigIntegerField()),
+                ('deleted_at', models.DateTimeField(auto_now_add=True)),
+            ],
+        ),
+        migrations.AddField(
+            model_name='block',
+            name='revision',
+            field=models.PositiveBigIntegerField(default=0),
+        ),
+        migrations.AddIndex(
+            model_name='block',
+            index=models.Index(fields=['page', 'revision'], name='content_blo_page_id_f9464c_idx'),
+        ),
+        migrations.AddField(
+            model_name='deletedblock',
+            name='page',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='deleted_blocks', to='content.page'),
+        ),
+        migrations.AddIndex(
+            model_name='deletedblock',
+            index=models.Index(fields=['page', 'revision'], name='content_del_page_id_5eef43_idx'),
+        ),
+    ]
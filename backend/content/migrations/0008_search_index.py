@@ -0,0 +1,22 @@
+from django.db import migrations
+
+from content.search import install_search_schema, drop_search_schema
+
+
+def create_search_index(apps, schema_editor):
+    install_search_schema(schema_editor.connection, rebuild=True)
+
+
+def remove_search_index(apps, schema_editor):
+    drop_search_schema(schema_editor.connection)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('content', '0007_block_sync'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_search_index, remove_search_index),
+    ]
@@ -0,0 +1,32 @@
+# Generated by Django 5.0.1 on 2026-10-17 20:18
+
+from django.db import migrations, models
+
+
+def fill_page_paths(apps, schema_editor):
+    """Заполняет пути существующих страниц уровень за уровнем от корней"""
+    Page = apps.get_model('content', 'Page')
+    parent_paths = {None: ''}
+    level = list(Page.objects.filter(parent__isnull=True))
+    while level:
+        for page in level:
+            page.path = f'{parent_paths[page.parent_id]}{page.id}/'
+            parent_paths[page.id] = page.path
+        Page.objects.bulk_update(level, ['path'], batch_size=500)
+        level = list(Page.objects.filter(parent_id__in=[page.id for page in level]))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('content', '0008_search_index'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='page',
+            name='path',
+            field=models.CharField(blank=True, db_index=True, default='', max_length=1024),
+        ),
+        migrations.RunPython(fill_page_paths, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,48 @@
+# Generated by Django 5.0.1 on 2026-10-17 20:21
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('content', '0009_page_path'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    # Сначала составные индексы, потом удаление перекрытых ими индексов по FK
+    operations = [
+        migrations.AddIndex(
+            model_name='block',
+            index=models.Index(fields=['page', 'order', 'created_at'], name='content_block_page_order_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='comment',
+            index=models.Index(fields=['block', 'created_at'], name='content_comment_block_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='page',
+            index=models.Index(fields=['owner', '-updated_at', '-id'], name='content_page_owner_recent_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='page',
+            index=models.Index(condition=models.Q(('is_public', True)), fields=['share_token'], name='content_page_public_idx'),
+        ),
+        migrations.AlterField(
+            model_name='block',
+            name='page',
+            field=models.ForeignKey(db_index=False, on_delete=django.db.models.deletion.CASCADE, related_name='blocks', to='content.page'),
+        ),
+        migrations.AlterField(
+            model_name='comment',
+            name='block',
+            field=models.ForeignKey(db_index=False, on_delete=django.db.models.deletion.CASCADE, related_name='comments', to='content.block'),
+        ),
+        migrations.AlterField(
+            model_name='page',
+            name='owner',
+            field=models.ForeignKey(blank=True, db_index=False, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='pages', to=settings.AUTH_USER_MODEL),
+        ),
+    ]
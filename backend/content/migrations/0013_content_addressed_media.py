@@ -0,0 +1,42 @@
+# Generated by Django 5.0.1 on 2026-10-17 20:33
+
+import posixpath
+
+import content.storage
+from django.db import migrations, models
+
+
+def fill_file_names(apps, schema_editor):
+    """Исходное имя для уже загруженных файлов — последняя часть пути"""
+    Block = apps.get_model('content', 'Block')
+    blocks = []
+    for block in Block.objects.exclude(file='').exclude(file__isnull=True).only('id', 'file').iterator():
+        block.file_name = posixpath.basename(block.file.name)
+        blocks.append(block)
+    Block.objects.bulk_update(blocks, ['file_name'], batch_size=500)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('content', '0012_image_variants'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='block',
+            name='file_name',
+            field=models.CharField(blank=True, max_length=255),
+        ),
+        migrations.AlterField(
+            model_name='block',
+            name='file',
+            field=models.FileField(blank=True, null=True, storage=content.storage.media_storage, upload_to='blocks/%Y/%m/%d/'),
+        ),
+        migrations.AlterField(
+            model_name='page',
+            name='cover_image',
+            field=models.ImageField(blank=True, null=True, storage=content.storage.media_storage, upload_to='covers/'),
+        ),
+        migrations.RunPython(fill_file_names, migrations.RunPython.noop),
+    ]
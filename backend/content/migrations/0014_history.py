@@ -0,0 +1,47 @@
+# Generated by Django 5.0.1 on 2026-10-17 20:51
+
+import django.db.models.deletion
+import django.utils.timezone
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('content', '0013_content_addressed_media'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='HistoryEntry',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('action', models.CharField(choices=[('edit', 'Изменение'), ('undo', 'Отмена'), ('redo', 'Повтор')], default='edit', max_length=10)),
+                ('operations', models.JSONField(default=list)),
+                ('undone', models.BooleanField(default=False)),
+                ('undone_by', models.BigIntegerField(blank=True, null=True)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('page', models.ForeignKey(db_index=False, on_delete=django.db.models.deletion.CASCADE, related_name='history', to='content.page')),
+                ('user', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'ordering': ['id'],
+                'indexes': [models.Index(fields=['page', 'id'], name='content_history_page_idx'), models.Index(fields=['page', 'created_at'], name='content_history_time_idx')],
+            },
+        ),
+        migrations.CreateModel(
+            name='PageSnapshot',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('entry_id', models.BigIntegerField(default=0)),
+                ('blocks', models.JSONField(default=list)),
+                ('created_at', models.DateTimeField(default=django.utils.timezone.now)),
+                ('page', models.ForeignKey(db_index=False, on_delete=django.db.models.deletion.CASCADE, related_name='snapshots', to='content.page')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['page', 'entry_id'], name='content_snapshot_page_idx')],
+            },
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.0.1 on 2026-10-17 21:24
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('content', '0014_history'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='page',
+            name='pruned_revision',
+            field=models.PositiveBigIntegerField(default=0),
+        ),
+    ]
@@ -1,24 +1,95 @@
-from django.db import models
+from pathlib import Path
+
+from django.conf import settings
+from django.core.files import File
+from django.db import models, transaction
+from django.db.models import F, OuterRef, Q, Subquery, Value
+from django.db.models.functions import Concat, Substr
 from django.contrib.auth.models import User
+from django.utils import timezone
+import hashlib
 import secrets
 
+from .storage import media_storage
+
 
 class Page(models.Model):
     """Модель страницы (аналог страницы в Notion)"""
     title = models.CharField(max_length=255, default='Без названия', blank=True)
     icon = models.CharField(max_length=50, null=True, blank=True)  # Эмодзи или иконка
     background_color = models.CharField(max_length=7, null=True, blank=True)  # HEX цвет фона (например, #FF0000)
-    cover_image = models.ImageField(upload_to='covers/', null=True, blank=True)
-    owner = models.ForeignKey(User, on_delete=models.CASCADE, related_name='pages', null=True, blank=True)
+    cover_image = models.ImageField(upload_to='covers/', storage=media_storage, null=True, blank=True)
+    # Уменьшенные копии обложки (см. content/images.py)
+    cover_variants = models.JSONField(default=dict, blank=True)
+    
+    # Отдельный индекс по owner не нужен: его покрывает составной индекс (owner, -updated_at, -id)
+    owner = models.ForeignKey(User, on_delete=models.CASCADE, related_name='pages', null=True, blank=True, db_index=False)
     
     # Настройки шаринга
     is_public = models.BooleanField(default=False)
     share_token = models.CharField(max_length=32, unique=True, null=True, blank=True)
     
+    # Ревизия содержимого: растет при любом изменении страницы, ее блоков и комментариев
+    revision = models.PositiveBigIntegerField(default=0)
+    revised_at = models.DateTimeField(null=True, blank=True)
+    # Отметки DeletedBlock до этой ревизии удалены (prune_deleted_blocks): клиенту с since
+    # меньше нее /sync отдает страницу целиком
+    pruned_revision = models.PositiveBigIntegerField(default=0)
+    
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
     parent = models.ForeignKey('self', on_delete=models.CASCADE, null=True, blank=True, related_name='children')
     
+    # Материализованный путь от корня: "1/5/9/" — поддерево выбирается одним запросом по префиксу
+    path = models.CharField(max_length=1024, db_index=True, blank=True, default='')
+    
+    @classmethod
+    def bump_revision(cls, page_ids, blocks=None):
+        """Увеличивает ревизию страниц (page_ids — список или подзапрос).
+        
+        Блоки из QuerySet blocks получают новую ревизию своей страницы,
+        по ней клиенты забирают изменения через синхронизацию.
+        """
+        with transaction.atomic(savepoint=False):
+            updated = cls.objects.filter(id__in=page_ids).update(
+                revision=F('revision') + 1,
+                revised_at=timezone.now(),
+            )
+            if blocks is not None:
+                blocks.update(revision=Subquery(
+                    cls.objects.filter(id=OuterRef('page_id')).order_by().values('revision')[:1]
+                ))
+        return updated
+    
+    @property
+    def last_modified(self):
+        """Время последнего изменения страницы или ее содержимого"""
+        if self.revised_at and self.revised_at > self.updated_at:
+            return self.revised_at
+        return self.updated_at
+    
+    @property
+    def ancestor_ids(self):
+        """id предков от корня к родителю (по материализованному пути)"""
+        return [int(segment) for segment in self.path.split('/')[:-2]]
+    
+    def is_descendant_of(self, page):
+        """Страница лежит в поддереве page (включая саму page)"""
+        return bool(page.path) and self.path.startswith(page.path)
+    
+    def move_to(self, parent):
+        """Переносит страницу со всем поддеревом под parent одним UPDATE путей"""
+        if parent is not None and parent.is_descendant_of(self):
+            raise ValueError("Нельзя переместить страницу внутрь ее собственного поддерева")
+        new_path = f"{parent.path if parent else ''}{self.id}/"
+        if self.path:
+            Page.objects.filter(path__startswith=self.path).update(
+                path=Concat(Value(new_path), Substr('path', len(self.path) + 1))
+            )
+        else:
+            Page.objects.filter(id=self.id).update(path=new_path)
+        self.path = new_path
+    
     def generate_share_token(self):
         """Генерация уникального токена для шаринга"""
         if not self.share_token:
@@ -26,15 +97,98 @@ class Page(models.Model):
             self.save()
         return self.share_token
     
+    def duplicate(self, owner=None, include_children=False):
+        """Копия страницы (с include_children — всего поддерева) вместе с блоками и комментариями.
+        
+        Число запросов не зависит от количества блоков. Файлы не копируются:
+        копии ссылаются на те же файлы, а новая загрузка сохраняется под новым именем.
+        """
+        pages = [self]
+        if include_children:
+            # Поддерево одним запросом; родители идут раньше детей
+            descendants = Page.objects.filter(owner=self.owner, path__startswith=self.path).exclude(id=self.id)
+            pages.extend(sorted(descendants, key=lambda page: page.path.count('/')))
+        
+        page_copies = [
+            Page(
+                title=page.title,
+                icon=page.icon,
+                background_color=page.background_color,
+                cover_image=page.cover_image.name,
+                cover_variants=page.cover_variants,
+                owner=owner or page.owner,
+                parent_id=page.parent_id,
+            )
+            for page in pages
+        ]
+        page_copies[0].title = f"{self.title} (копия)"
+        Page.objects.bulk_create(page_copies)
+        page_map = {page.id: copy for page, copy in zip(pages, page_copies)}
+        parent_path = self.path[:-len(f'{self.id}/')] if self.path else ''
+        page_copies[0].path = f'{parent_path}{page_copies[0].id}/'
+        for copy in page_copies[1:]:
+            parent_copy = page_map[copy.parent_id]
+            copy.parent_id = parent_copy.id
+            copy.path = f'{parent_copy.path}{copy.id}/'
+        Page.objects.bulk_update(page_copies, ['parent', 'path'])
+        
+        blocks = list(Block.objects.filter(page_id__in=page_map).order_by('id'))
+        block_copies = [
+            Block(
+                page=page_map[block.page_id],
+                block_type=block.block_type,
+                content=block.content,
+                format=block.format,
+                file=block.file.name,
+                file_name=block.file_name,
+                file_type=block.file_type,
+                file_size=block.file_size,
+                file_variants=block.file_variants,
+                checked=block.checked,
+                order=block.order,
+            )
+            for block in blocks
+        ]
+        Block.objects.bulk_create(block_copies)
+        block_map = {block.id: copy.id for block, copy in zip(blocks, block_copies)}
+        
+        nested = []
+        for block, copy in zip(blocks, block_copies):
+            if block.parent_id in block_map:
+                copy.parent_id = block_map[block.parent_id]
+                nested.append(copy)
+        Block.objects.bulk_update(nested, ['parent'])
+        
+        Comment.objects.bulk_create([
+            Comment(block_id=block_map[comment.block_id], content=comment.content)
+            for comment in Comment.objects.filter(block__page_id__in=page_map)
+        ])
+        return page_copies[0]
+    
     def save(self, *args, **kwargs):
         # Если title пустой, устанавливаем дефолтное значение ТОЛЬКО при создании новой страницы
         # При обновлении разрешаем пустое значение, чтобы пользователь мог стереть заголовок полностью
         if self.pk is None and (not self.title or self.title.strip() == ''):
             self.title = 'Без названия'
-        super().save(*args, **kwargs)
+        # Путь пересчитываем только при создании или смене родителя
+        path_parent_id = self.ancestor_ids[-1] if self.ancestor_ids else None
+        moved = not self.path or path_parent_id != self.parent_id
+        # Цикл проверяется до записи: иначе новый parent сохранился бы со старым путем
+        if moved and self.path and self.parent is not None and self.parent.is_descendant_of(self):
+            raise ValueError("Нельзя переместить страницу внутрь ее собственного поддерева")
+        with transaction.atomic():
+            super().save(*args, **kwargs)
+            if moved:
+                self.move_to(self.parent)
     
     class Meta:
         ordering = ['-updated_at']
+        indexes = [
+            # Список страниц пользователя и курсорная пагинация по (-updated_at, -id)
+            models.Index(fields=['owner', '-updated_at', '-id'], name='content_page_owner_recent_idx'),
+            # Публичные ссылки: в индекс попадают только опубликованные страницы
+            models.Index(fields=['share_token'], condition=Q(is_public=True), name='content_page_public_idx'),
+        ]
     
     def __str__(self):
         return self.title
@@ -58,7 +212,11 @@ class Block(models.Model):
         ('divider', 'Разделитель'),
     )
     
-    page = models.ForeignKey(Page, on_delete=models.CASCADE, related_name='blocks')
+    # Шаг между соседними блоками: перемещение блока меняет одну строку, пока есть зазор
+    ORDER_GAP = 1024
+    
+    # Индекс по page покрывают составные индексы из Meta
+    page = models.ForeignKey(Page, on_delete=models.CASCADE, related_name='blocks', db_index=False)
     block_type = models.CharField(max_length=20, choices=BLOCK_TYPES, default='text')
     content = models.TextField(blank=True, default='')
     
@@ -66,9 +224,13 @@ class Block(models.Model):
     format = models.JSONField(default=dict, blank=True)
     
     # Для медиа-файлов
-    file = models.FileField(upload_to='blocks/%Y/%m/%d/', null=True, blank=True)
+    # Хранилище по содержимому: одинаковые файлы хранятся один раз (см. content/storage.py)
+    file = models.FileField(upload_to='blocks/%Y/%m/%d/', storage=media_storage, null=True, blank=True)
+    file_name = models.CharField(max_length=255, blank=True)  # исходное имя файла для скачивания
     file_type = models.CharField(max_length=50, blank=True)
     file_size = models.IntegerField(null=True, blank=True)
+    # Уменьшенные копии изображения: {source, width, height, blurhash, sources: {формат: [[ширина, имя], ...]}}
+    file_variants = models.JSONField(default=dict, blank=True)
     
     # Для чекбоксов
     checked = models.BooleanField(default=False)
@@ -79,25 +241,254 @@ class Block(models.Model):
     # Вложенность (для списков и т.д.)
     parent = models.ForeignKey('self', on_delete=models.CASCADE, null=True, blank=True, related_name='children')
     
+    # Ревизия страницы на момент последнего изменения блока
+    revision = models.PositiveBigIntegerField(default=0)
+    
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
     
     class Meta:
         ordering = ['order', 'created_at']
+        indexes = [
+            models.Index(fields=['page', 'revision']),
+            # Блоки страницы сразу в порядке вывода, без сортировки
+            models.Index(fields=['page', 'order', 'created_at'], name='content_block_page_order_idx'),
+        ]
     
     def __str__(self):
         return f"{self.block_type} - {self.content[:50]}"
 
 
+class DeletedBlock(models.Model):
+    """Отметка об удаленном блоке, чтобы клиенты узнали об удалении при синхронизации.
+    
+    Хранится DELETED_BLOCKS_RETENTION_DAYS дней (manage.py prune_deleted_blocks).
+    """
+    page = models.ForeignKey(Page, on_delete=models.CASCADE, related_name='deleted_blocks')
+    block_id = models.BigIntegerField()
+    revision = models.PositiveBigIntegerField()
+    deleted_at = models.DateTimeField(auto_now_add=True)
+    
+    class Meta:
+        indexes = [
+            models.Index(fields=['page', 'revision']),
+        ]
+    
+    def __str__(self):
+        return f"Удаленный блок {self.block_id}"
+
+
+class HistoryEntry(models.Model):
+    """Запись журнала изменений блоков страницы: операции одного запроса (см. content/history.py)"""
+    
+    ACTIONS = (
+        ('edit', 'Изменение'),
+        ('undo', 'Отмена'),
+        ('redo', 'Повтор'),
+    )
+    
+    page = models.ForeignKey(Page, on_delete=models.CASCADE, related_name='history', db_index=False)
+    user = models.ForeignKey(User, on_delete=models.SET_NULL, null=True, blank=True, related_name='+')
+    action = models.CharField(max_length=10, choices=ACTIONS, default='edit')
+    # [{op: insert|update|move|delete, id, before, after}]; update и move хранят только изменившиеся поля
+    operations = models.JSONField(default=list)
+    undone = models.BooleanField(default=False)
+    # Запись отмены; после повтора сбрасывается, и запись больше не попадает в стек повтора
+    undone_by = models.BigIntegerField(null=True, blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    
+    class Meta:
+        ordering = ['id']
+        indexes = [
+            models.Index(fields=['page', 'id'], name='content_history_page_idx'),
+            models.Index(fields=['page', 'created_at'], name='content_history_time_idx'),
+        ]
+    
+    def __str__(self):
+        return f"{self.get_action_display()} на странице {self.page_id}: {len(self.operations)} операций"
+
+
+class PageSnapshot(models.Model):
+    """Состояние блоков страницы после записи журнала entry_id (0 — до первой записи)"""
+    page = models.ForeignKey(Page, on_delete=models.CASCADE, related_name='snapshots', db_index=False)
+    entry_id = models.BigIntegerField(default=0)
+    blocks = models.JSONField(default=list)
+    # С какого момента действует состояние
+    created_at = models.DateTimeField(default=timezone.now)
+    
+    class Meta:
+        indexes = [
+            models.Index(fields=['page', 'entry_id'], name='content_snapshot_page_idx'),
+        ]
+    
+    def __str__(self):
+        return f"Снимок страницы {self.page_id} после записи {self.entry_id}"
+
+
 class Comment(models.Model):
     """Модель комментариев к блокам"""
-    block = models.ForeignKey(Block, on_delete=models.CASCADE, related_name='comments')
+    block = models.ForeignKey(Block, on_delete=models.CASCADE, related_name='comments', db_index=False)
     content = models.TextField()
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
     
     class Meta:
         ordering = ['created_at']
+        indexes = [
+            # Комментарии блоков (prefetch по block_id IN (...)) в порядке создания
+            models.Index(fields=['block', 'created_at'], name='content_comment_block_idx'),
+        ]
     
     def __str__(self):
         return f"Комментарий: {self.content[:50]}"
+
+
+class MediaJob(models.Model):
+    """Задача фоновой обработки изображения: очередь в базе, ее разбирает manage.py media_worker"""
+    
+    KINDS = (
+        ('block', 'Файл блока'),
+        ('cover', 'Обложка страницы'),
+    )
+    STATUSES = (
+        ('pending', 'В очереди'),
+        ('running', 'Выполняется'),
+        ('failed', 'Ошибка'),
+    )
+    MAX_ATTEMPTS = 3
+    
+    kind = models.CharField(max_length=10, choices=KINDS)
+    object_id = models.BigIntegerField()
+    status = models.CharField(max_length=10, choices=STATUSES, default='pending')
+    attempts = models.PositiveSmallIntegerField(default=0)
+    error = models.TextField(blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+    
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['kind', 'object_id'], name='content_mediajob_unique'),
+        ]
+        indexes = [
+            models.Index(fields=['status', 'id'], name='content_mediajob_queue_idx'),
+        ]
+    
+    @classmethod
+    def enqueue(cls, kind, object_id):
+        """Ставит объект в очередь (повторная постановка сбрасывает ошибки)"""
+        cls.objects.update_or_create(
+            kind=kind, object_id=object_id,
+            defaults={'status': 'pending', 'attempts': 0, 'error': ''}
+        )
+    
+    @classmethod
+    def claim(cls, limit):
+        """Забирает задачи из очереди; параллельные воркеры пропускают занятые строки"""
+        with transaction.atomic():
+            jobs = list(
+                cls.objects.select_for_update(skip_locked=True)
+                .filter(status='pending').order_by('id')[:limit]
+            )
+            cls.objects.filter(id__in=[job.id for job in jobs]).update(status='running', updated_at=timezone.now())
+        return jobs
+    
+    def fail(self, error):
+        self.attempts += 1
+        self.status = 'failed' if self.attempts >= self.MAX_ATTEMPTS else 'pending'
+        self.error = str(error)
+        self.save()
+    
+    def __str__(self):
+        return f"{self.get_kind_display()} {self.object_id}: {self.get_status_display()}"
+
+
+class PartFile(File):
+    """Собранный файл загрузки: FileSystemStorage перемещает его на место, а не копирует"""
+    
+    def temporary_file_path(self):
+        return self.file.name
+
+
+class Upload(models.Model):
+    """Загрузка файла блока по частям с возможностью продолжить после обрыва"""
+    
+    # Размер порции чтения тела запроса и файла с диска
+    READ_SIZE = 64 * 1024
+    
+    owner = models.ForeignKey(User, on_delete=models.CASCADE, related_name='uploads')
+    block = models.ForeignKey(Block, on_delete=models.CASCADE, related_name='uploads')
+    file_name = models.CharField(max_length=255)
+    content_type = models.CharField(max_length=100, blank=True)
+    size = models.PositiveBigIntegerField()
+    received = models.PositiveBigIntegerField(default=0)
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+    
+    @property
+    def part_path(self):
+        return Path(settings.UPLOAD_TEMP_DIR) / f'{self.id}.part'
+    
+    def append(self, stream, offset, length, checksum=None):
+        """Пишет часть из потока запроса с позиции offset, не держа ее в памяти.
+        
+        Возвращает новую позицию или None, если другой запрос уже сдвинул ее.
+        """
+        if offset + length > self.size:
+            raise ValueError("Часть выходит за пределы файла")
+        self.part_path.parent.mkdir(parents=True, exist_ok=True)
+        digest = hashlib.sha256()
+        written = 0
+        with open(self.part_path, 'r+b' if self.part_path.exists() else 'wb') as part:
+            part.seek(offset)
+            while written < length:
+                data = stream.read(min(self.READ_SIZE, length - written))
+                if not data:
+                    break
+                part.write(data)
+                digest.update(data)
+                written += len(data)
+            part.truncate()
+        if written != length:
+            raise ValueError("Получено меньше данных, чем указано в Content-Length")
+        if checksum and digest.hexdigest() != checksum.lower():
+            raise ValueError("Контрольная сумма части не совпадает")
+        # Позиция сдвигается, только если за время записи ее никто не изменил
+        moved = Upload.objects.filter(id=self.id, received=offset).update(
+            received=offset + written, updated_at=timezone.now()
+        )
+        if not moved:
+            return None
+        self.received = offset + written
+        return self.received
+    
+    def checksum(self):
+        """SHA-256 собранного файла, читается с диска порциями"""
+        digest = hashlib.sha256()
+        with open(self.part_path, 'rb') as part:
+            for data in iter(lambda: part.read(self.READ_SIZE), b''):
+                digest.update(data)
+        return digest.hexdigest()
+    
+    def complete(self, checksum=None):
+        """Переносит собранный файл в блок и удаляет загрузку, возвращает блок"""
+        if self.received != self.size:
+            raise ValueError("Файл загружен не полностью")
+        if checksum and self.checksum() != checksum.lower():
+            raise ValueError("Контрольная сумма файла не совпадает")
+        block = self.block
+        with open(self.part_path, 'rb') as part:
+            block.file.save(self.file_name, PartFile(part), save=False)
+        block.file_name = self.file_name
+        block.file_type = self.content_type
+        block.file_size = self.size
+        block.save()
+        self.discard()
+        return block
+    
+    def discard(self):
+        """Удаляет загрузку вместе с временным файлом"""
+        self.part_path.unlink(missing_ok=True)
+        self.delete()
+    
+    def __str__(self):
+        return f"Загрузка {self.file_name} ({self.received}/{self.size})"
@@ -0,0 +1,138 @@
+import json
+from datetime import datetime
+from itertools import islice
+
+from asgiref.sync import sync_to_async
+from django.core.handlers.asgi import ASGIRequest
+from django.db.models import Q
+from django.http import StreamingHttpResponse
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import Cursor, CursorPagination
+
+from .renderers import dumps
+
+
+class KeysetCursorPagination(CursorPagination):
+    """CursorPagination с позицией по всем полям ordering.
+    
+    Курсор DRF хранит только первое поле ordering и смещение, поэтому среди
+    многих строк с одинаковым значением (блоки с равным order) следующая
+    страница — OFFSET по ним. Здесь курсор хранит значения всех полей крайней
+    строки, а следующая страница — сравнение кортежей (a > x OR a = x AND b > y ...),
+    которое идет по составному индексу. Поля ordering не должны быть NULL,
+    последнее — уникальным.
+    """
+    invalid_cursor_message = 'Неверный курсор'
+    
+    def paginate_queryset(self, queryset, request, view=None):
+        self.page_size = self.get_page_size(request)
+        if not self.page_size:
+            return None
+        
+        self.base_url = request.build_absolute_uri()
+        self.ordering = self.get_ordering(request, queryset, view)
+        self.cursor = self.decode_cursor(request)
+        position, reverse = (None, False) if self.cursor is None else (self.cursor.position, self.cursor.reverse)
+        
+        ordering = [field[1:] if field.startswith('-') else f'-{field}' for field in self.ordering] \
+            if reverse else list(self.ordering)
+        queryset = queryset.order_by(*ordering)
+        if position is not None:
+            queryset = queryset.filter(self.after(ordering, position))
+        results = list(queryset[:self.page_size + 1])
+        has_following = len(results) > self.page_size
+        self.page = results[:self.page_size]
+        if reverse:
+            self.page.reverse()
+        
+        self.has_next, self.has_previous = (position is not None, has_following) if reverse \
+            else (has_following, position is not None)
+        if self.page:
+            self.next_position, self.previous_position = self.position(self.page[-1]), self.position(self.page[0])
+        else:
+            # Пустая страница: ссылки ведут обратно к позиции курсора
+            self.next_position = self.previous_position = position
+        return self.page
+    
+    def after(self, ordering, position):
+        """Строки после position в порядке ordering"""
+        condition = Q()
+        for index, field in enumerate(ordering):
+            name = field.lstrip('-')
+            step = Q(**{f'{name}__lt' if field.startswith('-') else f'{name}__gt': position[index]})
+            for previous, value in zip(ordering[:index], position):
+                step &= Q(**{previous.lstrip('-'): value})
+            condition |= step
+        return condition
+    
+    def position(self, instance):
+        return [
+            value.isoformat() if isinstance(value, datetime) else value
+            for value in (getattr(instance, field.lstrip('-')) for field in self.ordering)
+        ]
+    
+    def decode_cursor(self, request):
+        cursor = super().decode_cursor(request)
+        if cursor is None or cursor.position is None:
+            return cursor
+        try:
+            position = json.loads(cursor.position)
+        except ValueError:
+            raise NotFound(self.invalid_cursor_message)
+        if not isinstance(position, list) or len(position) != len(self.ordering):
+            raise NotFound(self.invalid_cursor_message)
+        return Cursor(offset=0, reverse=cursor.reverse, position=position)
+    
+    def link(self, position, reverse):
+        if position is None:
+            return None
+        return self.encode_cursor(Cursor(offset=0, reverse=reverse, position=json.dumps(position)))
+    
+    def get_next_link(self):
+        return self.link(self.next_position, False) if self.has_next else None
+    
+    def get_previous_link(self):
+        return self.link(self.previous_position, True) if self.has_previous else None
+
+
+class BlockCursorPagination(KeysetCursorPagination):
+    """Курсорная пагинация блоков в порядке (order, created_at, id)"""
+    ordering = ('order', 'created_at', 'id')
+    page_size = 500
+    page_size_query_param = 'page_size'
+    max_page_size = 5000
+
+
+class PageCursorPagination(KeysetCursorPagination):
+    """Курсорная пагинация страниц от недавно измененных"""
+    ordering = ('-updated_at', '-id')
+    page_size = 500
+    page_size_query_param = 'page_size'
+    max_page_size = 5000
+
+
+def ndjson_response(request, queryset, serialize, chunk_size=500):
+    """Потоковый ответ в формате NDJSON: объекты читаются и сериализуются пачками.
+    
+    serialize(queryset) — данные списка (list_data представления); пачка — та же
+    выборка, ограниченная id очередной порции, поэтому порядок сохраняется.
+    Под ASGI Django читает синхронный итератор ответа целиком в память, поэтому
+    там пачки отдаются асинхронным итератором, каждая — в потоке для ORM.
+    """
+    def chunks():
+        ids = queryset.values_list('pk', flat=True).iterator(chunk_size=chunk_size)
+        while True:
+            chunk = list(islice(ids, chunk_size))
+            if not chunk:
+                break
+            yield b''.join(dumps(item) + b'\n' for item in serialize(queryset.filter(pk__in=chunk)))
+    
+    if isinstance(getattr(request, '_request', request), ASGIRequest):
+        async def stream():
+            iterator = chunks()
+            next_chunk = sync_to_async(next)
+            while (chunk := await next_chunk(iterator, None)) is not None:
+                yield chunk
+        
+        return StreamingHttpResponse(stream(), content_type='application/x-ndjson')
+    return StreamingHttpResponse(chunks(), content_type='application/x-ndjson')
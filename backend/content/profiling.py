@@ -0,0 +1,216 @@
+"""Профилирование запросов: время, SQL, сериализация и размер ответа.
+
+Включается переменной окружения PROFILING=1 и работает без DEBUG: запросы к базе
+считает execute_wrapper, а не connection.queries. Для каждого запроса:
+
+* заголовок Server-Timing (виден во вкладке Network браузера);
+* агрегаты по маршрутам в формате Prometheus на /api/metrics/ (только с адресов
+  PROFILING_METRICS_IPS; метрики свои у каждого процесса, в заголовке ответа — его pid);
+* журнал content.profiling: запрос, попавший в PROFILING_SLOWEST самых медленных
+  (и не быстрее PROFILING_SLOW_MS), записывается вместе со списком SQL.
+"""
+import heapq
+import logging
+import os
+import threading
+import time
+from collections import defaultdict
+from contextlib import ExitStack
+from contextvars import ContextVar
+
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+from django.db import connections
+from django.http import Http404, HttpResponse
+from rest_framework import serializers
+
+logger = logging.getLogger('content.profiling')
+
+# Профиль текущего запроса (None вне запроса или при выключенном профилировании)
+current_profile = ContextVar('current_profile', default=None)
+
+# Границы гистограммы длительности запросов, секунды
+BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5)
+
+
+class Profile:
+    """Измерения одного запроса"""
+    
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.duration = 0.0
+        self.queries = 0
+        self.db_time = 0.0
+        self.serialize_time = 0.0
+        self.sql = []
+    
+    def execute(self, execute, sql, params, many, context):
+        """execute_wrapper: время каждого запроса к базе"""
+        started = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            elapsed = time.perf_counter() - started
+            self.queries += 1
+            self.db_time += elapsed
+            if len(self.sql) < settings.PROFILING_MAX_QUERIES:
+                self.sql.append((elapsed, sql))
+    
+    def server_timing(self):
+        return ', '.join([
+            f'db;dur={self.db_time * 1000:.1f};desc="{self.queries} queries"',
+            f'serialize;dur={self.serialize_time * 1000:.1f}',
+            f'total;dur={self.duration * 1000:.1f}',
+        ])
+
+
+class Metrics:
+    """Агрегаты по маршрутам в памяти процесса и N самых медленных запросов"""
+    
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.reset()
+    
+    def reset(self):
+        with self.lock:
+            self.totals = defaultdict(lambda: defaultdict(float))
+            self.histograms = defaultdict(lambda: [0] * (len(BUCKETS) + 1))
+            self.slowest = []  # куча (длительность, порядковый номер)
+            self.sequence = 0
+    
+    def record(self, labels, profile, status_code, size):
+        """Учитывает запрос; True, если он попал в число самых медленных"""
+        with self.lock:
+            totals = self.totals[labels + (str(status_code),)]
+            totals['requests'] += 1
+            totals['duration'] += profile.duration
+            totals['queries'] += profile.queries
+            totals['db'] += profile.db_time
+            totals['serialize'] += profile.serialize_time
+            totals['bytes'] += size
+            histogram = self.histograms[labels]
+            histogram[sum(1 for bound in BUCKETS if profile.duration > bound)] += 1
+            
+            limit = settings.PROFILING_SLOWEST
+            self.sequence += 1
+            if len(self.slowest) < limit:
+                heapq.heappush(self.slowest, (profile.duration, self.sequence))
+                return True
+            if limit and profile.duration > self.slowest[0][0]:
+                heapq.heapreplace(self.slowest, (profile.duration, self.sequence))
+                return True
+            return False
+    
+    def render(self):
+        """Текстовый формат Prometheus"""
+        lines = []
+        counters = (
+            ('http_requests_total', 'requests', 'Количество запросов'),
+            ('http_request_duration_seconds_sum', 'duration', 'Суммарное время ответа'),
+            ('http_request_db_queries_total', 'queries', 'Запросов к базе'),
+            ('http_request_db_seconds_total', 'db', 'Время запросов к базе'),
+            ('http_request_serialize_seconds_total', 'serialize', 'Время сериализации'),
+            ('http_response_bytes_total', 'bytes', 'Размер ответов'),
+        )
+        with self.lock:
+            for name, key, description in counters:
+                lines.append(f'# HELP {name} {description}')
+                lines.append(f'# TYPE {name} counter')
+                for (method, view, status_code), totals in sorted(self.totals.items()):
+                    lines.append(
+                        f'{name}{{method="{method}",view="{view}",status="{status_code}"}} {totals[key]:g}'
+                    )
+            name = 'http_request_duration_seconds'
+            lines.append(f'# HELP {name} Время ответа')
+            lines.append(f'# TYPE {name} histogram')
+            for (method, view), histogram in sorted(self.histograms.items()):
+                labels = f'method="{method}",view="{view}"'
+                cumulative = 0
+                for bound, count in zip(BUCKETS + ('+Inf',), histogram):
+                    cumulative += count
+                    lines.append(f'{name}_bucket{{{labels},le="{bound}"}} {cumulative}')
+                lines.append(f'{name}_count{{{labels}}} {cumulative}')
+        return '\n'.join(lines) + '\n'
+
+
+metrics = Metrics()
+
+
+def route_labels(request):
+    """Метод и имя маршрута (page-detail, а не /api/pages/42/): число рядов метрик ограничено"""
+    match = request.resolver_match
+    if match is None:
+        return request.method, 'unmatched'
+    return request.method, (match.view_name or match.func.__name__).replace('"', '')
+
+
+def timed_data(fget):
+    """Обертка свойства Serializer.data: время сериализации верхнего уровня"""
+    if getattr(fget, 'profiled', False):
+        return property(fget)
+    
+    def data(serializer):
+        profile = current_profile.get()
+        if profile is None or getattr(serializer, '_profiling', False):
+            return fget(serializer)
+        started = time.perf_counter()
+        serializer._profiling = True
+        try:
+            return fget(serializer)
+        finally:
+            serializer._profiling = False
+            profile.serialize_time += time.perf_counter() - started
+    data.profiled = True
+    return property(data)
+
+
+def instrument_serializers():
+    """Подключает замер сериализации к DRF (вложенные сериализаторы .data не вызывают)"""
+    for serializer_class in (serializers.Serializer, serializers.ListSerializer):
+        if 'data' in vars(serializer_class):
+            serializer_class.data = timed_data(vars(serializer_class)['data'].fget)
+
+
+class ProfilingMiddleware:
+    """Замеры каждого запроса; при выключенном PROFILING Django пропускает middleware"""
+    
+    def __init__(self, get_response):
+        if not settings.PROFILING_ENABLED:
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+    
+    def __call__(self, request):
+        profile = Profile()
+        token = current_profile.set(profile)
+        try:
+            with ExitStack() as stack:
+                for connection in connections.all():
+                    stack.enter_context(connection.execute_wrapper(profile.execute))
+                response = self.get_response(request)
+        finally:
+            current_profile.reset(token)
+        profile.duration = time.perf_counter() - profile.started
+        
+        size = 0 if response.streaming else len(response.content)
+        response['Server-Timing'] = profile.server_timing()
+        labels = route_labels(request)
+        slowest = metrics.record(labels, profile, response.status_code, size)
+        if slowest and profile.duration * 1000 >= settings.PROFILING_SLOW_MS:
+            logger.warning(
+                'Медленный запрос %s %s: %.1f мс, SQL: %d за %.1f мс, сериализация %.1f мс, %d байт\n%s',
+                request.method, request.get_full_path(), profile.duration * 1000,
+                profile.queries, profile.db_time * 1000, profile.serialize_time * 1000, size,
+                '\n'.join(f'  {elapsed * 1000:.1f} мс  {sql}' for elapsed, sql in profile.sql),
+            )
+        return response
+
+
+def metrics_view(request):
+    """GET /api/metrics/ — метрики Prometheus этого процесса"""
+    if not settings.PROFILING_ENABLED:
+        raise Http404
+    if request.META.get('REMOTE_ADDR') not in settings.PROFILING_METRICS_IPS:
+        raise Http404
+    response = HttpResponse(metrics.render(), content_type='text/plain; version=0.0.4; charset=utf-8')
+    response['X-Process-Id'] = str(os.getpid())
+    return response
@@ -0,0 +1,147 @@
+import asyncio
+import json
+import logging
+import threading
+import time
+from collections import defaultdict
+
+from django.conf import settings
+from django.db import transaction
+from django.utils.module_loading import import_string
+from rest_framework.utils import encoders
+
+from .media import media_url
+
+logger = logging.getLogger(__name__)
+
+# Вместо событий: подписчик отстал или события могли потеряться, клиенту нужно перечитать страницу
+RESYNC = object()
+
+
+class InProcessBroker:
+    """Рассылка событий страниц подписчикам внутри одного процесса.
+
+    Подписчик — asyncio.Queue в цикле событий ASGI-сервера. publish можно
+    вызывать из синхронного кода (обработчики Django работают в потоках).
+    Очередь ограничена REALTIME_QUEUE_SIZE: у медленного клиента она не растет,
+    а заменяется на RESYNC, и соединение закрывается.
+    """
+
+    def __init__(self):
+        self.subscribers = defaultdict(set)
+        self.lock = threading.Lock()
+
+    def subscribe(self, page_id):
+        queue = asyncio.Queue(maxsize=settings.REALTIME_QUEUE_SIZE)
+        with self.lock:
+            self.subscribers[page_id].add((asyncio.get_running_loop(), queue))
+        return queue
+
+    def unsubscribe(self, page_id, queue):
+        with self.lock:
+            subscribers = self.subscribers[page_id]
+            subscribers.difference_update({item for item in subscribers if item[1] is queue})
+            if not subscribers:
+                del self.subscribers[page_id]
+
+    def publish(self, page_id, event):
+        with self.lock:
+            subscribers = list(self.subscribers.get(page_id, ()))
+        for loop, queue in subscribers:
+            loop.call_soon_threadsafe(deliver, queue, event)
+
+    def resync_all(self):
+        """RESYNC всем подписчикам процесса"""
+        with self.lock:
+            subscribers = [item for items in self.subscribers.values() for item in items]
+        for loop, queue in subscribers:
+            loop.call_soon_threadsafe(deliver, queue, RESYNC)
+
+
+class RedisBroker(InProcessBroker):
+    """Рассылка через Redis pub/sub между воркерами (нужен пакет redis).
+
+    События публикуются в Redis, а фоновый поток каждого процесса раздает
+    их локальным подписчикам.
+    """
+    CHANNEL_PREFIX = 'content:page:'
+    MAX_RECONNECT_DELAY = 30
+
+    def __init__(self):
+        super().__init__()
+        import redis
+        self.redis = redis.Redis.from_url(settings.REALTIME_REDIS_URL)
+        self.listener = None
+
+    def subscribe(self, page_id):
+        with self.lock:
+            if self.listener is None:
+                self.listener = threading.Thread(target=self.listen, daemon=True)
+                self.listener.start()
+        return super().subscribe(page_id)
+
+    def publish(self, page_id, event):
+        self.redis.publish(f'{self.CHANNEL_PREFIX}{page_id}', json.dumps(event, cls=encoders.JSONEncoder))
+
+    def listen(self):
+        """Раздача событий из Redis; при обрыве — переподключение с нарастающей паузой"""
+        import redis
+        delay = 0
+        while True:
+            try:
+                pubsub = self.redis.pubsub(ignore_subscribe_messages=True)
+                pubsub.psubscribe(f'{self.CHANNEL_PREFIX}*')
+                if delay:
+                    # События за время обрыва потеряны
+                    self.resync_all()
+                delay = 0
+                for message in pubsub.listen():
+                    page_id = int(message['channel'].decode().rsplit(':', 1)[1])
+                    super().publish(page_id, json.loads(message['data']))
+            except redis.RedisError as error:
+                delay = min(max(delay * 2, 0.5), self.MAX_RECONNECT_DELAY)
+                logger.warning('Redis pub/sub: %s, переподключение через %.1f с', error, delay)
+                time.sleep(delay)
+
+
+def deliver(queue, event):
+    """Кладет событие в очередь подписчика; переполненная очередь заменяется на RESYNC"""
+    try:
+        queue.put_nowait(event)
+    except asyncio.QueueFull:
+        while not queue.empty():
+            queue.get_nowait()
+        queue.put_nowait(RESYNC)
+
+
+broker = None
+
+
+def get_broker():
+    """Брокер из настройки REALTIME_BROKER (создается один раз на процесс)"""
+    global broker
+    if broker is None:
+        broker = import_string(settings.REALTIME_BROKER)()
+    return broker
+
+
+def publish(page_id, event):
+    """Отправляет событие подписчикам страницы после фиксации транзакции"""
+    transaction.on_commit(lambda: get_broker().publish(page_id, event))
+
+
+def block_data(block):
+    """Компактное представление блока для событий"""
+    return {
+        'id': block.id,
+        'page': block.page_id,
+        'block_type': block.block_type,
+        'content': block.content,
+        'format': block.format,
+        # Без токена доступа: клиент добавляет свой (?token= или ?share=)
+        'file': media_url('block', block.id, block.file.name) if block.file else None,
+        'checked': block.checked,
+        'order': block.order,
+        'parent': block.parent_id,
+        'updated_at': block.updated_at,
+    }
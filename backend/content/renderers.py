@@ -0,0 +1,60 @@
+"""JSON через orjson, если пакет установлен, иначе стандартными классами DRF.
+
+Вывод совпадает с JSONRenderer: компактный UTF-8, \\u2028 и \\u2029 экранированы,
+типы, которых orjson не знает (Decimal, ленивые строки, QuerySet...), передаются
+кодировщику DRF. Отступы (application/json; indent=4, Browsable API) — через json.
+"""
+import codecs
+
+from django.conf import settings
+from rest_framework.exceptions import ParseError
+from rest_framework.parsers import JSONParser
+from rest_framework.renderers import JSONRenderer
+from rest_framework.utils import encoders
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+# Даты и время форматирует кодировщик DRF ('Z' вместо '+00:00'), как и без orjson
+ORJSON_OPTIONS = (
+    orjson.OPT_NON_STR_KEYS | orjson.OPT_PASSTHROUGH_DATETIME if orjson is not None else 0
+)
+
+default_encoder = encoders.JSONEncoder()
+
+
+def dumps(data):
+    """JSON в байтах, как у FastJSONRenderer без отступов"""
+    if orjson is None:
+        return JSONRenderer().render(data)
+    content = orjson.dumps(data, default=default_encoder.default, option=ORJSON_OPTIONS)
+    if b'\xe2\x80\xa8' in content or b'\xe2\x80\xa9' in content:
+        content = content.replace(b'\xe2\x80\xa8', b'\\u2028').replace(b'\xe2\x80\xa9', b'\\u2029')
+    return content
+
+
+class FastJSONRenderer(JSONRenderer):
+    """JSONRenderer на orjson"""
+    
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if orjson is None or data is None:
+            return super().render(data, accepted_media_type, renderer_context)
+        if self.get_indent(accepted_media_type, renderer_context or {}) is not None:
+            return super().render(data, accepted_media_type, renderer_context)
+        return dumps(data)
+
+
+class FastJSONParser(JSONParser):
+    """JSONParser на orjson; тело в другой кодировке, чем UTF-8, разбирает json"""
+    renderer_class = FastJSONRenderer
+    
+    def parse(self, stream, media_type=None, parser_context=None):
+        encoding = (parser_context or {}).get('encoding', settings.DEFAULT_CHARSET)
+        if orjson is None or codecs.lookup(encoding).name != 'utf-8':
+            return super().parse(stream, media_type, parser_context)
+        try:
+            return orjson.loads(stream.read())
+        except orjson.JSONDecodeError as exc:
+            raise ParseError('JSON parse error - %s' % str(exc))
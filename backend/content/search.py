@@ -0,0 +1,206 @@
+"""Полнотекстовый поиск по заголовкам страниц и содержимому блоков.
+
+PostgreSQL: функциональные GIN-индексы по to_tsvector, SQLite: таблицы FTS5
+с триггерами. Индексы обновляются самой базой при любой записи, в том числе
+при bulk_create/bulk_update и UPDATE ... CASE.
+"""
+import html
+import re
+
+from django.db import connection, connections
+
+SEARCH_CONFIG = 'russian'
+
+# Маркеры подсветки внутри SQL: текст экранируется после выборки, затем маркеры заменяются на <mark>
+MARK_START = '\x02'
+MARK_STOP = '\x03'
+
+SQLITE_SCHEMA = [
+    """CREATE VIRTUAL TABLE IF NOT EXISTS content_block_fts USING fts5(
+        content, content='content_block', content_rowid='id', tokenize='unicode61 remove_diacritics 2'
+    )""",
+    """CREATE TRIGGER IF NOT EXISTS content_block_fts_insert AFTER INSERT ON content_block BEGIN
+        INSERT INTO content_block_fts(rowid, content) VALUES (new.id, new.content);
+    END""",
+    """CREATE TRIGGER IF NOT EXISTS content_block_fts_delete AFTER DELETE ON content_block BEGIN
+        INSERT INTO content_block_fts(content_block_fts, rowid, content) VALUES ('delete', old.id, old.content);
+    END""",
+    """CREATE TRIGGER IF NOT EXISTS content_block_fts_update AFTER UPDATE OF content ON content_block BEGIN
+        INSERT INTO content_block_fts(content_block_fts, rowid, content) VALUES ('delete', old.id, old.content);
+        INSERT INTO content_block_fts(rowid, content) VALUES (new.id, new.content);
+    END""",
+    """CREATE VIRTUAL TABLE IF NOT EXISTS content_page_fts USING fts5(
+        title, content='content_page', content_rowid='id', tokenize='unicode61 remove_diacritics 2'
+    )""",
+    """CREATE TRIGGER IF NOT EXISTS content_page_fts_insert AFTER INSERT ON content_page BEGIN
+        INSERT INTO content_page_fts(rowid, title) VALUES (new.id, new.title);
+    END""",
+    """CREATE TRIGGER IF NOT EXISTS content_page_fts_delete AFTER DELETE ON content_page BEGIN
+        INSERT INTO content_page_fts(content_page_fts, rowid, title) VALUES ('delete', old.id, old.title);
+    END""",
+    """CREATE TRIGGER IF NOT EXISTS content_page_fts_update AFTER UPDATE OF title ON content_page BEGIN
+        INSERT INTO content_page_fts(content_page_fts, rowid, title) VALUES ('delete', old.id, old.title);
+        INSERT INTO content_page_fts(rowid, title) VALUES (new.id, new.title);
+    END""",
+]
+
+SQLITE_DROP = [
+    'DROP TRIGGER IF EXISTS content_block_fts_insert',
+    'DROP TRIGGER IF EXISTS content_block_fts_delete',
+    'DROP TRIGGER IF EXISTS content_block_fts_update',
+    'DROP TABLE IF EXISTS content_block_fts',
+    'DROP TRIGGER IF EXISTS content_page_fts_insert',
+    'DROP TRIGGER IF EXISTS content_page_fts_delete',
+    'DROP TRIGGER IF EXISTS content_page_fts_update',
+    'DROP TABLE IF EXISTS content_page_fts',
+]
+
+POSTGRES_SCHEMA = [
+    f"CREATE INDEX IF NOT EXISTS content_block_content_fts ON content_block "
+    f"USING gin (to_tsvector('{SEARCH_CONFIG}', content))",
+    f"CREATE INDEX IF NOT EXISTS content_page_title_fts ON content_page "
+    f"USING gin (to_tsvector('{SEARCH_CONFIG}', title))",
+]
+
+POSTGRES_DROP = [
+    'DROP INDEX IF EXISTS content_block_content_fts',
+    'DROP INDEX IF EXISTS content_page_title_fts',
+]
+
+
+def install_search_schema(using=connection, rebuild=False):
+    """Создает поисковые индексы, если их нет (безопасно вызывать повторно).
+
+    На SQLite пересоздание таблицы content_block миграцией удаляет триггеры,
+    поэтому схема проверяется и после каждого migrate.
+    """
+    with using.cursor() as cursor:
+        if using.vendor == 'sqlite':
+            for statement in SQLITE_SCHEMA:
+                cursor.execute(statement)
+            if rebuild:
+                cursor.execute("INSERT INTO content_block_fts(content_block_fts) VALUES ('rebuild')")
+                cursor.execute("INSERT INTO content_page_fts(content_page_fts) VALUES ('rebuild')")
+        elif using.vendor == 'postgresql':
+            for statement in POSTGRES_SCHEMA:
+                cursor.execute(statement)
+
+
+def ensure_search_schema(sender, using, **kwargs):
+    """Обработчик post_migrate: восстанавливает триггеры после пересоздания таблиц"""
+    database = connections[using]
+    if {'content_block', 'content_page'} <= set(database.introspection.table_names()):
+        install_search_schema(database)
+
+
+def drop_search_schema(using=connection):
+    statements = {'sqlite': SQLITE_DROP, 'postgresql': POSTGRES_DROP}.get(using.vendor, [])
+    with using.cursor() as cursor:
+        for statement in statements:
+            cursor.execute(statement)
+
+
+def highlight(text):
+    """Экранирует HTML и превращает маркеры совпадений в <mark>"""
+    return html.escape(text).replace(MARK_START, '<mark>').replace(MARK_STOP, '</mark>')
+
+
+def fts5_query(query):
+    """Запрос FTS5 из пользовательской строки: все слова, каждое как префикс"""
+    words = re.findall(r'\w+', query)
+    return ' '.join(f'"{word}"*' for word in words)
+
+
+def search_sqlite(cursor, owner_id, query, limit):
+    match = fts5_query(query)
+    if not match:
+        return [], []
+    cursor.execute(
+        """SELECT p.id, p.title, p.icon,
+                  highlight(content_page_fts, 0, %s, %s), -bm25(content_page_fts)
+           FROM content_page_fts JOIN content_page p ON p.id = content_page_fts.rowid
+           WHERE content_page_fts MATCH %s AND p.owner_id = %s
+           ORDER BY bm25(content_page_fts) LIMIT %s""",
+        [MARK_START, MARK_STOP, match, owner_id, limit]
+    )
+    pages = cursor.fetchall()
+    cursor.execute(
+        """SELECT b.id, b.page_id, p.title, b.block_type,
+                  snippet(content_block_fts, 0, %s, %s, '…', 16), -bm25(content_block_fts)
+           FROM content_block_fts
+           JOIN content_block b ON b.id = content_block_fts.rowid
+           JOIN content_page p ON p.id = b.page_id
+           WHERE content_block_fts MATCH %s AND p.owner_id = %s
+           ORDER BY bm25(content_block_fts) LIMIT %s""",
+        [MARK_START, MARK_STOP, match, owner_id, limit]
+    )
+    return pages, cursor.fetchall()
+
+
+def search_postgresql(cursor, owner_id, query, limit):
+    options = f'StartSel={MARK_START}, StopSel={MARK_STOP}, MaxWords=24, MinWords=8'
+    cursor.execute(
+        f"""SELECT p.id, p.title, p.icon, ts_headline('{SEARCH_CONFIG}', p.title, q, %s),
+                   ts_rank(to_tsvector('{SEARCH_CONFIG}', p.title), q) AS rank
+            FROM content_page p, websearch_to_tsquery('{SEARCH_CONFIG}', %s) q
+            WHERE to_tsvector('{SEARCH_CONFIG}', p.title) @@ q AND p.owner_id = %s
+            ORDER BY rank DESC LIMIT %s""",
+        [options, query, owner_id, limit]
+    )
+    pages = cursor.fetchall()
+    # ts_headline дорогой, поэтому считаем его только для верхних результатов
+    cursor.execute(
+        f"""SELECT top.id, top.page_id, top.title, top.block_type,
+                   ts_headline('{SEARCH_CONFIG}', top.content, top.q, %s), top.rank
+            FROM (
+                SELECT b.id, b.page_id, p.title, b.block_type, b.content, q,
+                       ts_rank(to_tsvector('{SEARCH_CONFIG}', b.content), q) AS rank
+                FROM content_block b
+                JOIN content_page p ON p.id = b.page_id,
+                websearch_to_tsquery('{SEARCH_CONFIG}', %s) q
+                WHERE to_tsvector('{SEARCH_CONFIG}', b.content) @@ q AND p.owner_id = %s
+                ORDER BY rank DESC LIMIT %s
+            ) top
+            ORDER BY top.rank DESC""",
+        [options, query, owner_id, limit]
+    )
+    return pages, cursor.fetchall()
+
+
+def search_fallback(cursor, owner_id, query, limit):
+    """Для остальных СУБД: подстрочный поиск без ранжирования"""
+    from .models import Page, Block
+
+    pages = Page.objects.filter(owner_id=owner_id, title__icontains=query)[:limit]
+    blocks = Block.objects.filter(
+        page__owner_id=owner_id, content__icontains=query
+    ).select_related('page')[:limit]
+    return (
+        [(page.id, page.title, page.icon, page.title, 0) for page in pages],
+        [(block.id, block.page_id, block.page.title, block.block_type, block.content[:200], 0) for block in blocks],
+    )
+
+
+def search(owner, query, limit=20):
+    """Страницы и блоки пользователя, подходящие под запрос, от более релевантных"""
+    if not query.strip():
+        return {'pages': [], 'blocks': []}
+    backend = {
+        'sqlite': search_sqlite,
+        'postgresql': search_postgresql,
+    }.get(connection.vendor, search_fallback)
+    with connection.cursor() as cursor:
+        pages, blocks = backend(cursor, owner.id, query, limit)
+    return {
+        'pages': [
+            {'id': page_id, 'title': title, 'icon': icon, 'highlight': highlight(marked), 'rank': rank}
+            for page_id, title, icon, marked, rank in pages
+        ],
+        'blocks': [
+            {
+                'id': block_id, 'page': page_id, 'page_title': page_title,
+                'block_type': block_type, 'snippet': highlight(snippet), 'rank': rank,
+            }
+            for block_id, page_id, page_title, block_type, snippet, rank in blocks
+        ],
+    }
@@ -0,0 +1,99 @@
+from django.db.models import QuerySet, Subquery
+from django.db.models.signals import post_save, post_delete
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.dispatch import receiver
+from django.utils import timezone
+from rest_framework_simplejwt.token_blacklist.models import BlacklistedToken
+from .authentication import blacklisted_key, forget_user
+from .models import Page, Block, DeletedBlock, Comment, MediaJob
+from .images import needs_variants
+from . import realtime
+
+
+def deleted_directly(origin, model):
+    """Удаление начато с объекта или QuerySet этой модели, а не каскадом от родителя"""
+    if isinstance(origin, QuerySet):
+        return origin.model is model
+    return isinstance(origin, model)
+
+
+def is_first_deletion(origin, key):
+    """key встречается впервые в рамках одного delete().
+    
+    Сигнал приходит на каждый удаленный объект (в том числе каскадом),
+    поэтому ревизию страницы увеличиваем один раз на вызов.
+    """
+    seen = origin.__dict__.setdefault('_revision_keys', set())
+    if key in seen:
+        return False
+    seen.add(key)
+    return True
+
+
+@receiver(post_save, sender=Page)
+def page_saved(sender, instance, raw=False, **kwargs):
+    if not raw:
+        Page.bump_revision([instance.id])
+        if needs_variants(instance.cover_image, '', instance.cover_variants):
+            MediaJob.enqueue('cover', instance.id)
+
+
+@receiver(post_save, sender=Block)
+def block_saved(sender, instance, created=False, raw=False, **kwargs):
+    if not raw:
+        Page.bump_revision([instance.page_id], Block.objects.filter(id=instance.id))
+        realtime.publish(instance.page_id, {
+            'type': 'block.created' if created else 'block.updated',
+            'block': realtime.block_data(instance),
+        })
+        if needs_variants(instance.file, instance.file_type, instance.file_variants):
+            MediaJob.enqueue('block', instance.id)
+
+
+@receiver(post_delete, sender=Block)
+def block_deleted(sender, instance, origin=None, **kwargs):
+    if not deleted_directly(origin, Block):
+        return
+    block_removed(instance.page_id, instance.id, bump=is_first_deletion(origin, instance.page_id))
+
+
+def block_removed(page_id, block_id, bump=True):
+    """Блок пропал со страницы (удален или перенесен на другую): ревизия, отметка и событие"""
+    if bump:
+        Page.bump_revision([page_id])
+    DeletedBlock.objects.create(
+        page_id=page_id,
+        block_id=block_id,
+        revision=Subquery(Page.objects.filter(id=page_id).order_by().values('revision')[:1]),
+    )
+    realtime.publish(page_id, {'type': 'block.deleted', 'id': block_id})
+
+
+@receiver(post_save, sender=Comment)
+def comment_saved(sender, instance, raw=False, **kwargs):
+    if not raw:
+        block = Block.objects.filter(id=instance.block_id)
+        Page.bump_revision(block.values('page_id'), block)
+
+
+@receiver(post_delete, sender=Comment)
+def comment_deleted(sender, instance, origin=None, **kwargs):
+    if deleted_directly(origin, Comment) and is_first_deletion(origin, instance.block_id):
+        block = Block.objects.filter(id=instance.block_id)
+        Page.bump_revision(block.values('page_id'), block)
+
+
+@receiver(post_save, sender=User)
+@receiver(post_delete, sender=User)
+def user_changed(sender, instance, **kwargs):
+    # Смена пароля, блокировка или удаление действуют сразу, а не через AUTH_USER_CACHE_TIMEOUT
+    forget_user(instance.id)
+
+
+@receiver(post_save, sender=BlacklistedToken)
+def token_blacklisted(sender, instance, **kwargs):
+    token = instance.token
+    timeout = (token.expires_at - timezone.now()).total_seconds()
+    if timeout > 0:
+        cache.set(blacklisted_key(token.jti), True, int(timeout) + 1)
@@ -0,0 +1,52 @@
+import hashlib
+import os
+from pathlib import PurePosixPath
+
+from django.core.files import File
+from django.core.files.storage import FileSystemStorage
+
+
+class ContentAddressedStorage(FileSystemStorage):
+    """Хранилище медиа по SHA-256 содержимого: blobs/ab/cd/<sha256>.<ext>.
+
+    Одинаковые файлы хранятся один раз, копии блоков ссылаются на тот же файл.
+    Файлы не удаляются вместе с блоками: неиспользуемые убирает manage.py collect_media.
+    """
+    PREFIX = 'blobs'
+    
+    def save(self, name, content, max_length=None):
+        if not hasattr(content, 'chunks'):
+            content = File(content, name)
+        digest = hashlib.sha256()
+        for chunk in content.chunks():
+            digest.update(chunk)
+        content.seek(0)
+        
+        checksum = digest.hexdigest()
+        extension = PurePosixPath(name).suffix.lower()[:16]
+        blob_name = f'{self.PREFIX}/{checksum[:2]}/{checksum[2:4]}/{checksum}{extension}'
+        if self.exists(blob_name):
+            touch(self, blob_name)
+            return blob_name
+        # При одновременной загрузке того же файла _save выберет свободное имя, содержимое совпадет
+        return self._save(blob_name, content)
+
+
+def touch(storage, name):
+    """Обновляет время изменения переиспользованного файла.
+    
+    Сборщик не удаляет файлы моложе льготного периода, поэтому файл, который
+    только что снова понадобился, переживет сборку, идущую параллельно.
+    """
+    try:
+        os.utime(storage.path(name))
+    except (NotImplementedError, FileNotFoundError):
+        pass
+
+
+def media_storage():
+    """Хранилище для файлов блоков и обложек (вызывается при загрузке моделей)"""
+    return content_storage
+
+
+content_storage = ContentAddressedStorage()
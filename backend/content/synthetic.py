@@ -0,0 +1,197 @@
+"""Генератор синтетических рабочих пространств для бенчмарков и проверок EXPLAIN.
+
+Объекты создаются bulk_create пачками в отдельных транзакциях, сигналы не вызываются:
+ревизии страниц, задачи media_worker и события WebSocket для таких данных не нужны.
+Материализованный путь страниц проставляется здесь же. Одинаковый seed дает одинаковые данные.
+"""
+import io
+import random
+import time
+
+from django.contrib.auth.hashers import make_password
+from django.contrib.auth.models import User
+from django.core.files.base import ContentFile
+from django.db import transaction
+from PIL import Image
+
+from .models import Page, Block, Comment
+from .storage import content_storage
+
+WORDS = (
+    'проект задача встреча отчет идея план заметка список бюджет дизайн релиз клиент '
+    'договор сервер база индекс поиск страница блок команда спринт ревью тест баг '
+    'документ презентация квартал цель метрика продукт рынок анализ архитектура'
+).split()
+
+# Доля типов блоков: текст преобладает, но встречается каждый тип из Block.BLOCK_TYPES
+BLOCK_TYPE_WEIGHTS = {
+    'text': 40, 'heading1': 3, 'heading2': 5, 'heading3': 5, 'quote': 4, 'list': 15,
+    'checkbox': 10, 'divider': 3, 'image': 6, 'video': 1, 'audio': 1, 'file': 2,
+}
+MEDIA_TYPES = {'image', 'video', 'audio', 'file'}
+# Блоки, у которых бывают вложенные (элементы списка, подзадачи, раскрывающийся текст)
+PARENT_TYPES = {'text', 'list', 'checkbox'}
+COLORS = ['#000000', '#FF0000', '#00FF00', '#0000FF', '#FFFF00', '#FF00FF', '#00FFFF', '#FFA500']
+
+
+class WorkspaceGenerator:
+    """Пользователи, деревья страниц, блоки всех типов с форматированием, комментарии и медиа"""
+    
+    def __init__(self, prefix='synthetic', seed=42, batch_size=5000,
+                 nested_rate=0.15, comment_rate=0.05, progress=None):
+        self.prefix = prefix
+        self.rng = random.Random(seed)
+        self.batch_size = batch_size
+        self.nested_rate = nested_rate
+        self.comment_rate = comment_rate
+        self.progress = progress or (lambda message: None)
+        self.media = None
+    
+    def words(self, count):
+        return ' '.join(self.rng.choices(WORDS, k=count))
+    
+    def users(self, count):
+        """Пользователи без пароля (вход только через выданный токен)"""
+        password = make_password(None)
+        return User.objects.bulk_create([
+            User(username=f'{self.prefix}-{index}', password=password) for index in range(count)
+        ], batch_size=self.batch_size)
+    
+    def create_pages(self, pages):
+        """bulk_create минует Page.save, поэтому путь вычисляется здесь: родители — раньше детей"""
+        pages = Page.objects.bulk_create(pages, batch_size=self.batch_size)
+        for page in pages:
+            page.path = f'{page.parent.path if page.parent else ""}{page.id}/'
+        Page.objects.bulk_update(pages, ['path'], batch_size=self.batch_size)
+        return pages
+    
+    def page_trees(self, users, per_user, depth):
+        """per_user страниц у каждого пользователя: случайные деревья глубиной до depth"""
+        levels = [[] for _ in range(depth)]
+        for user in users:
+            # Родитель страницы — одна из предыдущих страниц пользователя не на последнем уровне
+            shape = []
+            for index in range(per_user):
+                candidates = [item for item in range(index) if shape[item] < depth - 1]
+                parent = self.rng.choice(candidates) if candidates and self.rng.random() < 0.7 else None
+                shape.append(0 if parent is None else shape[parent] + 1)
+                levels[shape[-1]].append((user, index, parent))
+        
+        created = {}
+        with transaction.atomic():
+            for level in levels:
+                pages = self.create_pages([
+                    Page(
+                        title=self.words(self.rng.randint(1, 4)),
+                        icon=self.rng.choice(['📄', '📝', '📌', '']),
+                        owner=user,
+                        parent=created[user.id, parent] if parent is not None else None,
+                    )
+                    for user, index, parent in level
+                ])
+                for (user, index, parent), page in zip(level, pages):
+                    created[user.id, index] = page
+        return list(created.values())
+    
+    def block_counts(self, pages, total):
+        """Распределение total блоков по страницам с тяжелым хвостом: немного очень больших страниц"""
+        if not pages:
+            return []
+        weights = [self.rng.paretovariate(1.2) for _ in pages]
+        scale = total / sum(weights)
+        counts = [int(weight * scale) for weight in weights]
+        for index in self.rng.sample(range(len(pages)), total - sum(counts)):
+            counts[index] += 1
+        return list(zip(pages, counts))
+    
+    def media_files(self):
+        """Несколько файлов-заглушек на все медиа-блоки: в хранилище по хешу каждый лежит один раз"""
+        if self.media is None:
+            self.media = {
+                'image': [self.save_image(color) for color in [(200, 60, 60), (60, 160, 90), (50, 90, 200)]],
+                'video': [self.save_file('clip.mp4', b'\x00\x00\x00\x18ftypmp42', 'video/mp4')],
+                'audio': [self.save_file('sound.mp3', b'ID3\x03\x00\x00\x00', 'audio/mpeg')],
+                'file': [self.save_file('report.pdf', b'%PDF-1.4\n%synthetic\n', 'application/pdf')],
+            }
+        return self.media
+    
+    def save_image(self, color):
+        buffer = io.BytesIO()
+        Image.new('RGB', (640, 360), color).save(buffer, format='PNG')
+        return self.save_file('image.png', buffer.getvalue(), 'image/png')
+    
+    def save_file(self, name, data, content_type):
+        return {
+            'file': content_storage.save(name, ContentFile(data, name=name)),
+            'file_name': name,
+            'file_type': content_type,
+            'file_size': len(data),
+        }
+    
+    def block(self, page, block_type, order):
+        fields = {}
+        if block_type in MEDIA_TYPES:
+            fields = dict(self.rng.choice(self.media_files()[block_type]))
+            content = self.words(self.rng.randint(1, 4)) if block_type == 'file' else ''
+        elif block_type == 'divider':
+            content = ''
+        else:
+            content = self.words(self.rng.randint(2, 8) if block_type.startswith('heading') else self.rng.randint(5, 40))
+        
+        block_format = {}
+        if block_type not in MEDIA_TYPES and block_type != 'divider' and self.rng.random() < 0.2:
+            block_format = {
+                key: value for key, value in (
+                    ('bold', True), ('italic', True), ('underline', True),
+                    ('color', self.rng.choice(COLORS)), ('backgroundColor', self.rng.choice(COLORS)),
+                ) if self.rng.random() < 0.4
+            }
+        return Block(
+            page=page, block_type=block_type, content=content, format=block_format, order=order,
+            checked=block_type == 'checkbox' and self.rng.random() < 0.3, **fields
+        )
+    
+    def fill_blocks(self, counts):
+        """Блоки по списку (страница, количество); возвращает число созданных блоков"""
+        types, weights = zip(*BLOCK_TYPE_WEIGHTS.items())
+        total = sum(count for page, count in counts)
+        created = 0
+        started = time.perf_counter()
+        batch = []
+        for page, count in counts:
+            index = 0
+            while index < count:
+                parent = self.block(page, self.rng.choices(types, weights)[0], (index + 1) * Block.ORDER_GAP)
+                group = [parent]
+                index += 1
+                # Вложенные блоки создаются в той же пачке, сразу после родителя
+                if parent.block_type in PARENT_TYPES:
+                    while index < count and self.rng.random() < self.nested_rate:
+                        child = self.block(page, parent.block_type, parent.order + len(group))
+                        child.parent = parent
+                        group.append(child)
+                        index += 1
+                batch.extend(group)
+                if len(batch) >= self.batch_size:
+                    created += self.flush(batch)
+                    batch = []
+                    rate = created / (time.perf_counter() - started)
+                    self.progress(f'Блоков: {created}/{total} ({rate:.0f}/с)')
+        if batch:
+            created += self.flush(batch)
+        return created
+    
+    def flush(self, batch):
+        """Родители, затем вложенные блоки (им нужны id родителей), затем комментарии"""
+        with transaction.atomic():
+            top = Block.objects.bulk_create([block for block in batch if block.parent is None])
+            children = [block for block in batch if block.parent is not None]
+            for block in children:
+                block.parent_id = block.parent.id
+            children = Block.objects.bulk_create(children)
+            commented = [block for block in top + children if self.rng.random() < self.comment_rate]
+            Comment.objects.bulk_create([
+                Comment(block=block, content=self.words(self.rng.randint(3, 20)))
+                for block in commented for _ in range(self.rng.randint(1, 3))
+            ])
+        return len(batch)
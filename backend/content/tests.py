@@ -1,7 +1,43 @@
-from django.test import TestCase
-from rest_framework.test import APIClient
+import hashlib
+import io
+import json
+import os
+import shutil
+import tempfile
+import time
+from datetime import timedelta
+from decimal import Decimal
+from pathlib import Path
+from unittest import mock
+
+from asgiref.sync import async_to_sync, sync_to_async
+from asgiref.testing import ApplicationCommunicator
+from django.contrib.auth.models import User
+from django.core.files.base import ContentFile
+from django.core.management import call_command
+from django.core.cache import cache
+from django.db import connection
+from django.test import AsyncClient, TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from rest_framework.renderers import JSONRenderer
+from rest_framework.test import APIClient, APIRequestFactory
 from rest_framework import status
-from .models import Page, Block
+from rest_framework_simplejwt.exceptions import TokenError
+from rest_framework_simplejwt.tokens import AccessToken
+from rest_framework_simplejwt.utils import get_md5_hash_password
+from .models import Page, Block, Comment, DeletedBlock, Upload, MediaJob, HistoryEntry, PageSnapshot
+from . import history
+from .authentication import CachedJWTAuthentication, CachedRefreshToken, blacklisted_key, user_key
+from .images import blurhash, enqueue_missing
+from .profiling import instrument_serializers, metrics
+from .realtime import get_broker
+from .renderers import FastJSONParser, FastJSONRenderer, dumps
+from .serializers import BlockSerializer, block_list_data
+from .synthetic import WorkspaceGenerator
+from .views import BlockViewSet
+from .websocket import page_events
+from PIL import Image
 
 
 class PageAPITestCase(TestCase):
@@ -136,3 +172,1870 @@ class BlockModelTestCase(TestCase):
         self.assertEqual(blocks[0], block3)
         self.assertEqual(blocks[1], block2)
         self.assertEqual(blocks[2], block1)
+
+
+class PageListQueryCountTestCase(TestCase):
+    """Регрессионный тест количества запросов в списке страниц"""
+    
+    def setUp(self):
+        self.user = User.objects.create_user(username='owner', password='password')
+        self.client = APIClient()
+        self.client.force_authenticate(user=self.user)
+    
+    def create_pages(self, count, blocks_per_page=2):
+        for i in range(count):
+            page = Page.objects.create(title=f'Страница {i}', owner=self.user)
+            Block.objects.bulk_create([
+                Block(page=page, content=f'Блок {j}', order=j)
+                for j in range(blocks_per_page)
+            ])
+    
+    def test_list_query_count_does_not_depend_on_pages(self):
+        """Количество запросов не растет с числом страниц"""
+        self.create_pages(2)
+        with self.assertNumQueries(1):
+            response = self.client.get('/api/pages/')
+        self.assertEqual(len(response.data), 2)
+        
+        self.create_pages(30)
+        with self.assertNumQueries(1):
+            response = self.client.get('/api/pages/')
+        self.assertEqual(len(response.data), 32)
+    
+    def test_list_blocks_count(self):
+        """blocks_count совпадает с реальным количеством блоков"""
+        self.create_pages(1, blocks_per_page=3)
+        Page.objects.create(title='Пустая', owner=self.user)
+        response = self.client.get('/api/pages/')
+        counts = sorted(item['blocks_count'] for item in response.data)
+        self.assertEqual(counts, [0, 3])
+
+
+def create_large_page(owner, blocks_count=300, comments_per_block=2, is_public=False):
+    """Создает страницу с большим количеством блоков и комментариев"""
+    page = Page.objects.create(title='Большая страница', owner=owner, is_public=is_public)
+    if is_public:
+        page.generate_share_token()
+    blocks = Block.objects.bulk_create([
+        Block(page=page, block_type='text', content=f'Блок {i}', order=i)
+        for i in range(blocks_count)
+    ])
+    Comment.objects.bulk_create([
+        Comment(block=block, content=f'Комментарий {j}')
+        for block in blocks
+        for j in range(comments_per_block)
+    ])
+    return page
+
+
+def explain(sql):
+    """Шаги плана выполнения запроса в текущей СУБД"""
+    with connection.cursor() as cursor:
+        if connection.vendor == 'postgresql':
+            cursor.execute(f'EXPLAIN {sql}')
+            return [row[0] for row in cursor.fetchall()]
+        # SQLite: строки (id, parent, notused, detail)
+        cursor.execute(f'EXPLAIN QUERY PLAN {sql}')
+        return [row[-1] for row in cursor.fetchall()]
+
+
+def full_scans(sql):
+    """Шаги плана, читающие таблицу content_* целиком вместо поиска по индексу"""
+    if connection.vendor == 'postgresql':
+        return [step for step in explain(sql) if 'Seq Scan on content_' in step]
+    # SQLite: "SCAN content_x" — полный проход, "SEARCH content_x USING INDEX" — поиск по индексу
+    return [step for step in explain(sql) if step.startswith('SCAN content_')]
+
+
+def assert_index_scans(testcase, request):
+    """Выполняет запрос к API и проверяет, что каждый его SELECT обходится без полного сканирования"""
+    if connection.vendor == 'postgresql':
+        # На маленьком наборе данных планировщик PostgreSQL предпочел бы Seq Scan
+        with connection.cursor() as cursor:
+            cursor.execute('SET LOCAL enable_seqscan = off')
+    with CaptureQueriesContext(connection) as queries:
+        response = request()
+    testcase.assertEqual(response.status_code, status.HTTP_200_OK)
+    selects = [query['sql'] for query in queries if query['sql'].lstrip().upper().startswith('SELECT')]
+    testcase.assertTrue(selects)
+    for sql in selects:
+        testcase.assertEqual(full_scans(sql), [], sql)
+    return response
+
+
+class LargePageQueryBudgetTestCase(TestCase):
+    """Бюджет запросов при загрузке большой страницы"""
+    
+    BLOCKS_COUNT = 300
+    
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(username='owner', password='password')
+        cls.page = create_large_page(cls.user, blocks_count=cls.BLOCKS_COUNT, is_public=True)
+    
+    def setUp(self):
+        self.client = APIClient()
+        self.client.force_authenticate(user=self.user)
+    
+    def test_blocks_list_query_budget(self):
+        """Ревизия страницы, блоки и комментарии — три запроса"""
+        with self.assertNumQueries(3):
+            response = self.client.get(f'/api/blocks/?page={self.page.id}')
+        self.assertEqual(len(response.data), self.BLOCKS_COUNT)
+        self.assertEqual(len(response.data[0]['comments']), 2)
+    
+    def test_page_detail_query_budget(self):
+        """Ревизия страницы, страница, блоки и комментарии — четыре запроса"""
+        with self.assertNumQueries(4):
+            response = self.client.get(f'/api/pages/{self.page.id}/')
+        self.assertEqual(len(response.data['blocks']), self.BLOCKS_COUNT)
+    
+    def test_public_endpoints_query_budget(self):
+        """Публичные эндпоинты не делают запрос на каждый блок"""
+        cache.clear()
+        client = APIClient()
+        with self.assertNumQueries(4):
+            response = client.get(f'/api/public/share/{self.page.share_token}/')
+        self.assertEqual(len(response.data['blocks']), self.BLOCKS_COUNT)
+        with self.assertNumQueries(3):
+            response = client.get(f'/api/public/share/{self.page.share_token}/blocks/')
+        self.assertEqual(len(response.data), self.BLOCKS_COUNT)
+
+
+class BlockBatchAPITestCase(TestCase):
+    """Тесты пакетного изменения блоков"""
+    
+    def setUp(self):
+        self.user = User.objects.create_user(username='owner', password='password')
+        self.client = APIClient()
+        self.client.force_authenticate(user=self.user)
+        self.page = Page.objects.create(title='Страница', owner=self.user)
+        self.block = Block.objects.create(page=self.page, content='Первый', order=0)
+        self.other = Block.objects.create(page=self.page, content='Второй', order=1)
+    
+    def test_batch_create_update_delete(self):
+        """Создание, изменение и удаление блоков одним запросом"""
+        data = {
+            'page': self.page.id,
+            'operations': [
+                {'op': 'create', 'client_id': 'tmp-1', 'data': {'content': 'Новый', 'order': 2}},
+                {'op': 'update', 'id': self.block.id, 'data': {'content': 'Изменен', 'checked': True}},
+                {'op': 'delete', 'id': self.other.id},
+            ]
+        }
+        response = self.client.post('/api/blocks/batch/', data, format='json')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        
+        created = response.data['created'][0]
+        self.assertEqual(created['client_id'], 'tmp-1')
+        self.assertEqual(Block.objects.get(id=created['id']).content, 'Новый')
+        
+        updated = response.data['updated'][0]
+        self.assertEqual(set(updated), {'id', 'content', 'checked', 'updated_at'})
+        self.block.refresh_from_db()
+        self.assertEqual(self.block.content, 'Изменен')
+        self.assertTrue(self.block.checked)
+        
+        self.assertEqual(response.data['deleted'], [self.other.id])
+        self.assertFalse(Block.objects.filter(id=self.other.id).exists())
+    
+    def test_batch_rejects_foreign_page(self):
+        """Нельзя менять блоки на чужой странице"""
+        stranger = User.objects.create_user(username='stranger', password='password')
+        page = Page.objects.create(title='Чужая', owner=stranger)
+        data = {'page': page.id, 'operations': [{'op': 'create', 'data': {'content': 'x'}}]}
+        response = self.client.post('/api/blocks/batch/', data, format='json')
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+        self.assertEqual(page.blocks.count(), 0)
+    
+    def test_batch_rejects_blocks_from_other_page(self):
+        """Блоки с другой страницы не изменяются, пакет отклоняется целиком"""
+        page = Page.objects.create(title='Другая', owner=self.user)
+        foreign = Block.objects.create(page=page, content='Чужой блок')
+        data = {
+            'page': self.page.id,
+            'operations': [
+                {'op': 'update', 'id': self.block.id, 'data': {'content': 'Изменен'}},
+                {'op': 'update', 'id': foreign.id, 'data': {'content': 'Взлом'}},
+            ]
+        }
+        response = self.client.post('/api/blocks/batch/', data, format='json')
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(response.data['ids'], [foreign.id])
+        self.block.refresh_from_db()
+        self.assertEqual(self.block.content, 'Первый')
+    
+    def test_batch_rejects_self_parent(self):
+        """Блок нельзя вложить в самого себя"""
+        data = {
+            'page': self.page.id,
+            'operations': [{'op': 'update', 'id': self.block.id, 'data': {'parent': self.block.id}}]
+        }
+        response = self.client.post('/api/blocks/batch/', data, format='json')
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(response.data['ids'], [self.block.id])
+        self.block.refresh_from_db()
+        self.assertIsNone(self.block.parent_id)
+    
+    def test_batch_rejects_parent_cycle(self):
+        """Цикл из нескольких блоков отклоняется, в том числе через родителя из базы"""
+        data = {
+            'page': self.page.id,
+            'operations': [
+                {'op': 'update', 'id': self.block.id, 'data': {'parent': self.other.id}},
+                {'op': 'update', 'id': self.other.id, 'data': {'parent': self.block.id}},
+            ]
+        }
+        response = self.client.post('/api/blocks/batch/', data, format='json')
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(response.data['ids'], sorted([self.block.id, self.other.id]))
+        self.assertFalse(self.page.blocks.exclude(parent=None).exists())
+        
+        child = Block.objects.create(page=self.page, parent=self.other, order=2)
+        data = {
+            'page': self.page.id,
+            'operations': [{'op': 'update', 'id': self.other.id, 'data': {'parent': child.id}}]
+        }
+        response = self.client.post('/api/blocks/batch/', data, format='json')
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        
+        # Перенос ветки целиком под другой корень допустим
+        data['operations'] = [{'op': 'update', 'id': self.other.id, 'data': {'parent': self.block.id}}]
+        response = self.client.post('/api/blocks/batch/', data, format='json')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        response = self.client.get(f'/api/blocks/?page={self.page.id}&tree=1')
+        self.assertEqual(response.json()[0]['children'][0]['children'][0]['id'], child.id)
+    
+    def test_batch_update_query_count(self):
+        """Количество запросов не зависит от числа изменяемых блоков"""
+        Block.objects.bulk_create([Block(page=self.page, order=i) for i in range(2, 50)])
+        operations = [
+            {'op': 'update', 'id': block_id, 'data': {'content': 'Текст'}}
+            for block_id in self.page.blocks.values_list('id', flat=True)
+        ]
+        data = {'page': self.page.id, 'operations': operations}
+        # Исходный снимок страницы для журнала снимается один раз, при первом изменении
+        history.Journal.start(self.page.id)
+        with self.assertNumQueries(9):
+            response = self.client.post('/api/blocks/batch/', data, format='json')
+        self.assertEqual(len(response.data['updated']), 50)
+        self.assertEqual(self.page.blocks.filter(content='Текст').count(), 50)
+
+
+class BlockReorderTestCase(TestCase):
+    """Тесты изменения порядка и перемещения блоков"""
+    
+    def setUp(self):
+        self.user = User.objects.create_user(username='owner', password='password')
+        self.client = APIClient()
+        self.client.force_authenticate(user=self.user)
+        self.page = Page.objects.create(title='Страница', owner=self.user)
+    
+    def create_blocks(self, count, gap=1):
+        return Block.objects.bulk_create([
+            Block(page=self.page, content=f'Блок {i}', order=i * gap) for i in range(count)
+        ])
+    
+    def page_contents(self):
+        return list(self.page.blocks.values_list('content', flat=True))
+    
+    def test_reorder_single_update(self):
+        """Порядок тысячи блоков меняется одним UPDATE"""
+        blocks = self.create_blocks(1000)
+        data = {
+            'page': self.page.id,
+            'blocks': [{'id': block.id, 'order': 999 - i} for i, block in enumerate(blocks)]
+        }
+        history.Journal.start(self.page.id)
+        # SAVEPOINT, прежний порядок, проверка снимка журнала, UPDATE порядка,
+        # UPDATE ревизий страницы и блоков, INSERT записи журнала, RELEASE SAVEPOINT
+        with self.assertNumQueries(8):
+            response = self.client.post('/api/blocks/reorder/', data, format='json')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(self.page.blocks.first().id, blocks[-1].id)
+    
+    def test_reorder_rejects_foreign_blocks(self):
+        """Чужие блоки не переупорядочиваются, запрос отклоняется целиком"""
+        block = self.create_blocks(1)[0]
+        stranger = User.objects.create_user(username='stranger', password='password')
+        foreign_page = Page.objects.create(title='Чужая', owner=stranger)
+        foreign = Block.objects.create(page=foreign_page, order=5)
+        data = {'blocks': [{'id': block.id, 'order': 7}, {'id': foreign.id, 'order': 0}]}
+        response = self.client.post('/api/blocks/reorder/', data, format='json')
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        block.refresh_from_db()
+        foreign.refresh_from_db()
+        self.assertEqual(block.order, 0)
+        self.assertEqual(foreign.order, 5)
+    
+    def test_move_touches_one_row_when_gap_exists(self):
+        """При наличии зазора перемещение меняет только сам блок"""
+        blocks = self.create_blocks(5, gap=Block.ORDER_GAP)
+        response = self.client.post(f'/api/blocks/{blocks[4].id}/move/', {'after': blocks[0].id}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data['orders'], [{'id': blocks[4].id, 'order': Block.ORDER_GAP // 2}])
+        self.assertEqual(self.page_contents(), ['Блок 0', 'Блок 4', 'Блок 1', 'Блок 2', 'Блок 3'])
+    
+    def test_move_to_start(self):
+        """after=null перемещает блок в начало страницы"""
+        blocks = self.create_blocks(3)
+        self.client.post(f'/api/blocks/{blocks[2].id}/move/', {'after': None}, format='json')
+        self.assertEqual(self.page_contents(), ['Блок 2', 'Блок 0', 'Блок 1'])
+    
+    def test_move_renumbers_dense_page(self):
+        """Без зазора страница перенумеровывается с шагом ORDER_GAP"""
+        blocks = self.create_blocks(4)
+        response = self.client.post(f'/api/blocks/{blocks[0].id}/move/', {'after': blocks[2].id}, format='json')
+        self.assertEqual(len(response.data['orders']), 4)
+        self.assertEqual(self.page_contents(), ['Блок 1', 'Блок 2', 'Блок 0', 'Блок 3'])
+        orders = list(self.page.blocks.values_list('order', flat=True))
+        self.assertEqual(orders, [Block.ORDER_GAP * i for i in range(1, 5)])
+    
+    def test_invalid_ids_rejected(self):
+        """Нечисловые page и after — ошибка запроса, а не 500"""
+        blocks = self.create_blocks(2)
+        data = {'page': 'abc', 'blocks': [{'id': blocks[0].id, 'order': 1}]}
+        response = self.client.post('/api/blocks/reorder/', data, format='json')
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        for after in ('abc', [1]):
+            response = self.client.post(f'/api/blocks/{blocks[0].id}/move/', {'after': after}, format='json')
+            self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(self.page_contents(), ['Блок 0', 'Блок 1'])
+
+
+class PageDuplicateTestCase(TestCase):
+    """Тесты дублирования страниц"""
+    
+    def setUp(self):
+        self.user = User.objects.create_user(username='owner', password='password')
+        self.client = APIClient()
+        self.client.force_authenticate(user=self.user)
+        self.page = Page.objects.create(title='Шаблон', icon='📄', owner=self.user)
+        self.parent_block = Block.objects.create(
+            page=self.page, block_type='list', content='Список',
+            format={'bold': True}, file='blocks/doc.pdf', file_type='application/pdf', order=0
+        )
+        self.child_block = Block.objects.create(
+            page=self.page, content='Пункт', parent=self.parent_block, order=1
+        )
+        Comment.objects.create(block=self.child_block, content='Комментарий')
+    
+    def duplicate(self, page, **data):
+        response = self.client.post(f'/api/pages/{page.id}/duplicate/', data, format='json')
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        return Page.objects.get(id=response.data['id'])
+    
+    def test_duplicate_copies_blocks_fully(self):
+        """Копия сохраняет формат, файлы, вложенность, комментарии и владельца"""
+        copy = self.duplicate(self.page)
+        self.assertEqual(copy.title, 'Шаблон (копия)')
+        self.assertEqual(copy.owner, self.user)
+        
+        parent_copy = copy.blocks.get(content='Список')
+        child_copy = copy.blocks.get(content='Пункт')
+        self.assertEqual(parent_copy.format, {'bold': True})
+        self.assertEqual(parent_copy.file.name, 'blocks/doc.pdf')
+        self.assertEqual(child_copy.parent, parent_copy)
+        self.assertEqual(child_copy.comments.get().content, 'Комментарий')
+        self.assertEqual(self.page.blocks.count(), 2)
+    
+    def test_duplicate_subtree(self):
+        """include_children копирует дерево подстраниц"""
+        child = Page.objects.create(title='Подстраница', owner=self.user, parent=self.page)
+        grandchild = Page.objects.create(title='Вложенная', owner=self.user, parent=child)
+        Block.objects.create(page=grandchild, content='Глубокий блок')
+        
+        copy = self.duplicate(self.page, include_children=True)
+        child_copy = copy.children.get()
+        grandchild_copy = child_copy.children.get()
+        self.assertEqual(child_copy.title, 'Подстраница')
+        self.assertEqual(grandchild_copy.blocks.get().content, 'Глубокий блок')
+        self.assertEqual(Page.objects.count(), 6)
+        
+        self.duplicate(self.page)
+        self.assertEqual(Page.objects.count(), 7)
+    
+    def test_duplicate_subtree_skips_foreign_pages(self):
+        """Чужие страницы внутри поддерева не копируются и не достаются владельцу копии"""
+        stranger = User.objects.create_user(username='stranger', password='password')
+        foreign = Page.objects.create(title='Чужая', owner=stranger, parent=self.page)
+        Block.objects.create(page=foreign, content='Чужой блок')
+        
+        copy = self.duplicate(self.page, include_children=True)
+        self.assertFalse(copy.children.exists())
+        self.assertFalse(Page.objects.filter(owner=self.user, title='Чужая').exists())
+        self.assertFalse(Block.objects.filter(page__owner=self.user, content='Чужой блок').exists())
+    
+    def test_duplicate_query_count_does_not_depend_on_blocks(self):
+        """Количество запросов не зависит от числа блоков"""
+        with CaptureQueriesContext(connection) as small:
+            self.duplicate(self.page)
+        Block.objects.bulk_create([
+            Block(page=self.page, content=f'Блок {i}', parent=self.parent_block, order=i)
+            for i in range(40)
+        ])
+        with CaptureQueriesContext(connection) as large:
+            self.duplicate(self.page)
+        self.assertEqual(len(small), len(large))
+    
+    
+    def test_duplicate_subtree_paths(self):
+        """Копии подстраниц получают собственные материализованные пути"""
+        child = Page.objects.create(title='Подстраница', owner=self.user, parent=self.page)
+        copy = self.duplicate(self.page, include_children=True)
+        child_copy = copy.children.get()
+        self.assertEqual(copy.path, f'{copy.id}/')
+        self.assertEqual(child_copy.path, f'{copy.id}/{child_copy.id}/')
+        self.assertNotEqual(child_copy.id, child.id)
+
+
+class PageTreeTestCase(TestCase):
+    """Тесты материализованного дерева страниц"""
+    
+    def setUp(self):
+        self.user = User.objects.create_user(username='owner', password='password')
+        self.client = APIClient()
+        self.client.force_authenticate(user=self.user)
+        self.root = Page.objects.create(title='Корень', owner=self.user)
+        self.child = Page.objects.create(title='Раздел', owner=self.user, parent=self.root)
+        self.leaf = Page.objects.create(title='Заметка', owner=self.user, parent=self.child)
+        self.other = Page.objects.create(title='Другая', owner=self.user)
+    
+    def test_paths_on_create(self):
+        """Путь строится от корня при создании"""
+        self.assertEqual(self.root.path, f'{self.root.id}/')
+        self.assertEqual(self.leaf.path, f'{self.root.id}/{self.child.id}/{self.leaf.id}/')
+        self.assertEqual(self.leaf.ancestor_ids, [self.root.id, self.child.id])
+    
+    def test_move_updates_subtree(self):
+        """Перенос меняет пути всего поддерева"""
+        response = self.client.post(f'/api/pages/{self.child.id}/move/', {'parent': self.other.id}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data['path'], f'{self.other.id}/{self.child.id}/')
+        self.leaf.refresh_from_db()
+        self.assertEqual(self.leaf.path, f'{self.other.id}/{self.child.id}/{self.leaf.id}/')
+        
+        response = self.client.post(f'/api/pages/{self.child.id}/move/', {'parent': None}, format='json')
+        self.assertEqual(response.data['path'], f'{self.child.id}/')
+        self.leaf.refresh_from_db()
+        self.assertEqual(self.leaf.path, f'{self.child.id}/{self.leaf.id}/')
+    
+    def test_move_into_own_subtree_rejected(self):
+        """Страницу нельзя сделать потомком самой себя"""
+        for parent in (self.leaf, self.root):
+            response = self.client.post(f'/api/pages/{self.root.id}/move/', {'parent': parent.id}, format='json')
+            self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        response = self.client.patch(f'/api/pages/{self.child.id}/', {'parent': self.leaf.id}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+    
+    def test_save_with_cycle_leaves_page_unchanged(self):
+        """Page.save отклоняет цикл до записи: родитель и путь в базе не меняются"""
+        self.child.parent = self.leaf
+        with self.assertRaises(ValueError):
+            self.child.save()
+        self.child.refresh_from_db()
+        self.assertEqual(self.child.parent_id, self.root.id)
+        self.assertEqual(self.child.path, f'{self.root.id}/{self.child.id}/')
+    
+    def test_foreign_parent_rejected(self):
+        """Чужая страница не может быть родителем"""
+        stranger = User.objects.create_user(username='stranger', password='password')
+        foreign = Page.objects.create(title='Чужая', owner=stranger)
+        response = self.client.post(f'/api/pages/{self.child.id}/move/', {'parent': foreign.id}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+    
+    def test_tree_in_one_query(self):
+        """Дерево всех страниц собирается одним запросом"""
+        with self.assertNumQueries(1):
+            response = self.client.get('/api/pages/tree/')
+        roots = {node['title']: node for node in response.data}
+        self.assertEqual(set(roots), {'Корень', 'Другая'})
+        self.assertEqual(roots['Корень']['children'][0]['children'][0]['id'], self.leaf.id)
+    
+    def test_ancestors_and_subtree(self):
+        """Предки и поддерево выбираются по префиксу пути"""
+        with self.assertNumQueries(2):
+            response = self.client.get(f'/api/pages/{self.leaf.id}/ancestors/')
+        self.assertEqual([page['id'] for page in response.data], [self.root.id, self.child.id])
+        
+        with self.assertNumQueries(2):
+            response = self.client.get(f'/api/pages/{self.root.id}/subtree/')
+        self.assertEqual(response.data['id'], self.root.id)
+        self.assertEqual(response.data['children'][0]['children'][0]['id'], self.leaf.id)
+
+
+class BlockTreeTestCase(TestCase):
+    """Тесты вложенного представления блоков страницы (?tree=1)"""
+    
+    def setUp(self):
+        self.user = User.objects.create_user(username='owner', password='password')
+        self.client = APIClient()
+        self.client.force_authenticate(user=self.user)
+        self.page = Page.objects.create(title='Страница', owner=self.user)
+    
+    def test_tree_in_one_blocks_query(self):
+        """Блоки выбираются одним запросом, дети идут в порядке order"""
+        first = Block.objects.create(page=self.page, content='Список', order=1)
+        second = Block.objects.create(page=self.page, content='Второй', order=2)
+        later = Block.objects.create(page=self.page, parent=first, content='Пункт 2', order=4)
+        earlier = Block.objects.create(page=self.page, parent=first, content='Пункт 1', order=3)
+        nested = Block.objects.create(page=self.page, parent=earlier, content='Подпункт', order=5)
+        
+        # Ревизия страницы, блоки, комментарии блоков
+        with self.assertNumQueries(3):
+            response = self.client.get(f'/api/blocks/?page={self.page.id}&tree=1')
+        self.assertEqual([node['id'] for node in response.data], [first.id, second.id])
+        children = response.data[0]['children']
+        self.assertEqual([node['id'] for node in children], [earlier.id, later.id])
+        self.assertEqual(children[0]['children'][0]['id'], nested.id)
+        self.assertEqual(children[0]['children'][0]['children'], [])
+        
+        response = self.client.get(
+            f'/api/blocks/?page={self.page.id}&tree=1', HTTP_IF_NONE_MATCH=response['ETag']
+        )
+        self.assertEqual(response.status_code, status.HTTP_304_NOT_MODIFIED)
+    
+    def test_tree_depth_limit(self):
+        """Глубже TREE_MAX_DEPTH потомки идут плоским списком с id родителя"""
+        parent = None
+        chain = []
+        for index in range(5):
+            parent = Block.objects.create(page=self.page, parent=parent, content=f'Уровень {index}', order=index)
+            chain.append(parent)
+        with mock.patch.object(BlockViewSet, 'TREE_MAX_DEPTH', 2):
+            response = self.client.get(f'/api/blocks/?page={self.page.id}&tree=1')
+        second = response.data[0]['children'][0]
+        self.assertEqual([node['id'] for node in second['children']], [block.id for block in chain[2:]])
+        self.assertEqual([node['parent'] for node in second['children']], [block.id for block in chain[1:4]])
+
+
+class IndexUsageTestCase(TestCase):
+    """Основные запросы API используют индексы, а не полное сканирование таблиц"""
+    
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(username='owner', password='password')
+        cls.page = create_large_page(cls.user, blocks_count=50, is_public=True)
+        cls.block = cls.page.blocks.first()
+        # Страница пользователя — малая доля данных, как на рабочей базе
+        for index in range(10):
+            stranger = User.objects.create_user(username=f'stranger{index}', password='password')
+            create_large_page(stranger, blocks_count=200, is_public=index % 2 == 0)
+        # Статистика для планировщика, как на рабочей базе
+        with connection.cursor() as cursor:
+            cursor.execute('ANALYZE')
+    
+    def setUp(self):
+        self.client = APIClient()
+        self.client.force_authenticate(user=self.user)
+    
+    def test_pages(self):
+        for url in ('/api/pages/', '/api/pages/?page_size=10', '/api/pages/tree/', f'/api/pages/{self.page.id}/'):
+            with self.subTest(url=url):
+                assert_index_scans(self, lambda: self.client.get(url))
+    
+    def test_blocks_and_comments(self):
+        for url in (
+            f'/api/blocks/?page={self.page.id}',
+            f'/api/blocks/?page={self.page.id}&page_size=50',
+            f'/api/blocks/sync/?page={self.page.id}&since=0',
+            f'/api/comments/?block={self.block.id}',
+        ):
+            with self.subTest(url=url):
+                assert_index_scans(self, lambda: self.client.get(url))
+    
+    def test_public_share(self):
+        client = APIClient()
+        for url in (
+            f'/api/public/share/{self.page.share_token}/',
+            f'/api/public/share/{self.page.share_token}/blocks/',
+        ):
+            with self.subTest(url=url):
+                cache.clear()
+                assert_index_scans(self, lambda: client.get(url))
+
+
+class LargeListModesTestCase(TestCase):
+    """Тесты курсорной пагинации и потоковой выдачи списков"""
+    
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(username='owner', password='password')
+        cls.page = create_large_page(cls.user, blocks_count=25, comments_per_block=1)
+    
+    def setUp(self):
+        self.client = APIClient()
+        self.client.force_authenticate(user=self.user)
+    
+    def test_blocks_cursor_pagination(self):
+        """Курсор проходит все блоки страницы по порядку без повторов"""
+        url = f'/api/blocks/?page={self.page.id}&page_size=10'
+        contents = []
+        while url:
+            response = self.client.get(url)
+            self.assertEqual(response.status_code, status.HTTP_200_OK)
+            self.assertLessEqual(len(response.data['results']), 10)
+            contents.extend(block['content'] for block in response.data['results'])
+            url = response.data['next']
+        self.assertEqual(contents, [f'Блок {i}' for i in range(25)])
+    
+    def test_cursor_is_keyset_over_equal_order(self):
+        """Блоки с одинаковым order листаются по (order, created_at, id) без OFFSET, в обе стороны"""
+        page = Page.objects.create(title='Равный порядок', owner=self.user)
+        blocks = Block.objects.bulk_create([Block(page=page, content=f'Равный {i}', order=0) for i in range(23)])
+        expected = sorted(blocks, key=lambda block: (block.created_at, block.id))
+        url, pages = f'/api/blocks/?page={page.id}&page_size=5', []
+        while url:
+            with CaptureQueriesContext(connection) as queries:
+                response = self.client.get(url)
+            self.assertFalse([query for query in queries if 'OFFSET' in query['sql'].upper()])
+            pages.append(response.data)
+            url = response.data['next']
+        ids = [block['id'] for data in pages for block in data['results']]
+        self.assertEqual(ids, [block.id for block in expected])
+        self.assertIsNone(pages[0]['previous'])
+        
+        response = self.client.get(pages[-1]['previous'])
+        self.assertEqual(response.data['results'], pages[-2]['results'])
+        response = self.client.get(response.data['next'])
+        self.assertEqual(response.data['results'], pages[-1]['results'])
+        self.assertEqual(self.client.get(f'/api/blocks/?page={page.id}&cursor=bad').status_code, 404)
+    
+    def test_blocks_ndjson_stream(self):
+        """stream=ndjson отдает по одному блоку на строку"""
+        response = self.client.get(f'/api/blocks/?page={self.page.id}&stream=ndjson')
+        self.assertEqual(response['Content-Type'], 'application/x-ndjson')
+        # Пачки строятся через block_list_data, без BlockSerializer
+        with mock.patch.object(BlockSerializer, 'to_representation', side_effect=AssertionError):
+            lines = b''.join(response.streaming_content).decode().splitlines()
+        blocks = [json.loads(line) for line in lines]
+        self.assertEqual([block['content'] for block in blocks], [f'Блок {i}' for i in range(25)])
+        self.assertEqual(len(blocks[0]['comments']), 1)
+    
+    async def test_blocks_ndjson_stream_asgi(self):
+        """Под ASGI поток отдается асинхронным итератором, а не буферизуется целиком"""
+        response = await AsyncClient().get(
+            f'/api/blocks/?page={self.page.id}&stream=ndjson',
+            headers={'Authorization': f'Bearer {AccessToken.for_user(self.user)}'},
+        )
+        self.assertTrue(response.is_async)
+        lines = b''.join([chunk async for chunk in response.streaming_content]).decode().splitlines()
+        self.assertEqual([json.loads(line)['content'] for line in lines], [f'Блок {i}' for i in range(25)])
+    
+    def test_pages_cursor_pagination(self):
+        """Список страниц поддерживает курсорную пагинацию"""
+        for i in range(3):
+            Page.objects.create(title=f'Страница {i}', owner=self.user)
+        response = self.client.get('/api/pages/?page_size=2')
+        self.assertEqual(len(response.data['results']), 2)
+        self.assertIn('blocks_count', response.data['results'][0])
+        response = self.client.get(response.data['next'])
+        self.assertEqual(len(response.data['results']), 2)
+        self.assertIsNone(response.data['next'])
+    
+    def test_default_list_is_not_paginated(self):
+        """Без параметров список отдается целиком, как раньше"""
+        response = self.client.get(f'/api/blocks/?page={self.page.id}')
+        self.assertEqual(len(response.data), 25)
+
+
+class PublicPageCacheTestCase(TestCase):
+    """Тесты кэша и условных запросов для публичных страниц"""
+    
+    def setUp(self):
+        cache.clear()
+        self.client = APIClient()
+        self.user = User.objects.create_user(username='owner', password='password')
+        self.page = create_large_page(self.user, blocks_count=5, is_public=True)
+        self.url = f'/api/public/share/{self.page.share_token}/'
+    
+    def test_cached_response_costs_one_query(self):
+        """Повторный просмотр берется из кэша: один запрос за ревизией"""
+        self.client.get(self.url)
+        with self.assertNumQueries(1):
+            response = self.client.get(self.url)
+        self.assertEqual(len(response.data['blocks']), 5)
+    
+    def test_etag_returns_not_modified(self):
+        """Совпавший If-None-Match дает 304 без тела"""
+        response = self.client.get(self.url)
+        self.assertIn('Last-Modified', response)
+        with self.assertNumQueries(1):
+            response = self.client.get(self.url, HTTP_IF_NONE_MATCH=response['ETag'])
+        self.assertEqual(response.status_code, status.HTTP_304_NOT_MODIFIED)
+    
+    def test_block_change_invalidates_cache(self):
+        """Изменение блока или комментария меняет ETag и содержимое"""
+        first = self.client.get(self.url)
+        block = self.page.blocks.first()
+        block.content = 'Обновлено'
+        block.save()
+        response = self.client.get(self.url, HTTP_IF_NONE_MATCH=first['ETag'])
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data['blocks'][0]['content'], 'Обновлено')
+        
+        Comment.objects.create(block=block, content='Новый')
+        response = self.client.get(f'{self.url}blocks/')
+        self.assertEqual(len(response.data[0]['comments']), 3)
+        
+        block.delete()
+        response = self.client.get(f'{self.url}blocks/')
+        self.assertEqual(len(response.data), 4)
+    
+    def test_cache_keeps_urls_of_each_host(self):
+        """Ссылки в ответе строятся по хосту запроса, а не того, кто заполнил кэш"""
+        for host in ('localhost', '127.0.0.1', 'localhost'):
+            response = self.client.get(self.url, HTTP_HOST=host)
+            self.assertEqual(response.data['share_url'], f'http://{host}/share/{self.page.share_token}')
+    
+    def test_unshared_page_is_not_served_from_cache(self):
+        """После отключения доступа закэшированная страница недоступна"""
+        self.client.get(self.url)
+        self.page.is_public = False
+        self.page.save()
+        response = self.client.get(self.url)
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+
+
+class ConditionalGetTestCase(TestCase):
+    """Тесты ETag и 304 для страниц и блоков владельца"""
+    
+    def setUp(self):
+        self.user = User.objects.create_user(username='owner', password='password')
+        self.client = APIClient()
+        self.client.force_authenticate(user=self.user)
+        self.page = create_large_page(self.user, blocks_count=5)
+    
+    def test_page_retrieve_not_modified(self):
+        """Неизменившаяся страница отдается как 304 одним запросом"""
+        response = self.client.get(f'/api/pages/{self.page.id}/')
+        self.assertEqual(response['Cache-Control'], 'private, no-cache')
+        with self.assertNumQueries(1):
+            response = self.client.get(f'/api/pages/{self.page.id}/', HTTP_IF_NONE_MATCH=response['ETag'])
+        self.assertEqual(response.status_code, status.HTTP_304_NOT_MODIFIED)
+    
+    def test_blocks_list_etag_changes_on_block_update(self):
+        """Изменение блока меняет ETag списка блоков"""
+        url = f'/api/blocks/?page={self.page.id}'
+        etag = self.client.get(url)['ETag']
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, status.HTTP_304_NOT_MODIFIED)
+        
+        block = self.page.blocks.first()
+        self.client.patch(f'/api/blocks/{block.id}/', {'content': 'Новое'}, format='json')
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertNotEqual(response['ETag'], etag)
+    
+    def test_foreign_page_blocks_not_found(self):
+        """Блоки чужой страницы недоступны"""
+        stranger = User.objects.create_user(username='stranger', password='password')
+        page = Page.objects.create(title='Чужая', owner=stranger)
+        response = self.client.get(f'/api/blocks/?page={page.id}')
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+
+
+class BlockSyncTestCase(TestCase):
+    """Тесты синхронизации изменений блоков по ревизии"""
+    
+    def setUp(self):
+        self.user = User.objects.create_user(username='owner', password='password')
+        self.client = APIClient()
+        self.client.force_authenticate(user=self.user)
+        self.page = create_large_page(self.user, blocks_count=3, comments_per_block=0)
+        self.blocks = list(self.page.blocks.all())
+    
+    def sync(self, since):
+        response = self.client.get(f'/api/blocks/sync/?page={self.page.id}&since={since}')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        return response.data
+    
+    def test_sync_returns_only_changes(self):
+        """После ревизии клиента приходят только измененные и удаленные блоки"""
+        revision = self.client.get(f'/api/pages/{self.page.id}/').data['revision']
+        self.assertEqual(self.sync(revision)['blocks'], [])
+        
+        self.client.patch(f'/api/blocks/{self.blocks[0].id}/', {'content': 'Изменен'}, format='json')
+        self.client.delete(f'/api/blocks/{self.blocks[1].id}/')
+        created = self.client.post('/api/blocks/', {'page': self.page.id, 'content': 'Новый'}, format='json')
+        
+        data = self.sync(revision)
+        self.assertEqual(
+            sorted(block['content'] for block in data['blocks']),
+            ['Изменен', 'Новый']
+        )
+        self.assertEqual(data['deleted'], [self.blocks[1].id])
+        self.assertGreater(data['revision'], revision)
+        self.assertEqual(self.sync(data['revision']), {
+            'page': self.page.id, 'revision': data['revision'], 'full': False, 'blocks': [], 'deleted': []
+        })
+        self.assertIn(created.data['id'], [block['id'] for block in data['blocks']])
+    
+    def test_sync_includes_bulk_changes_and_comments(self):
+        """reorder, пакетные операции и комментарии тоже попадают в синхронизацию"""
+        revision = self.sync(0)['revision']
+        self.client.post('/api/blocks/reorder/', {
+            'blocks': [{'id': self.blocks[2].id, 'order': -1}]
+        }, format='json')
+        Comment.objects.create(block=self.blocks[0], content='Комментарий')
+        data = self.sync(revision)
+        self.assertEqual(
+            sorted(block['id'] for block in data['blocks']),
+            sorted([self.blocks[0].id, self.blocks[2].id])
+        )
+        
+        revision = data['revision']
+        self.client.post('/api/blocks/batch/', {
+            'page': self.page.id,
+            'operations': [{'op': 'delete', 'id': self.blocks[0].id}],
+        }, format='json')
+        self.assertEqual(self.sync(revision)['deleted'], [self.blocks[0].id])
+
+
+    def test_move_to_other_page_is_deletion_for_old_page(self):
+        """Блок, перенесенный на другую страницу, для старой — удаление: синхронизация и ETag"""
+        other = Page.objects.create(title='Другая', owner=self.user)
+        revision = self.sync(0)['revision']
+        url = f'/api/blocks/?page={self.page.id}'
+        etag = self.client.get(url)['ETag']
+        
+        with mock.patch('content.realtime.publish') as publish:
+            response = self.client.patch(f'/api/blocks/{self.blocks[0].id}/', {'page': other.id}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        publish.assert_any_call(self.page.id, {'type': 'block.deleted', 'id': self.blocks[0].id})
+        
+        data = self.sync(revision)
+        self.assertEqual(data['deleted'], [self.blocks[0].id])
+        self.assertEqual(data['blocks'], [])
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertNotIn(self.blocks[0].id, [block['id'] for block in response.data])
+        data = self.client.get(f'/api/blocks/sync/?page={other.id}&since=0').data
+        self.assertEqual([block['id'] for block in data['blocks']], [self.blocks[0].id])
+    
+    def test_pruned_tombstones_force_full_sync(self):
+        """После удаления старых отметок клиент с давней ревизией получает страницу целиком"""
+        revision = self.sync(0)['revision']
+        self.client.delete(f'/api/blocks/{self.blocks[0].id}/')
+        middle = self.sync(revision)['revision']
+        self.client.delete(f'/api/blocks/{self.blocks[1].id}/')
+        DeletedBlock.objects.filter(block_id=self.blocks[0].id).update(deleted_at=timezone.now() - timedelta(days=31))
+        
+        call_command('prune_deleted_blocks', stdout=io.StringIO())
+        self.assertEqual(list(DeletedBlock.objects.values_list('block_id', flat=True)), [self.blocks[1].id])
+        
+        data = self.sync(revision)
+        self.assertTrue(data['full'])
+        self.assertEqual([block['id'] for block in data['blocks']], [self.blocks[2].id])
+        self.assertEqual(data['deleted'], [])
+        # Клиент, видевший первое удаление, по-прежнему получает только изменения
+        data = self.sync(middle)
+        self.assertFalse(data['full'])
+        self.assertEqual(data['deleted'], [self.blocks[1].id])
+    
+    def test_maintenance_runs_all_tasks(self):
+        """manage.py maintenance запускает все задачи обслуживания; ошибка одной не мешает остальным"""
+        self.client.delete(f'/api/blocks/{self.blocks[0].id}/')
+        DeletedBlock.objects.update(deleted_at=timezone.now() - timedelta(days=31))
+        media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, media_root, ignore_errors=True)
+        stderr = io.StringIO()
+        with override_settings(MEDIA_ROOT=media_root), mock.patch(
+            'content.management.commands.compact_history.Command.handle', side_effect=RuntimeError('сбой')
+        ):
+            call_command('maintenance', once=True, stdout=io.StringIO(), stderr=stderr)
+        self.assertIn('compact_history: сбой', stderr.getvalue())
+        self.assertFalse(DeletedBlock.objects.exists())
+
+
+class PageEventsWebSocketTestCase(TestCase):
+    """Тесты WebSocket-событий страницы"""
+    
+    SUBSCRIBERS = 100
+    
+    def setUp(self):
+        self.user = User.objects.create_user(username='owner', password='password')
+        self.page = Page.objects.create(title='Страница', owner=self.user)
+        self.block = Block.objects.create(page=self.page, content='Блок')
+        self.token = str(AccessToken.for_user(self.user))
+    
+    async def connect(self, query):
+        communicator = ApplicationCommunicator(page_events, {
+            'type': 'websocket',
+            'path': f'/ws/pages/{self.page.id}/',
+            'query_string': query.encode(),
+        })
+        await communicator.send_input({'type': 'websocket.connect'})
+        return communicator, await communicator.receive_output(timeout=5)
+    
+    async def disconnect(self, communicator):
+        await communicator.send_input({'type': 'websocket.disconnect', 'code': 1000})
+        await communicator.wait(timeout=5)
+    
+    def update_block(self, content):
+        with self.captureOnCommitCallbacks(execute=True):
+            self.block.content = content
+            self.block.save()
+    
+    def delete_block(self):
+        self.block_id = self.block.id
+        with self.captureOnCommitCallbacks(execute=True):
+            self.block.delete()
+    
+    def test_rejects_unauthorized(self):
+        """Без токена или с чужим токеном соединение закрывается"""
+        stranger = User.objects.create_user(username='stranger', password='password')
+        
+        async def scenario():
+            _, message = await self.connect('')
+            self.assertEqual(message, {'type': 'websocket.close', 'code': 4403})
+            _, message = await self.connect(f'token={AccessToken.for_user(stranger)}')
+            self.assertEqual(message['type'], 'websocket.close')
+            _, message = await self.connect('token=invalid')
+            self.assertEqual(message['type'], 'websocket.close')
+        
+        async_to_sync(scenario)()
+    
+    def test_broadcasts_block_events(self):
+        """Изменение и удаление блока приходят подписчику"""
+        async def scenario():
+            communicator, message = await self.connect(f'token={self.token}')
+            self.assertEqual(message, {'type': 'websocket.accept'})
+            
+            await sync_to_async(self.update_block)('Изменен')
+            event = json.loads((await communicator.receive_output(timeout=5))['text'])
+            self.assertEqual(event['type'], 'block.updated')
+            self.assertEqual(event['block']['content'], 'Изменен')
+            
+            await sync_to_async(self.delete_block)()
+            event = json.loads((await communicator.receive_output(timeout=5))['text'])
+            self.assertEqual(event, {'type': 'block.deleted', 'id': self.block_id})
+            await self.disconnect(communicator)
+        
+        async_to_sync(scenario)()
+    
+    def test_fan_out_latency(self):
+        """Нагрузочный тест: событие доходит до 100 подписчиков одной страницы"""
+        async def scenario():
+            communicators = []
+            for _ in range(self.SUBSCRIBERS):
+                communicator, message = await self.connect(f'token={self.token}')
+                self.assertEqual(message['type'], 'websocket.accept')
+                communicators.append(communicator)
+            
+            started = time.perf_counter()
+            await sync_to_async(self.update_block)('Рассылка')
+            latencies = []
+            for communicator in communicators:
+                message = await communicator.receive_output(timeout=5)
+                latencies.append(time.perf_counter() - started)
+                self.assertEqual(json.loads(message['text'])['block']['content'], 'Рассылка')
+            
+            for communicator in communicators:
+                await self.disconnect(communicator)
+            return sorted(latencies)
+        
+        latencies = async_to_sync(scenario)()
+        self.assertEqual(len(latencies), self.SUBSCRIBERS)
+        # Вся рассылка укладывается в секунду даже на медленной CI-машине
+        self.assertLess(latencies[-1], 1.0)
+    
+    @override_settings(REALTIME_QUEUE_SIZE=3)
+    def test_slow_subscriber_disconnected(self):
+        """Переполненная очередь подписчика не растет: соединение закрывается кодом 4408"""
+        async def scenario():
+            communicator, message = await self.connect(f'token={self.token}')
+            self.assertEqual(message, {'type': 'websocket.accept'})
+            for index in range(10):
+                get_broker().publish(self.page.id, {'type': 'block.updated', 'block': {'id': index}})
+            messages = []
+            while True:
+                message = await communicator.receive_output(timeout=5)
+                messages.append(message)
+                if message['type'] == 'websocket.close':
+                    break
+            self.assertEqual(messages[-1], {'type': 'websocket.close', 'code': 4408})
+            self.assertLessEqual(len(messages), 4)
+            await communicator.wait(timeout=5)
+            self.assertNotIn(self.page.id, get_broker().subscribers)
+        
+        async_to_sync(scenario)()
+    
+    def test_subscription_check_closes_stale_connections(self):
+        """Проверка доступа закрывает устаревшие соединения с базой до и после запросов"""
+        async def scenario():
+            communicator, message = await self.connect(f'share={self.page.share_token}')
+            self.assertEqual(message['type'], 'websocket.close')
+        
+        with mock.patch('content.websocket.close_old_connections') as close:
+            async_to_sync(scenario)()
+        self.assertEqual(close.call_count, 2)
+
+
+class SearchAPITestCase(TestCase):
+    """Тесты полнотекстового поиска"""
+    
+    def setUp(self):
+        self.user = User.objects.create_user(username='owner', password='password')
+        self.client = APIClient()
+        self.client.force_authenticate(user=self.user)
+        self.page = Page.objects.create(title='Рецепты пирогов', owner=self.user)
+        self.block = Block.objects.create(page=self.page, content='Яблочный пирог с корицей')
+        Block.objects.create(page=self.page, content='Пирог, пирог и еще раз пирог')
+        Block.objects.create(page=self.page, content='Список покупок')
+    
+    def search(self, query):
+        response = self.client.get('/api/search/', {'q': query})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        return response.data
+    
+    def test_search_pages_and_blocks_ranked(self):
+        """Находит страницы и блоки, более релевантные — выше"""
+        data = self.search('пирог')
+        self.assertEqual([page['id'] for page in data['pages']], [self.page.id])
+        self.assertIn('<mark>пирогов</mark>', data['pages'][0]['highlight'])
+        contents = [block['snippet'] for block in data['blocks']]
+        self.assertEqual(len(contents), 2)
+        self.assertTrue(contents[0].startswith('<mark>Пирог</mark>'))
+        self.assertGreaterEqual(data['blocks'][0]['rank'], data['blocks'][1]['rank'])
+    
+    def test_search_is_scoped_to_owner(self):
+        """Чужие страницы и блоки не попадают в результаты"""
+        stranger = User.objects.create_user(username='stranger', password='password')
+        page = Page.objects.create(title='Чужие пироги', owner=stranger)
+        Block.objects.create(page=page, content='Чужой пирог')
+        data = self.search('пирог')
+        self.assertNotIn(page.id, [block['page'] for block in data['blocks']])
+        self.assertEqual(len(data['pages']), 1)
+    
+    def test_index_follows_writes(self):
+        """Индекс обновляется при изменении, массовой вставке и удалении блоков"""
+        self.block.content = 'Шарлотка'
+        self.block.save()
+        self.assertEqual(len(self.search('корицей')['blocks']), 0)
+        self.assertEqual(self.search('шарлотка')['blocks'][0]['id'], self.block.id)
+        
+        Block.objects.bulk_create([Block(page=self.page, content=f'Кекс номер {i}') for i in range(3)])
+        self.assertEqual(len(self.search('кекс')['blocks']), 3)
+        
+        self.block.delete()
+        self.assertEqual(self.search('шарлотка')['blocks'], [])
+    
+    def test_snippet_is_escaped(self):
+        """HTML из содержимого экранируется, подсвечивается только совпадение"""
+        Block.objects.create(page=self.page, content='<script>торт</script>')
+        snippet = self.search('торт')['blocks'][0]['snippet']
+        self.assertEqual(snippet, '&lt;script&gt;<mark>торт</mark>&lt;/script&gt;')
+    
+    def test_empty_and_special_queries(self):
+        """Пустой запрос и спецсимволы не ломают поиск"""
+        self.assertEqual(self.search('')['blocks'], [])
+        self.assertEqual(self.search('"*(:')['blocks'], [])
+
+
+class ChunkedUploadTestCase(TestCase):
+    """Тесты загрузки файлов по частям"""
+    
+    def setUp(self):
+        self.media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.media_root)
+        settings_override = override_settings(
+            MEDIA_ROOT=self.media_root, UPLOAD_TEMP_DIR=Path(self.media_root) / 'upload_tmp'
+        )
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+        
+        self.user = User.objects.create_user(username='owner', password='password')
+        self.client = APIClient()
+        self.client.force_authenticate(user=self.user)
+        self.page = Page.objects.create(title='Видео', owner=self.user)
+        self.block = Block.objects.create(page=self.page, block_type='video')
+        # Больше Upload.READ_SIZE, чтобы часть читалась из запроса в несколько приемов
+        self.data = bytes(range(256)) * 1000
+    
+    def start(self, size=None):
+        response = self.client.post('/api/uploads/', {
+            'block': self.block.id, 'file_name': 'clip.mp4', 'content_type': 'video/mp4',
+            'size': len(self.data) if size is None else size,
+        }, format='json')
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        return response.data['id']
+    
+    def append(self, upload_id, offset, chunk, checksum=None):
+        headers = {'HTTP_UPLOAD_OFFSET': str(offset)}
+        headers['HTTP_X_CHUNK_SHA256'] = checksum or hashlib.sha256(chunk).hexdigest()
+        return self.client.put(
+            f'/api/uploads/{upload_id}/append/', chunk,
+            content_type='application/octet-stream', **headers
+        )
+    
+    def test_upload_in_chunks(self):
+        """Части собираются в файл блока, временные данные удаляются"""
+        upload_id = self.start()
+        chunk_size = 100_000
+        for offset in range(0, len(self.data), chunk_size):
+            response = self.append(upload_id, offset, self.data[offset:offset + chunk_size])
+            self.assertEqual(response.status_code, status.HTTP_200_OK)
+            self.assertEqual(response.data['received'], min(offset + chunk_size, len(self.data)))
+        
+        response = self.client.post(
+            f'/api/uploads/{upload_id}/complete/',
+            {'sha256': hashlib.sha256(self.data).hexdigest()}, format='json'
+        )
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.block.refresh_from_db()
+        self.assertEqual(self.block.file_size, len(self.data))
+        self.assertEqual(self.block.file_type, 'video/mp4')
+        with self.block.file.open('rb') as stored:
+            self.assertEqual(stored.read(), self.data)
+        self.assertFalse(Upload.objects.exists())
+        self.assertEqual(list((Path(self.media_root) / 'upload_tmp').iterdir()), [])
+    
+    def test_resume_after_failed_chunk(self):
+        """Испорченная часть не принимается, загрузка продолжается с принятой позиции"""
+        upload_id = self.start()
+        half = len(self.data) // 2
+        self.assertEqual(self.append(upload_id, 0, self.data[:half]).status_code, status.HTTP_200_OK)
+        
+        response = self.append(upload_id, half, self.data[half:], checksum='0' * 64)
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        response = self.append(upload_id, 0, self.data[:half])
+        self.assertEqual(response.status_code, status.HTTP_409_CONFLICT)
+        
+        received = self.client.get(f'/api/uploads/{upload_id}/').data['received']
+        self.assertEqual(received, half)
+        self.assertEqual(self.append(upload_id, received, self.data[received:]).status_code, status.HTTP_200_OK)
+        response = self.client.post(f'/api/uploads/{upload_id}/complete/')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.block.refresh_from_db()
+        with self.block.file.open('rb') as stored:
+            self.assertEqual(stored.read(), self.data)
+    
+    def test_complete_checks_size_and_checksum(self):
+        """Незавершенная загрузка и неверная сумма файла отклоняются"""
+        upload_id = self.start()
+        self.append(upload_id, 0, self.data[:1000])
+        response = self.client.post(f'/api/uploads/{upload_id}/complete/')
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        
+        self.append(upload_id, 1000, self.data[1000:])
+        response = self.client.post(f'/api/uploads/{upload_id}/complete/', {'sha256': '0' * 64}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.block.refresh_from_db()
+        self.assertFalse(self.block.file)
+    
+    def test_chunk_beyond_declared_size(self):
+        upload_id = self.start(size=10)
+        response = self.append(upload_id, 0, self.data[:11])
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+    
+    def test_foreign_block_and_upload(self):
+        """Чужой блок нельзя выбрать, чужая загрузка не видна"""
+        upload_id = self.start()
+        stranger = User.objects.create_user(username='stranger', password='password')
+        client = APIClient()
+        client.force_authenticate(user=stranger)
+        self.assertEqual(client.get(f'/api/uploads/{upload_id}/').status_code, status.HTTP_404_NOT_FOUND)
+        response = client.post('/api/uploads/', {
+            'block': self.block.id, 'file_name': 'x.bin', 'size': 10,
+        }, format='json')
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+    
+    def test_abort(self):
+        upload_id = self.start()
+        self.append(upload_id, 0, self.data[:1000])
+        response = self.client.delete(f'/api/uploads/{upload_id}/')
+        self.assertEqual(response.status_code, status.HTTP_204_NO_CONTENT)
+        self.assertFalse(Upload.objects.exists())
+        self.assertEqual(list((Path(self.media_root) / 'upload_tmp').iterdir()), [])
+
+
+class ImageVariantsTestCase(TestCase):
+    """Тесты фоновой генерации уменьшенных копий изображений"""
+    
+    def setUp(self):
+        self.media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.media_root)
+        settings_override = override_settings(MEDIA_ROOT=self.media_root, IMAGE_VARIANT_WIDTHS=[320, 640])
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+        
+        self.user = User.objects.create_user(username='owner', password='password')
+        self.client = APIClient()
+        self.client.force_authenticate(user=self.user)
+        self.page = Page.objects.create(title='Фото', owner=self.user)
+    
+    def image_file(self, size=(1000, 500), color=(200, 30, 30)):
+        buffer = io.BytesIO()
+        Image.new('RGB', size, color).save(buffer, format='JPEG')
+        return ContentFile(buffer.getvalue(), name='photo.jpg')
+    
+    def test_upload_enqueues_and_worker_builds_variants(self):
+        """Загрузка ставит задачу, воркер строит копии и меняет ревизию страницы"""
+        block = Block(page=self.page, block_type='image', file_type='image/jpeg')
+        block.file.save('photo.jpg', self.image_file(), save=False)
+        block.save()
+        self.assertTrue(MediaJob.objects.filter(kind='block', object_id=block.id).exists())
+        response = self.client.get(f'/api/blocks/{block.id}/')
+        self.assertIsNone(response.data['file_srcset'])
+        revision = Page.objects.get(id=self.page.id).revision
+        
+        call_command('media_worker', once=True, stdout=io.StringIO())
+        
+        self.assertFalse(MediaJob.objects.exists())
+        self.assertGreater(Page.objects.get(id=self.page.id).revision, revision)
+        response = self.client.get(f'/api/blocks/{block.id}/')
+        self.assertIn('320w', response.data['file_srcset']['webp'])
+        self.assertIn('640w', response.data['file_srcset']['webp'])
+        self.assertEqual(response.data['file_placeholder']['width'], 1000)
+        self.assertEqual(response.data['file_placeholder']['height'], 500)
+        block.refresh_from_db()
+        name = block.file_variants['sources']['webp'][0][1]
+        with Image.open(Path(self.media_root) / name) as variant:
+            self.assertEqual(variant.size, (320, 160))
+            self.assertEqual(variant.format, 'WEBP')
+    
+    def test_existing_images_processed_lazily(self):
+        """Изображения, сохраненные без сигналов, воркер находит сам"""
+        block = Block(page=self.page, block_type='image')
+        block.file.save('old.jpg', self.image_file(size=(200, 100)), save=False)
+        Block.objects.bulk_create([block])
+        self.page.cover_image.save('cover.jpg', self.image_file(), save=False)
+        Page.objects.filter(id=self.page.id).update(cover_image=self.page.cover_image.name)
+        
+        call_command('media_worker', once=True, stdout=io.StringIO())
+        
+        block = Block.objects.get(page=self.page)
+        # Картинка уже меньше всех ширин: одна копия в исходном размере
+        self.assertEqual([size for size, name in block.file_variants['sources']['webp']], [200])
+        response = self.client.get(f'/api/pages/{self.page.id}/')
+        self.assertIn('640w', response.data['cover_image_srcset']['webp'])
+    
+    def test_non_images_and_broken_files(self):
+        """Обычные файлы не обрабатываются, битые изображения помечаются ошибкой"""
+        document = Block(page=self.page, block_type='file', file_type='application/pdf')
+        document.file.save('doc.pdf', ContentFile(b'%PDF-1.4'), save=False)
+        document.save()
+        self.assertFalse(MediaJob.objects.exists())
+        
+        broken = Block(page=self.page, block_type='image', file_type='image/png')
+        broken.file.save('broken.png', ContentFile(b'not an image'), save=False)
+        broken.save()
+        call_command('media_worker', once=True, stdout=io.StringIO(), stderr=io.StringIO())
+        job = MediaJob.objects.get(object_id=broken.id)
+        self.assertEqual(job.status, 'failed')
+        self.assertEqual(job.attempts, MediaJob.MAX_ATTEMPTS)
+    
+    def test_svg_and_unknown_images_are_skipped_once(self):
+        """SVG и файл без расширения помечаются без копий и больше не ставятся в очередь"""
+        svg = Block(page=self.page, block_type='image')
+        svg.file.save('logo.svg', ContentFile(b'<svg xmlns="http://www.w3.org/2000/svg"/>'), save=False)
+        Block.objects.bulk_create([svg])
+        self.page.cover_image.save('cover', ContentFile(b'data'), save=False)
+        Page.objects.filter(id=self.page.id).update(cover_image=self.page.cover_image.name)
+        
+        call_command('media_worker', once=True, stdout=io.StringIO())
+        
+        svg = Block.objects.get(page=self.page)
+        self.assertEqual(svg.file_variants, {'source': svg.file.name, 'sources': {}})
+        self.assertFalse(MediaJob.objects.exists())
+        self.assertEqual(enqueue_missing(10), 0)
+        response = self.client.get(f'/api/blocks/{svg.id}/')
+        self.assertIsNone(response.data['file_srcset'])
+        self.assertIsNone(response.data['file_placeholder'])
+        response = self.client.get(f'/api/pages/{self.page.id}/')
+        self.assertIsNone(response.data['cover_image_srcset'])
+        
+        # Задача, поставленная раньше, тоже закрывается описанием без копий
+        MediaJob.enqueue('block', svg.id)
+        Block.objects.filter(id=svg.id).update(file_variants={})
+        call_command('media_worker', once=True, stdout=io.StringIO())
+        self.assertEqual(Block.objects.get(id=svg.id).file_variants['sources'], {})
+        self.assertFalse(MediaJob.objects.exists())
+    
+    def test_blurhash(self):
+        """Формат строки: размерность 4x3, средний цвет в DC-компоненте"""
+        value = blurhash(Image.new('RGB', (64, 48), (255, 0, 0)))
+        self.assertEqual(len(value), 4 + 2 * 4 * 3)
+        self.assertEqual(value[0], 'L')
+        self.assertEqual(value[2:6], 'TI:j')  # 0xFF0000 в base83
+
+
+class ContentAddressedMediaTestCase(TestCase):
+    """Тесты хранения медиа по хешу содержимого и сборки неиспользуемых файлов"""
+    
+    def setUp(self):
+        self.media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.media_root)
+        settings_override = override_settings(MEDIA_ROOT=self.media_root)
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+        
+        self.user = User.objects.create_user(username='owner', password='password')
+        self.client = APIClient()
+        self.client.force_authenticate(user=self.user)
+        self.page = Page.objects.create(title='Файлы', owner=self.user)
+    
+    def upload(self, name, data):
+        block = Block.objects.create(page=self.page, block_type='file')
+        response = self.client.post(
+            f'/api/blocks/{block.id}/upload_file/', {'file': ContentFile(data, name=name)}, format='multipart'
+        )
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        block.refresh_from_db()
+        return block
+    
+    def age(self, name, hours):
+        path = Path(self.media_root) / name
+        timestamp = path.stat().st_mtime - hours * 3600
+        os.utime(path, (timestamp, timestamp))
+    
+    def test_identical_uploads_share_blob(self):
+        """Одинаковое содержимое хранится один раз, исходное имя остается у блока"""
+        first = self.upload('report.pdf', b'%PDF-1.4 same')
+        second = self.upload('copy of report.pdf', b'%PDF-1.4 same')
+        other = self.upload('report.pdf', b'%PDF-1.4 other')
+        
+        self.assertEqual(first.file.name, second.file.name)
+        self.assertNotEqual(first.file.name, other.file.name)
+        checksum = hashlib.sha256(b'%PDF-1.4 same').hexdigest()
+        self.assertEqual(first.file.name, f'blobs/{checksum[:2]}/{checksum[2:4]}/{checksum}.pdf')
+        self.assertEqual(second.file_name, 'copy of report.pdf')
+        self.assertEqual(len(list((Path(self.media_root) / 'blobs').rglob('*.pdf'))), 2)
+    
+    def test_duplicate_page_shares_blob(self):
+        """Копия страницы ссылается на те же файлы, удаление копии их не трогает"""
+        block = self.upload('photo.bin', b'data')
+        copy = self.page.duplicate()
+        copied = Block.objects.get(page=copy)
+        self.assertEqual(copied.file.name, block.file.name)
+        self.assertEqual(copied.file_name, 'photo.bin')
+        
+        copy.delete()
+        call_command('collect_media', hours=0, stdout=io.StringIO())
+        self.assertTrue((Path(self.media_root) / block.file.name).exists())
+    
+    def test_collect_media(self):
+        """Удаляются только старые файлы без ссылок"""
+        kept = self.upload('kept.txt', b'kept')
+        orphan = self.upload('orphan.txt', b'orphan')
+        young = self.upload('young.txt', b'young')
+        for block in (kept, orphan):
+            self.age(block.file.name, 48)
+        Block.objects.filter(id__in=[orphan.id, young.id]).delete()
+        # Загрузки записаны в журнал; без него на файлы ссылаются только блоки
+        HistoryEntry.objects.filter(page=self.page).delete()
+        PageSnapshot.objects.filter(page=self.page).delete()
+        
+        output = io.StringIO()
+        call_command('collect_media', dry_run=True, stdout=output)
+        self.assertIn(orphan.file.name, output.getvalue())
+        self.assertTrue((Path(self.media_root) / orphan.file.name).exists())
+        
+        call_command('collect_media', stdout=io.StringIO())
+        self.assertTrue((Path(self.media_root) / kept.file.name).exists())
+        self.assertTrue((Path(self.media_root) / young.file.name).exists())
+        self.assertFalse((Path(self.media_root) / orphan.file.name).exists())
+    
+    def test_collect_media_keeps_files_from_history(self):
+        """Файл удаленного блока остается, пока его можно вернуть отменой из журнала"""
+        block = self.upload('report.pdf', b'report')
+        name = block.file.name
+        self.age(name, 48)
+        self.client.delete(f'/api/blocks/{block.id}/')
+        
+        call_command('collect_media', hours=0, stdout=io.StringIO())
+        self.assertTrue((Path(self.media_root) / name).exists())
+        self.client.post(f'/api/pages/{self.page.id}/undo/')
+        self.assertEqual(Block.objects.get(id=block.id).file.name, name)
+        
+        # После очистки журнала файл удаленного блока больше никому не нужен
+        Block.objects.filter(id=block.id).delete()
+        HistoryEntry.objects.all().delete()
+        PageSnapshot.objects.all().delete()
+        call_command('collect_media', hours=0, stdout=io.StringIO())
+        self.assertFalse((Path(self.media_root) / name).exists())
+
+
+class ProtectedMediaTestCase(TestCase):
+    """Тесты раздачи медиа с проверкой доступа"""
+    
+    def setUp(self):
+        self.media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.media_root)
+        settings_override = override_settings(MEDIA_ROOT=self.media_root, MEDIA_ACCEL_REDIRECT='')
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+        
+        self.user = User.objects.create_user(username='owner', password='password')
+        self.client = APIClient()
+        self.client.force_authenticate(user=self.user)
+        self.page = Page.objects.create(title='Медиа', owner=self.user)
+        self.block = Block(page=self.page, block_type='video', file_type='video/mp4', file_name='Отпуск.mp4')
+        self.block.file.save('clip.mp4', ContentFile(b'video data'), save=False)
+        self.block.save()
+        self.url = f'/api/media/block/{self.block.id}/'
+    
+    def test_owner_and_token(self):
+        """Владелец получает файл по заголовку Authorization или ?token=, остальные — 404"""
+        response = self.client.get(self.url)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(b''.join(response.streaming_content), b'video data')
+        self.assertEqual(response['Content-Type'], 'video/mp4')
+        
+        anonymous = APIClient()
+        self.assertEqual(anonymous.get(self.url).status_code, status.HTTP_404_NOT_FOUND)
+        token = str(AccessToken.for_user(self.user))
+        self.assertEqual(anonymous.get(self.url, {'token': token}).status_code, status.HTTP_200_OK)
+        
+        stranger = APIClient()
+        stranger.force_authenticate(user=User.objects.create_user(username='stranger', password='password'))
+        self.assertEqual(stranger.get(self.url).status_code, status.HTTP_404_NOT_FOUND)
+    
+    def test_share_token(self):
+        """По токену ссылки файл доступен, пока страница публичная"""
+        token = self.page.generate_share_token()
+        Page.objects.filter(id=self.page.id).update(is_public=True)
+        anonymous = APIClient()
+        self.assertEqual(anonymous.get(self.url, {'share': token}).status_code, status.HTTP_200_OK)
+        
+        response = anonymous.get(f'/api/public/share/{token}/blocks/')
+        self.assertIn(f'share={token}', response.data[0]['file_url'])
+        
+        Page.objects.filter(id=self.page.id).update(is_public=False)
+        self.assertEqual(anonymous.get(self.url, {'share': token}).status_code, status.HTTP_404_NOT_FOUND)
+    
+    def test_payloads_have_no_storage_url(self):
+        """В ответах file и cover_image — защищенный URL, а не прямой путь в /media/"""
+        token = self.page.generate_share_token()
+        Page.objects.filter(id=self.page.id).update(is_public=True)
+        Page.objects.filter(id=self.page.id).update(cover_image=self.block.file.name)
+        payloads = [
+            self.client.get(f'/api/blocks/{self.block.id}/').data,
+            self.client.get(f'/api/blocks/?page={self.page.id}').data[0],
+            APIClient().get(f'/api/public/share/{token}/blocks/').data[0],
+            APIClient().get(f'/api/public/share/{token}/').data['blocks'][0],
+        ]
+        for data in payloads:
+            self.assertEqual(data['file'], data['file_url'])
+            self.assertIn(self.url, data['file'])
+        self.assertIn(f'share={token}', payloads[2]['file'])
+        page = APIClient().get(f'/api/public/share/{token}/').data
+        self.assertEqual(page['cover_image'], page['cover_image_url'])
+        self.assertIn(f'share={token}', page['cover_image'])
+    
+    @override_settings(MEDIA_ACCEL_REDIRECT='/protected-media/')
+    def test_accel_redirect(self):
+        """За nginx ответ без тела: X-Accel-Redirect на файл и имя для сохранения"""
+        file_url = self.client.get(f'/api/blocks/{self.block.id}/').data['file_url']
+        self.assertIn(self.url, file_url)
+        response = self.client.get(file_url)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.content, b'')
+        self.assertEqual(response['X-Accel-Redirect'], f'/protected-media/{self.block.file.name}')
+        self.assertIn('inline', response['Content-Disposition'])
+        self.assertIn("filename*=utf-8''%D0%9E", response['Content-Disposition'])
+        self.assertIn('immutable', response['Cache-Control'])
+        # Без актуальной версии в URL кэш каждый раз перепроверяется
+        self.assertEqual(self.client.get(self.url)['Cache-Control'], 'private, no-cache')
+    
+    def test_image_variant(self):
+        """Уменьшенная копия отдается по формату и ширине из описания копий"""
+        image = Block(page=self.page, block_type='image', file_type='image/png')
+        buffer = io.BytesIO()
+        Image.new('RGB', (800, 400)).save(buffer, format='PNG')
+        image.file.save('photo.png', ContentFile(buffer.getvalue()), save=False)
+        image.save()
+        with override_settings(IMAGE_VARIANT_WIDTHS=[320]):
+            call_command('media_worker', once=True, stdout=io.StringIO())
+        
+        srcset = self.client.get(f'/api/blocks/{image.id}/').data['file_srcset']['webp']
+        url = srcset.split(' ')[0]
+        self.assertIn(f'/api/media/block/{image.id}/webp/320/', url)
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response['Content-Type'], 'image/webp')
+        response = self.client.get(f'/api/media/block/{image.id}/webp/640/')
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+
+
+class CachedAuthenticationTestCase(TestCase):
+    """Тесты JWT-аутентификации с кэшем пользователя"""
+    
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user(username='owner', password='password')
+        response = self.client.post('/api/auth/login/', {'username': 'owner', 'password': 'password'})
+        self.access = response.data['access']
+        self.refresh = response.data['refresh']
+        self.client = APIClient()
+        self.client.credentials(HTTP_AUTHORIZATION=f'Bearer {self.access}')
+    
+    @override_settings(AUTH_CACHE_SHARED=True)
+    def test_user_cached(self):
+        """С общим кэшем пользователь читается из базы только на первом запросе"""
+        with self.assertNumQueries(2):
+            self.assertEqual(self.client.get('/api/auth/me/').status_code, status.HTTP_200_OK)
+        # Остается только запрос самого /me/ за полями профиля
+        with self.assertNumQueries(1):
+            self.assertEqual(self.client.get('/api/auth/me/').data['username'], 'owner')
+        with self.assertNumQueries(0):
+            user, token = CachedJWTAuthentication().authenticate(
+                APIRequestFactory().get('/', HTTP_AUTHORIZATION=f'Bearer {self.access}')
+            )
+        self.assertEqual((user.pk, user.is_active), (self.user.pk, True))
+        # Поля, которых нет в кэше, читаются при обращении
+        self.assertEqual(user.username, 'owner')
+    
+    def test_cache_has_no_password(self):
+        """В общем кэше только id, is_active и хеш для проверки отзыва, без пароля и профиля"""
+        self.client.get('/api/auth/me/')
+        cached = cache.get(user_key(self.user.id))
+        self.assertEqual(cached, (self.user.id, True, get_md5_hash_password(self.user.password)))
+        self.assertNotIn(self.user.password, repr(cached))
+        self.assertNotIn('owner', repr(cached))
+    
+    def test_user_change_invalidates_cache(self):
+        """Изменения пользователя видны сразу, без ожидания истечения кэша"""
+        self.client.get('/api/auth/me/')
+        self.user.is_active = False
+        self.user.save()
+        self.assertEqual(self.client.get('/api/auth/me/').status_code, status.HTTP_401_UNAUTHORIZED)
+    
+    def test_logout_revokes_tokens(self):
+        """После выхода не действуют ни access-, ни refresh-токен"""
+        response = self.client.post('/api/auth/logout/', {'refresh': self.refresh}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(self.client.get('/api/auth/me/').status_code, status.HTTP_401_UNAUTHORIZED)
+        response = APIClient().post('/api/auth/token/refresh/', {'refresh': self.refresh}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_401_UNAUTHORIZED)
+    
+    def test_logout_seen_by_other_process(self):
+        """Без общего кэша отзыв access-токена виден другим процессам через базу"""
+        self.client.post('/api/auth/logout/', {'refresh': self.refresh}, format='json')
+        # Кэш другого процесса ничего не знает о выходе
+        cache.clear()
+        self.assertEqual(self.client.get('/api/auth/me/').status_code, status.HTTP_401_UNAUTHORIZED)
+    
+    @override_settings(AUTH_USER_CACHE_TIMEOUT=60)
+    def test_unrevoked_cached_briefly(self):
+        """«Не в blacklist» и «не отозван» кэшируются на AUTH_USER_CACHE_TIMEOUT, а не на срок токена"""
+        with mock.patch.object(cache, 'add', wraps=cache.add) as add:
+            self.assertEqual(self.client.get('/api/auth/me/').status_code, status.HTTP_200_OK)
+            token = CachedRefreshToken(self.refresh)
+        self.assertEqual([call.args[1:] for call in add.call_args_list], [(False, 60), (False, 60)])
+        
+        # Другой процесс отправил токен в blacklist; здешний кэш помнит «нет» до истечения записи
+        key = blacklisted_key(token['jti'])
+        token.blacklist()
+        cache.set(key, False)
+        token.check_blacklist()
+        cache.delete(key)
+        with self.assertRaises(TokenError):
+            token.check_blacklist()
+    
+    def test_rotated_refresh_token_rejected(self):
+        """Refresh-токен после ротации отклоняется; повторная проверка — из кэша"""
+        client = APIClient()
+        response = client.post('/api/auth/token/refresh/', {'refresh': self.refresh}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertIn('refresh', response.data)
+        for _ in range(2):
+            with self.assertNumQueries(0):
+                response = client.post('/api/auth/token/refresh/', {'refresh': self.refresh}, format='json')
+            self.assertEqual(response.status_code, status.HTTP_401_UNAUTHORIZED)
+
+
+@override_settings(PROFILING_ENABLED=True, PROFILING_SLOWEST=5, PROFILING_SLOW_MS=0)
+class ProfilingTestCase(TestCase):
+    """Тесты middleware профилирования"""
+    
+    def setUp(self):
+        instrument_serializers()
+        metrics.reset()
+        self.user = User.objects.create_user(username='owner', password='password')
+        self.client = APIClient()
+        self.client.force_authenticate(user=self.user)
+        self.page = Page.objects.create(title='Профиль', owner=self.user)
+        Block.objects.create(page=self.page, content='Текст')
+    
+    def test_server_timing(self):
+        """Server-Timing: число и время SQL, сериализация, общее время"""
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(f'/api/blocks/?page={self.page.id}')
+        timing = response['Server-Timing']
+        self.assertIn(f'desc="{len(queries)} queries"', timing)
+        self.assertRegex(timing, r'serialize;dur=\d+\.\d')
+        self.assertRegex(timing, r'total;dur=\d+\.\d')
+    
+    def test_metrics_endpoint(self):
+        """Агрегаты по имени маршрута; метрики доступны только с разрешенных адресов"""
+        with self.assertLogs('content.profiling', 'WARNING') as logs:
+            self.client.get(f'/api/pages/{self.page.id}/')
+            self.client.get(f'/api/pages/{self.page.id}/')
+        self.assertIn('SELECT', logs.output[0])
+        
+        body = self.client.get('/api/metrics/').content.decode()
+        self.assertIn('http_requests_total{method="GET",view="page-detail",status="200"} 2', body)
+        self.assertIn('http_request_duration_seconds_count{method="GET",view="page-detail"} 2', body)
+        response = self.client.get('/api/metrics/', REMOTE_ADDR='10.0.0.5')
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+    
+    def test_disabled(self):
+        """Без PROFILING middleware не подключается"""
+        with override_settings(PROFILING_ENABLED=False):
+            client = APIClient()
+            client.force_authenticate(user=self.user)
+            response = client.get(f'/api/pages/{self.page.id}/')
+        self.assertNotIn('Server-Timing', response)
+
+
+class WorkspaceGeneratorTestCase(TestCase):
+    """Тесты генератора синтетических данных"""
+    
+    def setUp(self):
+        self.media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.media_root)
+        settings_override = override_settings(MEDIA_ROOT=self.media_root)
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+    
+    def generate(self, prefix):
+        generator = WorkspaceGenerator(prefix=prefix, seed=7, batch_size=100)
+        users = generator.users(3)
+        pages = generator.page_trees(users, per_user=10, depth=3)
+        created = generator.fill_blocks(generator.block_counts(pages, 1000))
+        return users, pages, created
+    
+    def test_workspace(self):
+        """Деревья страниц с путями, блоки всех типов, вложенность в пределах страницы"""
+        users, pages, created = self.generate('first')
+        self.assertEqual(created, 1000)
+        blocks = Block.objects.filter(page__owner__in=users)
+        self.assertEqual(blocks.count(), 1000)
+        self.assertEqual(
+            set(blocks.values_list('block_type', flat=True)),
+            {block_type for block_type, label in Block.BLOCK_TYPES}
+        )
+        for page in Page.objects.filter(owner__in=users).select_related('parent'):
+            self.assertEqual(page.path, f'{page.parent.path if page.parent else ""}{page.id}/')
+            self.assertLessEqual(page.path.count('/'), 3)
+        nested = blocks.exclude(parent=None).select_related('parent')
+        self.assertTrue(nested.exists())
+        self.assertTrue(all(block.parent.page_id == block.page_id for block in nested))
+        self.assertTrue(Comment.objects.filter(block__page__owner__in=users).exists())
+        # Медиа-блоки ссылаются на несколько общих файлов
+        self.assertLessEqual(blocks.exclude(file='').exclude(file=None).values('file').distinct().count(), 6)
+    
+    def test_no_pages(self):
+        """Без пользователей и страниц генератор ничего не создает и не падает"""
+        self.assertEqual(WorkspaceGenerator().block_counts([], 1000), [])
+        output = io.StringIO()
+        call_command('generate_workspace', users=0, blocks=1000, prefix='empty', stdout=output)
+        self.assertIn('Блоков: 0', output.getvalue())
+    
+    def test_seed_reproducible(self):
+        """Одинаковый seed — одинаковые данные"""
+        first_users, first_pages, created = self.generate('first')
+        second_users, second_pages, created = self.generate('second')
+        
+        def contents(users):
+            return list(
+                Block.objects.filter(page__owner__in=users)
+                .order_by('id').values_list('block_type', 'content', 'format')
+            )
+        self.assertEqual(contents(first_users), contents(second_users))
+
+
+class BlockHistoryTestCase(TestCase):
+    """Тесты журнала изменений блоков: отмена, повтор, состояние на момент времени"""
+    
+    def setUp(self):
+        self.user = User.objects.create_user(username='owner', password='password')
+        self.client = APIClient()
+        self.client.force_authenticate(user=self.user)
+        self.page = Page.objects.create(title='Страница', owner=self.user)
+        self.block = Block.objects.create(page=self.page, content='Первый', order=Block.ORDER_GAP)
+    
+    def contents(self):
+        return list(self.page.blocks.values_list('content', flat=True))
+    
+    def test_update_logs_changed_fields(self):
+        """Изменение хранит только изменившиеся поля, перемещение — отдельная операция"""
+        self.client.patch(f'/api/blocks/{self.block.id}/', {'content': 'Второй'}, format='json')
+        self.client.post('/api/blocks/reorder/', {'blocks': [{'id': self.block.id, 'order': 5}]}, format='json')
+        
+        update, move = HistoryEntry.objects.filter(page=self.page).order_by('id')
+        self.assertEqual(update.operations, [{
+            'op': 'update', 'id': self.block.id, 'before': {'content': 'Первый'}, 'after': {'content': 'Второй'},
+        }])
+        self.assertEqual(move.operations, [{
+            'op': 'move', 'id': self.block.id, 'before': {'order': Block.ORDER_GAP}, 'after': {'order': 5},
+        }])
+        self.assertEqual(update.user, self.user)
+    
+    def test_undo_redo(self):
+        """Отмена и повтор идут по стеку, новое изменение очищает повтор"""
+        self.client.patch(f'/api/blocks/{self.block.id}/', {'content': 'Второй'}, format='json')
+        self.client.post('/api/blocks/', {'page': self.page.id, 'content': 'Новый', 'order': 2 * Block.ORDER_GAP}, format='json')
+        self.assertEqual(self.contents(), ['Второй', 'Новый'])
+        
+        response = self.client.post(f'/api/pages/{self.page.id}/undo/')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data['action'], 'undo')
+        self.assertEqual(self.contents(), ['Второй'])
+        self.client.post(f'/api/pages/{self.page.id}/undo/')
+        self.assertEqual(self.contents(), ['Первый'])
+        response = self.client.post(f'/api/pages/{self.page.id}/undo/')
+        self.assertEqual(response.status_code, status.HTTP_409_CONFLICT)
+        
+        self.client.post(f'/api/pages/{self.page.id}/redo/')
+        self.assertEqual(self.contents(), ['Второй'])
+        self.client.post(f'/api/pages/{self.page.id}/undo/')
+        self.assertEqual(self.contents(), ['Первый'])
+        self.client.post(f'/api/pages/{self.page.id}/redo/')
+        self.client.post(f'/api/pages/{self.page.id}/redo/')
+        self.assertEqual(self.contents(), ['Второй', 'Новый'])
+        
+        self.client.post(f'/api/pages/{self.page.id}/undo/')
+        self.client.patch(f'/api/blocks/{self.block.id}/', {'checked': True}, format='json')
+        response = self.client.post(f'/api/pages/{self.page.id}/redo/')
+        self.assertEqual(response.status_code, status.HTTP_409_CONFLICT)
+        self.assertEqual(self.contents(), ['Второй'])
+    
+    def test_undo_delete_restores_subtree(self):
+        """Отмена удаления возвращает блок с вложенными под прежними id и с комментариями"""
+        child = Block.objects.create(page=self.page, parent=self.block, content='Вложенный', order=1)
+        comment = Comment.objects.create(block=self.block, content='Комментарий')
+        Comment.objects.create(block=child, content='Ответ')
+        self.client.get(f'/api/blocks/sync/?page={self.page.id}')
+        response = self.client.delete(f'/api/blocks/{self.block.id}/')
+        self.assertEqual(response.status_code, status.HTTP_204_NO_CONTENT)
+        self.assertEqual(self.page.blocks.count(), 0)
+        revision = Page.objects.get(id=self.page.id).revision
+        
+        self.client.post(f'/api/pages/{self.page.id}/undo/')
+        restored = Block.objects.get(id=child.id)
+        self.assertEqual(restored.parent_id, self.block.id)
+        self.assertEqual(Block.objects.get(id=self.block.id).content, 'Первый')
+        # Клиент, видевший удаление, получает блоки обратно при синхронизации
+        response = self.client.get(f'/api/blocks/sync/?page={self.page.id}&since={revision}')
+        self.assertEqual({block['id'] for block in response.data['blocks']}, {self.block.id, child.id})
+        self.assertEqual(response.data['deleted'], [])
+        restored_comment = Comment.objects.get(block=self.block)
+        self.assertEqual(restored_comment.content, 'Комментарий')
+        self.assertEqual(restored_comment.created_at, comment.created_at)
+        self.assertEqual(list(Comment.objects.filter(block=child).values_list('content', flat=True)), ['Ответ'])
+        
+        self.client.post(f'/api/pages/{self.page.id}/redo/')
+        self.assertEqual(self.page.blocks.count(), 0)
+        self.assertFalse(Comment.objects.exists())
+        self.client.post(f'/api/pages/{self.page.id}/undo/')
+        self.assertEqual(Comment.objects.count(), 2)
+        # В состоянии на момент времени комментариев нет, как и в снимках
+        response = self.client.get(f'/api/pages/{self.page.id}/history/', {'at': timezone.now().isoformat()})
+        self.assertNotIn('comments', response.data['blocks'][0])
+    
+    def test_page_as_of(self):
+        """Состояние на момент времени и журнал изменений страницы"""
+        self.client.patch(f'/api/blocks/{self.block.id}/', {'content': 'Второй'}, format='json')
+        moment = timezone.now()
+        self.client.delete(f'/api/blocks/{self.block.id}/')
+        
+        response = self.client.get(f'/api/pages/{self.page.id}/history/', {'at': moment.isoformat()})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual([block['content'] for block in response.data['blocks']], ['Второй'])
+        response = self.client.get(f'/api/pages/{self.page.id}/history/', {'at': timezone.now().isoformat()})
+        self.assertEqual(response.data['blocks'], [])
+        # До исходного снимка истории нет
+        response = self.client.get(f'/api/pages/{self.page.id}/history/', {'at': '2000-01-01T00:00:00Z'})
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+        
+        response = self.client.get(f'/api/pages/{self.page.id}/history/')
+        self.assertEqual([entry['operations'][0]['op'] for entry in response.data], ['delete', 'update'])
+    
+    def test_compaction(self):
+        """Снимок ограничивает проигрывание, старые записи удаляются"""
+        for index in range(5):
+            self.client.patch(f'/api/blocks/{self.block.id}/', {'content': f'Версия {index}'}, format='json')
+        call_command('compact_history', every=3, days=30, stdout=io.StringIO())
+        snapshot = PageSnapshot.objects.filter(page=self.page).order_by('-entry_id').first()
+        self.assertEqual(snapshot.entry_id, HistoryEntry.objects.filter(page=self.page).latest('id').id)
+        self.assertEqual(snapshot.blocks[0]['content'], 'Версия 4')
+        
+        self.client.patch(f'/api/blocks/{self.block.id}/', {'content': 'После снимка'}, format='json')
+        # Снимок и одна запись после него, без остальной истории
+        with self.assertNumQueries(2):
+            blocks = history.page_as_of(self.page.id, timezone.now())
+        self.assertEqual(blocks[0]['content'], 'После снимка')
+        
+        # Записи до снимка старше срока хранения: удаляются вместе с исходным снимком
+        HistoryEntry.objects.filter(page=self.page).update(created_at=timezone.now() - timedelta(days=40))
+        PageSnapshot.objects.filter(page=self.page).update(created_at=timezone.now() - timedelta(days=40))
+        call_command('compact_history', every=100, days=30, stdout=io.StringIO())
+        self.assertEqual(HistoryEntry.objects.filter(page=self.page).count(), 1)
+        self.assertEqual(list(PageSnapshot.objects.filter(page=self.page)), [snapshot])
+        self.assertEqual(history.page_as_of(self.page.id, timezone.now())[0]['content'], 'После снимка')
+        # Отменить можно только сохранившиеся изменения
+        self.client.post(f'/api/pages/{self.page.id}/undo/')
+        self.assertEqual(self.contents(), ['Версия 4'])
+        response = self.client.post(f'/api/pages/{self.page.id}/undo/')
+        self.assertEqual(response.status_code, status.HTTP_409_CONFLICT)
+
+
+class FastJSONTestCase(TestCase):
+    """Тесты быстрого JSON: orjson-рендерер и парсер, список блоков из .values()"""
+    
+    def setUp(self):
+        self.user = User.objects.create_user(username='owner', password='password')
+        self.client = APIClient()
+        self.client.force_authenticate(user=self.user)
+        self.page = Page.objects.create(title='Страница', owner=self.user, is_public=True, share_token='share-token')
+        self.image = Block.objects.create(
+            page=self.page, block_type='image', order=1, file='blobs/ab/cd/abcd.png', file_name='фото.png',
+            file_type='image/png', file_size=10, format={'bold': True},
+            file_variants={
+                'source': 'blobs/ab/cd/abcd.png', 'width': 640, 'height': 360, 'blurhash': 'LKO2?U%2Tw=w',
+                'sources': {'webp': [[320, 'derivatives/abcd-320.webp'], [640, 'derivatives/abcd-640.webp']]},
+            },
+        )
+        self.text = Block.objects.create(page=self.page, parent=self.image, content='Текст строка', order=2)
+        Comment.objects.create(block=self.text, content='Первый')
+        Comment.objects.create(block=self.text, content='Второй')
+    
+    def test_lean_list_matches_serializer(self):
+        """Список из .values() совпадает с BlockSerializer, в том числе для публичной ссылки"""
+        request = APIRequestFactory().get('/api/blocks/')
+        blocks = Block.objects.filter(page=self.page).order_by('order', 'created_at')
+        for context in ({'request': request}, {'request': request, 'share_token': 'share-token'}, {}):
+            expected = BlockSerializer(blocks.prefetch_related('comments'), many=True, context=context).data
+            with self.assertNumQueries(2):
+                data = block_list_data(blocks, context)
+            self.assertEqual(json.loads(json.dumps(data)), json.loads(json.dumps(expected)))
+        
+        response = self.client.get(f'/api/blocks/?page={self.page.id}')
+        self.assertEqual(response.json()[1]['comments'][1]['content'], 'Второй')
+        response = self.client.get('/api/public/share/share-token/blocks/')
+        self.assertIn('share=share-token', response.json()[0]['file_url'])
+    
+    def test_renderer_matches_drf(self):
+        """Вывод совпадает с JSONRenderer DRF байт в байт"""
+        data = {
+            'text': 'Текст  "', 'number': Decimal('1.5'), 'at': timezone.now(),
+            'day': timezone.now().date(), 'nested': [{'id': 1, 'value': None}], 7: True,
+        }
+        self.assertEqual(FastJSONRenderer().render(data), JSONRenderer().render(data))
+        self.assertEqual(dumps(data), JSONRenderer().render(data))
+        indented = FastJSONRenderer().render(data, 'application/json; indent=2')
+        self.assertEqual(indented, JSONRenderer().render(data, 'application/json; indent=2'))
+    
+    def test_parser(self):
+        """Тело запроса разбирается; ошибка разбора — 400"""
+        data = FastJSONParser().parse(io.BytesIO('{"content": "Текст", "order": 3}'.encode()))
+        self.assertEqual(data, {'content': 'Текст', 'order': 3})
+        response = self.client.patch(f'/api/blocks/{self.text.id}/', '{"content": ', content_type='application/json')
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        response = self.client.patch(
+            f'/api/blocks/{self.text.id}/', '{"content": "Изменен"}', content_type='application/json'
+        )
+        self.assertEqual(response.json()['content'], 'Изменен')
@@ -0,0 +1,56 @@
+def nest(items, parent_key='parent', max_depth=None):
+    """Собирает дерево из плоского списка словарей с 'id' и parent_key за O(n).
+
+    Каждый узел получает список 'children' в исходном порядке; корнями
+    становятся узлы без родителя или с родителем вне выборки. С max_depth
+    все потомки узла на этой глубине идут плоским списком в его children
+    (у каждого остается parent_key): глубина JSON-ответа ограничена.
+    """
+    nodes = {item['id']: {**item, 'children': []} for item in items}
+    tree = []
+    for node in nodes.values():
+        parent = nodes.get(node[parent_key])
+        if parent is None:
+            tree.append(node)
+        else:
+            parent['children'].append(node)
+    if max_depth is not None:
+        stack = [(node, 1) for node in tree]
+        while stack:
+            node, depth = stack.pop()
+            if depth >= max_depth:
+                node['children'] = flatten(node['children'])
+            else:
+                stack.extend((child, depth + 1) for child in node['children'])
+    return tree
+
+
+def flatten(tree):
+    """Узлы поддеревьев в порядке обхода в глубину, без вложенности"""
+    result = []
+    stack = list(reversed(tree))
+    while stack:
+        node = stack.pop()
+        result.append(node)
+        stack.extend(reversed(node['children']))
+        node['children'] = []
+    return result
+
+
+def find_cycle(parents, ids):
+    """Цикл в цепочке родителей от одного из ids: список id цикла или None.
+
+    parents — {id: id родителя или None}; каждый узел проверяется один раз.
+    """
+    safe = set()
+    for start in ids:
+        path, index = [], {}
+        node = start
+        while node is not None and node not in safe:
+            if node in index:
+                return path[index[node]:]
+            index[node] = len(path)
+            path.append(node)
+            node = parents.get(node)
+        safe.update(path)
+    return None
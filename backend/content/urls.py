@@ -1,13 +1,15 @@
 from django.urls import path, include
 from rest_framework.routers import DefaultRouter
 from rest_framework_simplejwt.views import TokenRefreshView
-from .views import PageViewSet, BlockViewSet, CommentViewSet, public_page_by_token, public_blocks_by_token
+from .views import PageViewSet, BlockViewSet, CommentViewSet, UploadViewSet, public_page_by_token, public_blocks_by_token, media_file, search
 from .auth_views import register, login, me, logout
+from .profiling import metrics_view
 
 router = DefaultRouter()
 router.register(r'pages', PageViewSet, basename='page')
 router.register(r'blocks', BlockViewSet, basename='block')
 router.register(r'comments', CommentViewSet, basename='comment')
+router.register(r'uploads', UploadViewSet, basename='upload')
 
 urlpatterns = [
     # Authentication
@@ -21,6 +23,16 @@ urlpatterns = [
     path('public/share/<str:token>/', public_page_by_token, name='public_page_by_token'),
     path('public/share/<str:token>/blocks/', public_blocks_by_token, name='public_blocks_by_token'),
     
+    # Media: проверка прав в Django, файл отдает nginx
+    path('media/<str:kind>/<int:object_id>/', media_file, name='media_file'),
+    path('media/<str:kind>/<int:object_id>/<str:image_format>/<int:width>/', media_file, name='media_variant'),
+    
+    # Метрики Prometheus (PROFILING=1)
+    path('metrics/', metrics_view, name='metrics'),
+    
+    # Search
+    path('search/', search, name='search'),
+    
     # API routes
     path('', include(router.urls)),
 ]
@@ -1,64 +1,209 @@
-from rest_framework import viewsets, status
-from rest_framework.decorators import action, api_view, permission_classes
+from django.conf import settings
+from rest_framework import viewsets, mixins, status, serializers
+from rest_framework.decorators import action, api_view, authentication_classes, permission_classes
 from rest_framework.response import Response
 from rest_framework.permissions import IsAuthenticated, AllowAny
 from django.db import transaction
+from django.db.models import Count, Case, When, Value, IntegerField, Q
+from django.http import Http404
 from django.shortcuts import get_object_or_404
-from .models import Page, Block, Comment
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+from .models import Page, Block, Comment, Upload
+from .pagination import BlockCursorPagination, PageCursorPagination, ndjson_response
+from .cache import not_modified_response, set_validators, cached_public_data
+from . import history, realtime
+from .images import TARGETS
+from .authentication import CachedJWTAuthentication
+from .media import QueryTokenAuthentication, serve
+from .search import search as search_content
+from .signals import block_removed
+from .tree import find_cycle, nest
 from .serializers import (
     PageSerializer, PageListSerializer, 
-    BlockSerializer, CommentSerializer
+    BlockSerializer, CommentSerializer,
+    BlockFieldsSerializer, BlockBatchSerializer, UploadSerializer, HistoryEntrySerializer,
+    block_list_data
 )
 
 
-class PageViewSet(viewsets.ModelViewSet):
+def set_block_orders(queryset, orders):
+    """Проставляет порядок блокам одним UPDATE ... CASE, возвращает число измененных строк"""
+    return queryset.filter(id__in=orders).update(order=Case(
+        *[When(id=block_id, then=Value(order)) for block_id, order in orders.items()],
+        output_field=IntegerField(),
+    ))
+
+
+def get_page_revision(**lookup):
+    """Страница только с полями, нужными для ревизии и условных запросов"""
+    return get_object_or_404(
+        Page.objects.only('id', 'revision', 'revised_at', 'updated_at', 'pruned_revision'),
+        **lookup
+    )
+
+
+class LargeListMixin:
+    """Список без пагинации, с курсорной пагинацией (?page_size=) или NDJSON-потоком (?stream=ndjson)"""
+    cursor_pagination_class = None
+    
+    def list(self, request, *args, **kwargs):
+        queryset = self.filter_queryset(self.get_queryset())
+        
+        if request.query_params.get('stream') == 'ndjson':
+            return ndjson_response(request, queryset, self.list_data)
+        
+        if 'cursor' in request.query_params or 'page_size' in request.query_params:
+            paginator = self.cursor_pagination_class()
+            page = paginator.paginate_queryset(queryset, request, view=self)
+            serializer = self.get_serializer(page, many=True)
+            return paginator.get_paginated_response(serializer.data)
+        
+        return Response(self.list_data(queryset))
+    
+    def list_data(self, queryset):
+        """Данные полного списка без пагинации"""
+        return self.get_serializer(queryset, many=True).data
+
+
+class PageViewSet(LargeListMixin, viewsets.ModelViewSet):
     permission_classes = [IsAuthenticated]
+    cursor_pagination_class = PageCursorPagination
     
     def get_queryset(self):
         """Возвращаем только страницы текущего пользователя"""
-        return Page.objects.filter(owner=self.request.user)
+        queryset = Page.objects.filter(owner=self.request.user)
+        if self.action == 'list':
+            # Количество блоков считаем одним агрегирующим запросом, а не по запросу на страницу
+            queryset = queryset.annotate(blocks_count=Count('blocks'))
+        elif self.action in ('retrieve', 'update', 'partial_update', 'toggle_share'):
+            # PageSerializer отдает блоки вместе с комментариями
+            queryset = queryset.prefetch_related('blocks__comments')
+        return queryset
     
     def get_serializer_class(self):
         if self.action == 'list':
             return PageListSerializer
         return PageSerializer
     
+    def retrieve(self, request, *args, **kwargs):
+        """Страница с блоками; 304 без сериализации, если у клиента актуальная ревизия"""
+        page = get_page_revision(id=kwargs['pk'], owner=request.user)
+        not_modified = not_modified_response(request, page)
+        if not_modified is not None:
+            return not_modified
+        response = super().retrieve(request, *args, **kwargs)
+        return set_validators(response, page)
+    
     def perform_create(self, serializer):
         """При создании страницы автоматически устанавливаем владельца"""
         serializer.save(owner=self.request.user)
     
-    def list(self, request, *args, **kwargs):
-        """Переопределяем list для отключения пагинации"""
-        queryset = self.filter_queryset(self.get_queryset())
-        serializer = self.get_serializer(queryset, many=True)
-        return Response(serializer.data)
-    
     @action(detail=True, methods=['post'])
     def duplicate(self, request, pk=None):
-        """Дублирование страницы со всеми блоками"""
+        """Дублирование страницы со всеми блоками (include_children — вместе с подстраницами)"""
         page = self.get_object()
+        include_children = str(request.data.get('include_children', '')).lower() in ('1', 'true')
         
         with transaction.atomic():
-            # Копируем страницу
-            new_page = Page.objects.create(
-                title=f"{page.title} (копия)",
-                icon=page.icon,
-                parent=page.parent
-            )
-            
-            # Копируем все блоки
-            for block in page.blocks.all():
-                Block.objects.create(
-                    page=new_page,
-                    block_type=block.block_type,
-                    content=block.content,
-                    checked=block.checked,
-                    order=block.order
-                )
+            new_page = page.duplicate(owner=request.user, include_children=include_children)
         
+        new_page = Page.objects.prefetch_related('blocks__comments').get(id=new_page.id)
         serializer = self.get_serializer(new_page)
         return Response(serializer.data, status=status.HTTP_201_CREATED)
     
+    TREE_FIELDS = ('id', 'title', 'icon', 'parent', 'path')
+    
+    @action(detail=False, methods=['get'])
+    def tree(self, request):
+        """Все страницы пользователя вложенным деревом (один запрос)"""
+        pages = Page.objects.filter(owner=request.user).values(*self.TREE_FIELDS)
+        return Response(nest(pages))
+    
+    @action(detail=True, methods=['get'])
+    def ancestors(self, request, pk=None):
+        """Цепочка предков от корня к родителю (для хлебных крошек)"""
+        page = get_object_or_404(Page.objects.only('id', 'path'), id=pk, owner=request.user)
+        ancestors = Page.objects.filter(id__in=page.ancestor_ids, owner=request.user).values(*self.TREE_FIELDS)
+        ancestors = sorted(ancestors, key=lambda ancestor: len(ancestor['path']))
+        return Response(ancestors)
+    
+    @action(detail=True, methods=['get'])
+    def subtree(self, request, pk=None):
+        """Страница со всеми подстраницами вложенным деревом"""
+        page = get_object_or_404(Page.objects.only('id', 'path'), id=pk, owner=request.user)
+        pages = Page.objects.filter(path__startswith=page.path, owner=request.user).values(*self.TREE_FIELDS)
+        return Response(next(node for node in nest(pages) if node['id'] == page.id))
+    
+    @action(detail=True, methods=['post'])
+    def move(self, request, pk=None):
+        """Перенос страницы со всем поддеревом под другого родителя (parent: null — в корень)"""
+        page = self.get_object()
+        serializer = PageSerializer(
+            page, data={'parent': request.data.get('parent')}, partial=True,
+            context=self.get_serializer_context()
+        )
+        serializer.is_valid(raise_exception=True)
+        with transaction.atomic():
+            serializer.save()
+        return Response({'id': page.id, 'parent': page.parent_id, 'path': page.path})
+    
+    @action(detail=True, methods=['post'])
+    def undo(self, request, pk=None):
+        """Отмена последнего изменения блоков страницы"""
+        page = get_object_or_404(Page.objects.only('id'), id=pk, owner=request.user)
+        entry = history.undo(page.id, request.user)
+        if entry is None:
+            return Response({'error': 'Нечего отменять'}, status=status.HTTP_409_CONFLICT)
+        return Response(HistoryEntrySerializer(entry).data)
+    
+    @action(detail=True, methods=['post'])
+    def redo(self, request, pk=None):
+        """Повтор отмененного изменения (пока после отмены страницу не меняли)"""
+        page = get_object_or_404(Page.objects.only('id'), id=pk, owner=request.user)
+        entry = history.redo(page.id, request.user)
+        if entry is None:
+            return Response({'error': 'Нечего повторять'}, status=status.HTTP_409_CONFLICT)
+        return Response(HistoryEntrySerializer(entry).data)
+    
+    HISTORY_LIMIT = 50
+    
+    @action(detail=True, methods=['get'])
+    def history(self, request, pk=None):
+        """Журнал изменений (новые первыми, ?before= — следующая порция) или блоки на момент ?at="""
+        page = get_object_or_404(Page.objects.only('id'), id=pk, owner=request.user)
+        
+        if 'at' in request.query_params:
+            try:
+                moment = parse_datetime(request.query_params['at'])
+            except ValueError:
+                moment = None
+            if moment is None:
+                return Response(
+                    {'error': 'at должен быть датой и временем в формате ISO 8601'},
+                    status=status.HTTP_400_BAD_REQUEST
+                )
+            if timezone.is_naive(moment):
+                moment = timezone.make_aware(moment)
+            blocks = history.page_as_of(page.id, moment)
+            if blocks is None:
+                return Response(
+                    {'error': 'История страницы на этот момент не сохранилась'},
+                    status=status.HTTP_404_NOT_FOUND
+                )
+            return Response({'page': page.id, 'at': moment, 'blocks': blocks})
+        
+        entries = page.history.order_by('-id')
+        try:
+            if 'before' in request.query_params:
+                entries = entries.filter(id__lt=int(request.query_params['before']))
+        except ValueError:
+            return Response(
+                {'error': 'before должен быть id записи'},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        return Response(HistoryEntrySerializer(entries[:self.HISTORY_LIMIT], many=True).data)
+    
     @action(detail=True, methods=['post'])
     def toggle_share(self, request, pk=None):
         """Включение/выключение публичного доступа к странице"""
@@ -87,33 +232,132 @@ class PageViewSet(viewsets.ModelViewSet):
 @permission_classes([AllowAny])
 def public_page_by_token(request, token):
     """Публичный доступ к странице по токену"""
-    page = get_object_or_404(Page, share_token=token, is_public=True)
-    serializer = PageSerializer(page, context={'request': request})
-    return Response(serializer.data)
+    page = get_page_revision(share_token=token, is_public=True)
+    not_modified = not_modified_response(request, page)
+    if not_modified is not None:
+        return not_modified
+    
+    def build():
+        full_page = Page.objects.prefetch_related('blocks__comments').get(id=page.id)
+        return PageSerializer(full_page, context={'request': request, 'share_token': token}).data
+    
+    data = cached_public_data(request, page, token, 'page', build)
+    return set_validators(Response(data), page, cache_control='public, no-cache')
 
 
 @api_view(['GET'])
 @permission_classes([AllowAny])
 def public_blocks_by_token(request, token):
     """Публичный доступ к блокам страницы по токену"""
-    page = get_object_or_404(Page, share_token=token, is_public=True)
-    blocks = page.blocks.all().order_by('order', 'created_at')
-    serializer = BlockSerializer(blocks, many=True, context={'request': request})
-    return Response(serializer.data)
+    page = get_page_revision(share_token=token, is_public=True)
+    not_modified = not_modified_response(request, page)
+    if not_modified is not None:
+        return not_modified
+    
+    def build():
+        blocks = Block.objects.filter(page_id=page.id).order_by('order', 'created_at')
+        return block_list_data(blocks, {'request': request, 'share_token': token})
+    
+    data = cached_public_data(request, page, token, 'blocks', build)
+    return set_validators(Response(data), page, cache_control='public, no-cache')
+
+
+@api_view(['GET'])
+@authentication_classes([CachedJWTAuthentication, QueryTokenAuthentication])
+@permission_classes([AllowAny])
+def media_file(request, kind, object_id, image_format=None, width=None):
+    """Файл блока или обложки (или его уменьшенная копия): владельцу страницы или по ?share=<token>"""
+    if kind not in TARGETS:
+        raise Http404
+    model, file_field, variants_field = TARGETS[kind]
+    prefix = 'page__' if kind == 'block' else ''
+    share_token = request.query_params.get('share')
+    access = Q()
+    if request.user.is_authenticated:
+        access |= Q(**{f'{prefix}owner': request.user})
+    if share_token:
+        access |= Q(**{f'{prefix}share_token': share_token, f'{prefix}is_public': True})
+    if not access:
+        raise Http404
+    
+    fields = [file_field, variants_field]
+    if kind == 'block':
+        fields += ['block_type', 'file_name', 'file_type']
+    # Одна выборка по первичному ключу: проверка прав почти ничего не стоит, файл отдает nginx
+    obj = get_object_or_404(model.objects.filter(access).only(*fields), id=object_id)
+    file = getattr(obj, file_field)
+    if not file:
+        raise Http404
+    
+    if image_format:
+        variants = getattr(obj, variants_field)
+        if variants.get('source') != file.name:
+            raise Http404
+        sizes = dict(variants['sources'].get(image_format, []))
+        if width not in sizes:
+            raise Http404
+        return serve(request, sizes[width])
+    
+    if kind == 'block':
+        return serve(
+            request, file.name, content_type=obj.file_type, file_name=obj.file_name,
+            as_attachment=True if obj.block_type == 'file' else None
+        )
+    return serve(request, file.name)
 
 
-class BlockViewSet(viewsets.ModelViewSet):
+@api_view(['GET'])
+@permission_classes([IsAuthenticated])
+def search(request):
+    """Полнотекстовый поиск по страницам и блокам текущего пользователя (?q=, ?limit=)"""
+    query = request.query_params.get('q', '')
+    try:
+        limit = min(int(request.query_params.get('limit', 20)), 100)
+    except ValueError:
+        return Response(
+            {'error': 'limit должен быть числом'},
+            status=status.HTTP_400_BAD_REQUEST
+        )
+    results = search_content(request.user, query, limit=limit)
+    return Response({'query': query, **results})
+
+
+class BlockViewSet(LargeListMixin, viewsets.ModelViewSet):
     permission_classes = [IsAuthenticated]
     serializer_class = BlockSerializer
+    cursor_pagination_class = BlockCursorPagination
+    # Глубже блоки дерева идут плоским списком: рекурсивный JSON-кодировщик не упирается в лимит
+    TREE_MAX_DEPTH = 100
     
     def get_queryset(self):
         """Возвращаем блоки только со страниц текущего пользователя"""
-        queryset = Block.objects.filter(page__owner=self.request.user)
+        queryset = Block.objects.filter(page__owner=self.request.user).prefetch_related('comments')
         page_id = self.request.query_params.get('page', None)
         if page_id is not None:
             queryset = queryset.filter(page_id=page_id, page__owner=self.request.user)
         return queryset
     
+    def list(self, request, *args, **kwargs):
+        """Блоки страницы (?page=) с ETag по ревизии страницы и ответом 304; ?tree=1 — вложенным деревом"""
+        page_id = request.query_params.get('page')
+        if page_id is None:
+            return super().list(request, *args, **kwargs)
+        page = get_page_revision(id=page_id, owner=request.user)
+        not_modified = not_modified_response(request, page)
+        if not_modified is not None:
+            return not_modified
+        if request.query_params.get('tree', '').lower() in ('1', 'true'):
+            # Все блоки одним упорядоченным запросом; вложенные попадают в children родителя за O(n)
+            blocks = self.list_data(self.filter_queryset(self.get_queryset()))
+            response = Response(nest(blocks, max_depth=self.TREE_MAX_DEPTH))
+        else:
+            response = super().list(request, *args, **kwargs)
+        return set_validators(response, page)
+    
+    def list_data(self, queryset):
+        """Список только для чтения: строки .values() вместо BlockSerializer"""
+        return block_list_data(queryset, self.get_serializer_context())
+    
     def perform_create(self, serializer):
         """Проверяем, что страница принадлежит пользователю"""
         page_id = serializer.validated_data.get('page').id
@@ -123,25 +367,285 @@ class BlockViewSet(viewsets.ModelViewSet):
         # Убеждаемся, что format установлен
         if 'format' not in serializer.validated_data or serializer.validated_data['format'] is None:
             serializer.validated_data['format'] = {}
-        serializer.save()
+        with transaction.atomic():
+            journal = history.Journal.start(page.id, self.request.user)
+            journal.insert(serializer.save())
+            journal.save()
     
-    def list(self, request, *args, **kwargs):
-        """Переопределяем list для отключения пагинации"""
-        queryset = self.filter_queryset(self.get_queryset())
-        serializer = self.get_serializer(queryset, many=True)
-        return Response(serializer.data)
+    def perform_update(self, serializer):
+        """Изменение блока с записью в журнал страницы"""
+        block = serializer.instance
+        page_id, before = block.page_id, history.block_state(block)
+        with transaction.atomic():
+            journal = history.Journal.start(page_id, self.request.user)
+            block = serializer.save()
+            if block.page_id == page_id:
+                journal.update(before, block)
+            else:
+                # Блок перенесен на другую страницу: для старой он удален, для новой создан
+                block_removed(page_id, block.id)
+                journal.delete([{'id': block.id, **before}])
+                moved = history.Journal.start(block.page_id, self.request.user)
+                moved.insert(block)
+                moved.save()
+            journal.save()
+    
+    def perform_destroy(self, instance):
+        """Удаление блока вместе с вложенными; журнал хранит их для отмены"""
+        with transaction.atomic():
+            journal = history.Journal.start(instance.page_id, self.request.user)
+            journal.delete(history.subtree_states(instance.page_id, [instance.id]))
+            instance.delete()
+            journal.save()
     
     @action(detail=False, methods=['post'])
-    def reorder(self, request):
-        """Изменение порядка блоков"""
-        blocks_order = request.data.get('blocks', [])
+    def batch(self, request):
+        """Пакетное создание, изменение и удаление блоков одной страницы"""
+        batch = BlockBatchSerializer(data=request.data)
+        if not batch.is_valid():
+            return Response(batch.errors, status=status.HTTP_400_BAD_REQUEST)
+        
+        page = get_object_or_404(Page, id=batch.validated_data['page'], owner=request.user)
+        operations = batch.validated_data['operations']
+        
+        # Валидируем поля всех операций до обращения к базе
+        errors = {}
+        for index, operation in enumerate(operations):
+            if operation['op'] == 'delete':
+                continue
+            fields = BlockFieldsSerializer(data=operation['data'], partial=operation['op'] == 'update')
+            if fields.is_valid():
+                operation['fields'] = fields.validated_data
+            else:
+                errors[index] = fields.errors
+        if errors:
+            return Response({'operations': errors}, status=status.HTTP_400_BAD_REQUEST)
+        
+        # Изменяемые блоки и родители загружаются одним запросом и только с этой страницы
+        referenced_ids = set()
+        for operation in operations:
+            if operation['op'] != 'create':
+                referenced_ids.add(operation['id'])
+            parent_id = operation.get('fields', {}).get('parent')
+            if parent_id is not None:
+                referenced_ids.add(parent_id)
+        existing = page.blocks.in_bulk(referenced_ids)
+        missing = referenced_ids - set(existing)
+        if missing:
+            return Response(
+                {'error': 'Блоки не найдены на странице', 'ids': sorted(missing)},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        
+        now = timezone.now()
+        datetime_field = serializers.DateTimeField()
+        updated_at = datetime_field.to_representation(now)
+        new_blocks, created = [], []
+        changed_blocks, changed_fields, updated = {}, {'updated_at'}, []
+        before = {}
+        deleted_ids = []
+        for operation in operations:
+            if operation['op'] == 'create':
+                fields = dict(operation['fields'])
+                block = Block(page=page, parent_id=fields.pop('parent', None), **fields)
+                new_blocks.append(block)
+                created.append(operation.get('client_id'))
+            elif operation['op'] == 'update':
+                block = existing[operation['id']]
+                before.setdefault(block.id, history.block_state(block))
+                for name, value in operation['fields'].items():
+                    setattr(block, 'parent_id' if name == 'parent' else name, value)
+                    changed_fields.add(name)
+                block.updated_at = now
+                changed_blocks[block.id] = block
+                updated.append({'id': block.id, **operation['fields'], 'updated_at': updated_at})
+            else:
+                deleted_ids.append(operation['id'])
+        
+        # Блок не может оказаться своим предком: родители из базы плюс измененные пакетом
+        moved = [block.id for block in changed_blocks.values() if before[block.id]['parent'] != block.parent_id]
+        if moved:
+            parents = dict(page.blocks.values_list('id', 'parent_id'))
+            parents.update((block.id, block.parent_id) for block in changed_blocks.values())
+            cycle = find_cycle(parents, moved)
+            if cycle:
+                return Response(
+                    {'error': 'Блок не может быть вложен в себя или своего потомка', 'ids': sorted(cycle)},
+                    status=status.HTTP_400_BAD_REQUEST
+                )
         
         with transaction.atomic():
-            for item in blocks_order:
-                Block.objects.filter(id=item['id']).update(order=item['order'])
+            journal = history.Journal.start(page.id, request.user)
+            if new_blocks:
+                Block.objects.bulk_create(new_blocks)
+                for block in new_blocks:
+                    journal.insert(block)
+            if changed_blocks:
+                Block.objects.bulk_update(list(changed_blocks.values()), sorted(changed_fields))
+                for block in changed_blocks.values():
+                    journal.update(before[block.id], block)
+            if deleted_ids:
+                journal.delete(history.subtree_states(page.id, deleted_ids))
+                page.blocks.filter(id__in=deleted_ids).delete()
+            journal.save()
+            # bulk_create/bulk_update не отправляют сигналы
+            changed_ids = [block.id for block in new_blocks] + list(changed_blocks)
+            Page.bump_revision([page.id], Block.objects.filter(id__in=changed_ids))
+            for block in new_blocks:
+                realtime.publish(page.id, {'type': 'block.created', 'block': realtime.block_data(block)})
+            for changes in updated:
+                realtime.publish(page.id, {'type': 'block.updated', 'block': changes})
+        
+        return Response({
+            'created': [
+                {
+                    'id': block.id,
+                    'client_id': client_id,
+                    'created_at': datetime_field.to_representation(block.created_at),
+                    'updated_at': datetime_field.to_representation(block.updated_at),
+                }
+                for client_id, block in zip(created, new_blocks)
+            ],
+            'updated': updated,
+            'deleted': deleted_ids,
+        })
+    
+    @action(detail=False, methods=['post'])
+    def reorder(self, request):
+        """Изменение порядка блоков одним UPDATE с проверкой владельца"""
+        try:
+            orders = {int(item['id']): int(item['order']) for item in request.data.get('blocks', [])}
+        except (KeyError, TypeError, ValueError):
+            return Response(
+                {'error': 'Ожидается список блоков вида {id, order}'},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        
+        queryset = Block.objects.filter(page__owner=request.user)
+        page_id = request.data.get('page')
+        if page_id is not None:
+            try:
+                page_id = int(page_id)
+            except (TypeError, ValueError):
+                return Response({'error': 'page должен быть id страницы'}, status=status.HTTP_400_BAD_REQUEST)
+            queryset = queryset.filter(page_id=page_id)
+        
+        if orders:
+            with transaction.atomic():
+                # Прежний порядок для журнала; страница получает снимок до изменения
+                journals = {}
+                for block_id, block_page_id, order in queryset.filter(id__in=orders).values_list('id', 'page_id', 'order'):
+                    if block_page_id not in journals:
+                        journals[block_page_id] = history.Journal.start(block_page_id, request.user)
+                    journals[block_page_id].change(block_id, {'order': order}, {'order': orders[block_id]})
+                if set_block_orders(queryset, orders) != len(orders):
+                    # Часть блоков чужая или не существует: не меняем ничего
+                    transaction.set_rollback(True)
+                    return Response(
+                        {'error': 'Блоки не найдены'},
+                        status=status.HTTP_400_BAD_REQUEST
+                    )
+                moved = queryset.filter(id__in=orders)
+                Page.bump_revision(moved.values('page_id'), moved)
+                
+                if page_id is not None:
+                    page_orders = {page_id: [{'id': block_id, 'order': order} for block_id, order in orders.items()]}
+                else:
+                    page_orders = {}
+                    for block_id, block_page_id in moved.values_list('id', 'page_id'):
+                        page_orders.setdefault(block_page_id, []).append({'id': block_id, 'order': orders[block_id]})
+                for block_page_id, items in page_orders.items():
+                    realtime.publish(block_page_id, {'type': 'blocks.reordered', 'orders': items})
+                for journal in journals.values():
+                    journal.save()
         
         return Response({'status': 'success'})
     
+    @action(detail=True, methods=['post'])
+    def move(self, request, pk=None):
+        """Перемещение блока после блока after (null — в начало страницы)"""
+        block = self.get_object()
+        siblings = Block.objects.filter(page_id=block.page_id).exclude(id=block.id)
+        after_id = request.data.get('after')
+        
+        if after_id is None:
+            after = None
+            following = siblings.first()
+        else:
+            try:
+                after_id = int(after_id)
+            except (TypeError, ValueError):
+                return Response({'error': 'after должен быть id блока или null'}, status=status.HTTP_400_BAD_REQUEST)
+            after = get_object_or_404(siblings, id=after_id)
+            following = siblings.filter(
+                Q(order__gt=after.order) | Q(order=after.order, created_at__gt=after.created_at)
+            ).first()
+        
+        if after is None:
+            new_order = following.order - Block.ORDER_GAP if following else 0
+        elif following is None:
+            new_order = after.order + Block.ORDER_GAP
+        elif following.order - after.order > 1:
+            new_order = (after.order + following.order) // 2
+        else:
+            new_order = None
+        
+        previous = {block.id: block.order}
+        if new_order is not None:
+            orders = {block.id: new_order}
+        else:
+            # Зазор исчерпан: перенумеровываем страницу с шагом ORDER_GAP одним UPDATE
+            previous.update(siblings.values_list('id', 'order'))
+            ids = list(previous)[1:]
+            ids.insert(ids.index(after.id) + 1, block.id)
+            orders = {block_id: (index + 1) * Block.ORDER_GAP for index, block_id in enumerate(ids)}
+        
+        page_blocks = Block.objects.filter(page_id=block.page_id)
+        with transaction.atomic():
+            journal = history.Journal.start(block.page_id, request.user)
+            set_block_orders(page_blocks, orders)
+            Page.bump_revision([block.page_id], page_blocks.filter(id__in=orders))
+            for block_id, order in orders.items():
+                journal.change(block_id, {'order': previous[block_id]}, {'order': order})
+            journal.save()
+        
+        items = [{'id': block_id, 'order': order} for block_id, order in orders.items()]
+        realtime.publish(block.page_id, {'type': 'blocks.reordered', 'orders': items})
+        return Response({'orders': items})
+    
+    @action(detail=False, methods=['get'])
+    def sync(self, request):
+        """Изменения блоков страницы после ревизии since: измененные блоки и id удаленных.
+        
+        Если отметки об удалениях после since уже удалены (since < pruned_revision),
+        приходят все блоки страницы и full: true — клиент заменяет свои блоки целиком.
+        """
+        try:
+            since = int(request.query_params.get('since', 0))
+        except ValueError:
+            return Response(
+                {'error': 'since должен быть номером ревизии'},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        
+        # Ревизию читаем до блоков: изменения, попавшие между запросами, придут повторно, но не потеряются
+        page = get_page_revision(id=request.query_params.get('page'), owner=request.user)
+        full = since < page.pruned_revision
+        if full:
+            blocks, deleted = page.blocks.all(), []
+        else:
+            blocks = page.blocks.filter(revision__gt=since)
+            deleted = page.deleted_blocks.filter(revision__gt=since).values_list('block_id', flat=True)
+        blocks = blocks.prefetch_related('comments')
+        
+        return Response({
+            'page': page.id,
+            'revision': page.revision,
+            'full': full,
+            'blocks': self.get_serializer(blocks, many=True).data,
+            'deleted': list(deleted),
+        })
+    
     @action(detail=True, methods=['post'])
     def upload_file(self, request, pk=None):
         """Загрузка файла для блока"""
@@ -154,15 +658,98 @@ class BlockViewSet(viewsets.ModelViewSet):
                 status=status.HTTP_400_BAD_REQUEST
             )
         
-        block.file = file
-        block.file_type = file.content_type
-        block.file_size = file.size
-        block.save()
+        before = history.block_state(block)
+        with transaction.atomic():
+            journal = history.Journal.start(block.page_id, request.user)
+            block.file = file
+            block.file_name = file.name
+            block.file_type = file.content_type
+            block.file_size = file.size
+            block.save()
+            journal.update(before, block)
+            journal.save()
         
         serializer = self.get_serializer(block)
         return Response(serializer.data)
 
 
+class UploadViewSet(mixins.CreateModelMixin, mixins.RetrieveModelMixin,
+                    mixins.DestroyModelMixin, viewsets.GenericViewSet):
+    """Загрузка файла блока по частям: create → append (повторяется) → complete.
+    
+    После обрыва клиент узнает принятый объем через GET и продолжает с этой позиции.
+    """
+    permission_classes = [IsAuthenticated]
+    serializer_class = UploadSerializer
+    
+    def get_queryset(self):
+        return Upload.objects.filter(owner=self.request.user)
+    
+    def perform_create(self, serializer):
+        serializer.save(owner=self.request.user)
+    
+    def perform_destroy(self, instance):
+        instance.discard()
+    
+    @action(detail=True, methods=['put'])
+    def append(self, request, pk=None):
+        """Часть файла: байты в теле, позиция в Upload-Offset, SHA-256 части в X-Chunk-SHA256"""
+        upload = self.get_object()
+        try:
+            offset = int(request.headers['Upload-Offset'])
+            length = int(request.headers.get('Content-Length') or 0)
+        except (KeyError, ValueError):
+            return Response(
+                {'error': 'Нужен заголовок Upload-Offset'},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        if length <= 0:
+            return Response({'error': 'Пустая часть'}, status=status.HTTP_400_BAD_REQUEST)
+        if length > settings.UPLOAD_MAX_CHUNK_SIZE:
+            return Response(
+                {'error': 'Слишком большая часть', 'chunk_size': settings.UPLOAD_CHUNK_SIZE},
+                status=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE
+            )
+        if offset != upload.received:
+            return Response(
+                {'error': 'Неверная позиция', 'received': upload.received},
+                status=status.HTTP_409_CONFLICT
+            )
+        
+        try:
+            received = upload.append(request.stream, offset, length, request.headers.get('X-Chunk-SHA256'))
+        except ValueError as error:
+            return Response(
+                {'error': str(error), 'received': offset},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        if received is None:
+            upload.refresh_from_db(fields=['received'])
+            return Response(
+                {'error': 'Неверная позиция', 'received': upload.received},
+                status=status.HTTP_409_CONFLICT
+            )
+        return Response({'received': received})
+    
+    @action(detail=True, methods=['post'])
+    def complete(self, request, pk=None):
+        """Сборка: проверяет размер и SHA-256 файла (sha256), прикрепляет файл к блоку"""
+        upload = self.get_object()
+        try:
+            with transaction.atomic():
+                # Повторный complete ждет первый и получает 404, а не ищет перемещенный файл
+                upload = get_object_or_404(self.get_queryset().select_for_update(), id=upload.id)
+                journal = history.Journal.start(upload.block.page_id, request.user)
+                before = history.block_state(upload.block)
+                block = upload.complete(request.data.get('sha256'))
+                journal.update(before, block)
+                journal.save()
+        except ValueError as error:
+            return Response({'error': str(error)}, status=status.HTTP_400_BAD_REQUEST)
+        serializer = BlockSerializer(block, context=self.get_serializer_context())
+        return Response(serializer.data)
+
+
 class CommentViewSet(viewsets.ModelViewSet):
     permission_classes = [IsAuthenticated]
     serializer_class = CommentSerializer
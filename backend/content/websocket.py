@@ -0,0 +1,97 @@
+import asyncio
+import functools
+import json
+import re
+from urllib.parse import parse_qs
+
+from asgiref.sync import sync_to_async
+from django.db import close_old_connections
+from rest_framework.utils import encoders
+from rest_framework_simplejwt.exceptions import InvalidToken, AuthenticationFailed
+
+from .authentication import CachedJWTAuthentication
+from .models import Page
+from .realtime import RESYNC, get_broker
+
+PAGE_PATH = re.compile(r'^/ws/pages/(?P<page_id>\d+)/$')
+
+# Коды закрытия соединения (диапазон 4000-4999 отведен приложениям)
+CLOSE_NOT_FOUND = 4404
+CLOSE_FORBIDDEN = 4403
+# Клиент не успевал читать события или они потерялись: перечитать страницу и подключиться снова
+CLOSE_RESYNC = 4408
+
+
+def database_sync_to_async(func):
+    """sync_to_async для работы с ORM: как в Channels, устаревшие соединения закрываются до и после вызова.
+
+    Соединение живет долго, а запросов, после которых Django сам закрывает соединения, здесь нет.
+    """
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+        close_old_connections()
+        try:
+            return func(*args, **kwargs)
+        finally:
+            close_old_connections()
+    return sync_to_async(wrapper)
+
+
+@database_sync_to_async
+def can_subscribe(page_id, query):
+    """Подписка доступна владельцу (?token=<access JWT>) или по ссылке (?share=<token>)"""
+    share_token = query.get('share', [None])[0]
+    if share_token:
+        return Page.objects.filter(id=page_id, share_token=share_token, is_public=True).exists()
+
+    raw_token = query.get('token', [None])[0]
+    if not raw_token:
+        return False
+    authentication = CachedJWTAuthentication()
+    try:
+        user = authentication.get_user(authentication.get_validated_token(raw_token))
+    except (InvalidToken, AuthenticationFailed):
+        return False
+    return Page.objects.filter(id=page_id, owner=user).exists()
+
+
+async def page_events(scope, receive, send):
+    """WebSocket /ws/pages/<id>/: события изменения блоков страницы в формате JSON"""
+    message = await receive()
+    if message['type'] != 'websocket.connect':
+        return
+
+    match = PAGE_PATH.match(scope['path'])
+    if match is None:
+        await send({'type': 'websocket.close', 'code': CLOSE_NOT_FOUND})
+        return
+    page_id = int(match.group('page_id'))
+    query = parse_qs(scope.get('query_string', b'').decode())
+    if not await can_subscribe(page_id, query):
+        await send({'type': 'websocket.close', 'code': CLOSE_FORBIDDEN})
+        return
+
+    await send({'type': 'websocket.accept'})
+    broker = get_broker()
+    queue = broker.subscribe(page_id)
+    receiving = asyncio.ensure_future(receive())
+    waiting = asyncio.ensure_future(queue.get())
+    try:
+        while True:
+            done, _ = await asyncio.wait({receiving, waiting}, return_when=asyncio.FIRST_COMPLETED)
+            if waiting in done:
+                event = waiting.result()
+                if event is RESYNC:
+                    await send({'type': 'websocket.close', 'code': CLOSE_RESYNC})
+                    break
+                await send({'type': 'websocket.send', 'text': json.dumps(event, cls=encoders.JSONEncoder)})
+                waiting = asyncio.ensure_future(queue.get())
+            if receiving in done:
+                # Входящие сообщения (ping от клиента) игнорируем, ждем только отключения
+                if receiving.result()['type'] == 'websocket.disconnect':
+                    break
+                receiving = asyncio.ensure_future(receive())
+    finally:
+        broker.unsubscribe(page_id, queue)
+        receiving.cancel()
+        waiting.cancel()
@@ -1,11 +1,28 @@
 """
 ASGI config for notion_clone project.
+
+HTTP обслуживает Django, WebSocket-соединения /ws/pages/<id>/ — content.websocket.
 """
 
 import os
 
+from django.conf import settings
+from django.contrib.staticfiles.handlers import ASGIStaticFilesHandler
 from django.core.asgi import get_asgi_application
 
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'notion_clone.settings')
 
-application = get_asgi_application()
+django_application = get_asgi_application()
+
+if settings.DEBUG:
+    # В разработке статику (админка, DRF) раздает сам Django, как runserver
+    django_application = ASGIStaticFilesHandler(django_application)
+
+from content.websocket import page_events
+
+
+async def application(scope, receive, send):
+    if scope['type'] == 'websocket':
+        await page_events(scope, receive, send)
+    else:
+        await django_application(scope, receive, send)
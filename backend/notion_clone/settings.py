@@ -43,6 +43,8 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    # Первым, чтобы замерять весь запрос; без PROFILING=1 не подключается
+    'content.profiling.ProfilingMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'corsheaders.middleware.CorsMiddleware',
@@ -72,17 +74,86 @@ TEMPLATES = [
 ]
 
 WSGI_APPLICATION = 'notion_clone.wsgi.application'
+ASGI_APPLICATION = 'notion_clone.asgi.application'
 
 
 # Database
 # https://docs.djangoproject.com/en/5.0/ref/settings/#databases
 
-DATABASES = {
-    'default': {
-        'ENGINE': 'django.db.backends.sqlite3',
-        'NAME': BASE_DIR / 'db.sqlite3',
+# Параметры из окружения (DATABASE_ENGINE, DATABASE_NAME, ...), по умолчанию — SQLite для разработки
+
+DATABASE_ENGINE = os.environ.get('DATABASE_ENGINE', 'notion_clone.sqlite')
+
+if DATABASE_ENGINE in ('notion_clone.sqlite', 'django.db.backends.sqlite3'):
+    DATABASES = {
+        'default': {
+            # Стандартный движок с WAL и BEGIN IMMEDIATE, см. notion_clone/sqlite/base.py
+            'ENGINE': 'notion_clone.sqlite',
+            'NAME': os.environ.get('DATABASE_NAME', BASE_DIR / 'db.sqlite3'),
+            'OPTIONS': {
+                # Сколько секунд ждать освобождения блокировки записи (busy_timeout)
+                'timeout': int(os.environ.get('DATABASE_TIMEOUT', 20)),
+            },
+        }
     }
-}
+else:
+    DATABASES = {
+        'default': {
+            'ENGINE': DATABASE_ENGINE,
+            'NAME': os.environ.get('DATABASE_NAME', 'notion_clone'),
+            'USER': os.environ.get('DATABASE_USER', ''),
+            'PASSWORD': os.environ.get('DATABASE_PASSWORD', ''),
+            'HOST': os.environ.get('DATABASE_HOST', ''),
+            'PORT': os.environ.get('DATABASE_PORT', ''),
+            # Постоянные соединения с проверкой перед повторным использованием.
+            # Под ASGI соединение живет в потоке запроса и не переиспользуется,
+            # поэтому там ставьте 0 и держите пул в PgBouncer (см. docker-compose.yml)
+            'CONN_MAX_AGE': int(os.environ.get('DATABASE_CONN_MAX_AGE', 60)),
+            'CONN_HEALTH_CHECKS': True,
+            # PgBouncer в режиме transaction не поддерживает серверные курсоры
+            'DISABLE_SERVER_SIDE_CURSORS': os.environ.get('DATABASE_POOLER') == 'transaction',
+        }
+    }
+
+
+# Cache
+# Локальная память по умолчанию (отдельно в каждом воркере). Для общего кэша укажите REDIS_URL.
+# Общий ли кэш у всех процессов: без него отзыв токенов проверяется и по базе
+AUTH_CACHE_SHARED = bool(os.environ.get('REDIS_URL'))
+
+if AUTH_CACHE_SHARED:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+            'LOCATION': os.environ['REDIS_URL'],
+        }
+    }
+else:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        }
+    }
+
+# Брокер событий WebSocket: в пределах процесса или через Redis для нескольких воркеров
+REALTIME_REDIS_URL = os.environ.get('REDIS_URL')
+REALTIME_BROKER = (
+    'content.realtime.RedisBroker' if REALTIME_REDIS_URL else 'content.realtime.InProcessBroker'
+)
+# Необработанных событий на подписчика; при переполнении клиент отключается и перечитывает страницу
+REALTIME_QUEUE_SIZE = 1000
+
+# Время жизни кэша публичных страниц (ключ включает ревизию, так что это лишь ограничение памяти)
+PUBLIC_PAGE_CACHE_TIMEOUT = 3600
+
+
+# Профилирование запросов (content/profiling.py): Server-Timing, /api/metrics/, журнал медленных запросов
+PROFILING_ENABLED = os.environ.get('PROFILING') == '1'
+PROFILING_SLOWEST = int(os.environ.get('PROFILING_SLOWEST', 20))  # сколько самых медленных запросов помнить
+PROFILING_SLOW_MS = int(os.environ.get('PROFILING_SLOW_MS', 200))  # быстрее не записываются в журнал
+PROFILING_MAX_QUERIES = 200  # SQL одного запроса в журнале, не больше
+# С каких адресов доступны метрики (сборщик Prometheus обращается к backend:8000 напрямую)
+PROFILING_METRICS_IPS = os.environ.get('PROFILING_METRICS_IPS', '127.0.0.1,::1').split(',')
 
 
 # Password validation
@@ -125,6 +196,9 @@ STATIC_ROOT = BASE_DIR / 'staticfiles'
 # Media files
 MEDIA_URL = '/media/'
 MEDIA_ROOT = BASE_DIR / 'media'
+# Внутренний location nginx с alias на MEDIA_ROOT: файлы по /api/media/ отдаются через X-Accel-Redirect.
+# Пусто — Django отдает файл сам (разработка без nginx)
+MEDIA_ACCEL_REDIRECT = os.environ.get('MEDIA_ACCEL_REDIRECT', '')
 
 # Default primary key field type
 # https://docs.djangoproject.com/en/5.0/ref/settings/#default-auto-field
@@ -138,11 +212,21 @@ CORS_ALLOW_CREDENTIALS = True
 # REST Framework settings
 REST_FRAMEWORK = {
     'DEFAULT_AUTHENTICATION_CLASSES': [
-        'rest_framework_simplejwt.authentication.JWTAuthentication',
+        'content.authentication.CachedJWTAuthentication',
     ],
     'DEFAULT_PERMISSION_CLASSES': [
         'rest_framework.permissions.IsAuthenticated',
     ],
+    # orjson, если установлен (content/renderers.py)
+    'DEFAULT_RENDERER_CLASSES': [
+        'content.renderers.FastJSONRenderer',
+        'rest_framework.renderers.BrowsableAPIRenderer',
+    ],
+    'DEFAULT_PARSER_CLASSES': [
+        'content.renderers.FastJSONParser',
+        'rest_framework.parsers.FormParser',
+        'rest_framework.parsers.MultiPartParser',
+    ],
     'DEFAULT_PAGINATION_CLASS': 'rest_framework.pagination.PageNumberPagination',
     'PAGE_SIZE': 100
 }
@@ -156,8 +240,40 @@ SIMPLE_JWT = {
     'ROTATE_REFRESH_TOKENS': True,
     'BLACKLIST_AFTER_ROTATION': True,
     'AUTH_HEADER_TYPES': ('Bearer',),
+    'TOKEN_REFRESH_SERIALIZER': 'content.authentication.CachedTokenRefreshSerializer',
 }
 
+# Сколько секунд пользователь из JWT берется из кэша без запроса к базе.
+# Изменение пользователя и выход сбрасывают запись сразу; с LocMemCache (без Redis)
+# в других процессах — не позже чем через это время. Столько же кэшируется ответ
+# «refresh-токен не в blacklist» / «access-токен не отозван»: дольше отзыв в другом
+# процессе оставался бы незамеченным
+AUTH_USER_CACHE_TIMEOUT = 60
+
 # File upload settings
-FILE_UPLOAD_MAX_MEMORY_SIZE = 52428800  # 50 MB
+# Файлы больше этого размера Django пишет во временный файл, а не держит в памяти
+FILE_UPLOAD_MAX_MEMORY_SIZE = 2621440  # 2.5 MB
 DATA_UPLOAD_MAX_MEMORY_SIZE = 52428800  # 50 MB
+
+# Загрузка по частям (/api/uploads/): части пишутся сразу на диск
+UPLOAD_TEMP_DIR = BASE_DIR / 'upload_tmp'  # вне MEDIA_ROOT, на том же диске — готовый файл перемещается
+UPLOAD_CHUNK_SIZE = 5 * 1024 * 1024  # рекомендуемый размер части для клиента
+UPLOAD_MAX_CHUNK_SIZE = 16 * 1024 * 1024
+UPLOAD_MAX_SIZE = 2 * 1024 * 1024 * 1024  # 2 GB
+
+# Ширины уменьшенных копий изображений (manage.py media_worker)
+IMAGE_VARIANT_WIDTHS = [320, 640, 1280, 1920]
+
+# Журнал изменений блоков (manage.py compact_history): новый снимок страницы после
+# HISTORY_SNAPSHOT_EVERY записей ограничивает проигрывание для ?at=, записи старше
+# HISTORY_RETENTION_DAYS удаляются (отменить их уже нельзя)
+HISTORY_SNAPSHOT_EVERY = 200
+HISTORY_RETENTION_DAYS = 30
+
+# Отметки об удаленных блоках для /api/blocks/sync/ (manage.py prune_deleted_blocks);
+# клиент, не синхронизировавшийся дольше, получает страницу целиком
+DELETED_BLOCKS_RETENTION_DAYS = 30
+
+# Пауза (с) между запусками manage.py maintenance: compact_history, prune_deleted_blocks,
+# cleanup_uploads и collect_media
+MAINTENANCE_INTERVAL = 3600
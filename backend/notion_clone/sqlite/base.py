@@ -0,0 +1,20 @@
+"""SQLite для разработки, рассчитанный на несколько одновременных воркеров.
+
+- WAL: чтение не блокируется записью, запись не ждет читателей;
+- synchronous=NORMAL: в режиме WAL надежно и без fsync на каждый коммит;
+- BEGIN IMMEDIATE: транзакция сразу берет блокировку записи. При обычном
+  BEGIN две транзакции, начавшие с чтения, при первой записи получают
+  "database is locked" без ожидания, и timeout (busy_timeout) не помогает.
+"""
+from django.db.backends.sqlite3 import base
+
+
+class DatabaseWrapper(base.DatabaseWrapper):
+    def get_new_connection(self, conn_params):
+        conn = super().get_new_connection(conn_params)
+        conn.execute('PRAGMA journal_mode = WAL')
+        conn.execute('PRAGMA synchronous = NORMAL')
+        return conn
+    
+    def _start_transaction_under_autocommit(self):
+        self.cursor().execute('BEGIN IMMEDIATE')
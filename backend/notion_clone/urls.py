@@ -1,15 +1,13 @@
 """
 URL configuration for notion_clone project.
+
+MEDIA_ROOT не раздается и в разработке: файлы блоков и обложек отдаются
+только через /api/media/ с проверкой доступа.
 """
 from django.contrib import admin
 from django.urls import path, include
-from django.conf import settings
-from django.conf.urls.static import static
 
 urlpatterns = [
     path('admin/', admin.site.urls),
     path('api/', include('content.urls')),
 ]
-
-if settings.DEBUG:
-    urlpatterns += static(settings.MEDIA_URL, document_root=settings.MEDIA_ROOT)
@@ -1,8 +1,16 @@
-import axios from 'axios';
-import { Page, Block } from './types';
+import axios, { isAxiosError } from 'axios';
+import { Page, Block, BlockOperation, BlockBatchResult, BlockSyncResult, BlockTreeNode, HistoryEntry, PageEvent, PageTreeNode, SearchResult, Upload } from './types';
 
 const API_URL = '/api';
 
+// Сколько раз повторять часть при обрыве соединения
+const UPLOAD_CHUNK_RETRIES = 3;
+
+const sha256Hex = async (data: ArrayBuffer) => {
+  const digest = await crypto.subtle.digest('SHA-256', data);
+  return Array.from(new Uint8Array(digest)).map((byte) => byte.toString(16).padStart(2, '0')).join('');
+};
+
 // Настройка axios для автоматической отправки токена
 const axiosInstance = axios.create({
   baseURL: API_URL,
@@ -84,8 +92,19 @@ export const api = {
   createPage: (data: Partial<Page>) => axiosInstance.post<Page>('/pages/', data),
   updatePage: (id: number, data: Partial<Page>) => axiosInstance.patch<Page>(`/pages/${id}/`, data),
   deletePage: (id: number) => axiosInstance.delete(`/pages/${id}/`),
+  getPageTree: () => axiosInstance.get<PageTreeNode[]>('/pages/tree/'),
+  getPageAncestors: (id: number) => axiosInstance.get<Omit<PageTreeNode, 'children'>[]>(`/pages/${id}/ancestors/`),
+  getPageSubtree: (id: number) => axiosInstance.get<PageTreeNode>(`/pages/${id}/subtree/`),
+  movePage: (id: number, parent: number | null) =>
+    axiosInstance.post<{ id: number; parent: number | null; path: string }>(`/pages/${id}/move/`, { parent }),
   toggleSharePage: (id: number) => axiosInstance.post<Page>(`/pages/${id}/toggle_share/`),
   generateShareLink: (id: number) => axiosInstance.post<{share_token: string; share_url: string}>(`/pages/${id}/generate_share_link/`),
+  undoPage: (id: number) => axiosInstance.post<HistoryEntry>(`/pages/${id}/undo/`),
+  redoPage: (id: number) => axiosInstance.post<HistoryEntry>(`/pages/${id}/redo/`),
+  getPageHistory: (id: number, before?: number) =>
+    axiosInstance.get<HistoryEntry[]>(`/pages/${id}/history/`, { params: { before } }),
+  getPageAt: (id: number, at: string) =>
+    axiosInstance.get<{ page: number; at: string; blocks: Omit<Block, 'page' | 'comments'>[] }>(`/pages/${id}/history/`, { params: { at } }),
   getPublicPage: (token: string) => {
     // Для публичных страниц не требуется токен
     return axios.get<Page>(`${API_URL}/public/share/${token}/`);
@@ -95,13 +114,37 @@ export const api = {
     return axios.get<Block[]>(`${API_URL}/public/share/${token}/blocks/`);
   },
   
+  // Search
+  search: (query: string, limit = 20) =>
+    axiosInstance.get<SearchResult>('/search/', { params: { q: query, limit } }),
+  
   // Blocks
   getBlocks: (pageId: number) => axiosInstance.get<Block[]>(`/blocks/?page=${pageId}`),
+  getBlockTree: (pageId: number) => axiosInstance.get<BlockTreeNode[]>(`/blocks/?page=${pageId}&tree=1`),
+  syncBlocks: (pageId: number, since: number) =>
+    axiosInstance.get<BlockSyncResult>(`/blocks/sync/?page=${pageId}&since=${since}`),
   createBlock: (data: Partial<Block>) => axiosInstance.post<Block>('/blocks/', data),
   updateBlock: (id: number, data: Partial<Block>) => axiosInstance.patch<Block>(`/blocks/${id}/`, data),
   deleteBlock: (id: number) => axiosInstance.delete(`/blocks/${id}/`),
+  batchBlocks: (pageId: number, operations: BlockOperation[]) =>
+    axiosInstance.post<BlockBatchResult>('/blocks/batch/', { page: pageId, operations }),
   reorderBlocks: (blocks: { id: number; order: number }[]) => 
     axiosInstance.post('/blocks/reorder/', { blocks }),
+  moveBlock: (id: number, after: number | null) =>
+    axiosInstance.post<{ orders: { id: number; order: number }[] }>(`/blocks/${id}/move/`, { after }),
+  
+  // События страницы в реальном времени (WebSocket)
+  // onResync: сервер закрыл соединение кодом 4408 — события пропущены, страницу нужно перечитать
+  subscribeToPage: (pageId: number, onEvent: (event: PageEvent) => void, onResync?: () => void) => {
+    const protocol = window.location.protocol === 'https:' ? 'wss' : 'ws';
+    const token = encodeURIComponent(localStorage.getItem('access_token') || '');
+    const socket = new WebSocket(`${protocol}://${window.location.host}/ws/pages/${pageId}/?token=${token}`);
+    socket.onmessage = (message) => onEvent(JSON.parse(message.data));
+    socket.onclose = (event) => {
+      if (event.code === 4408) onResync?.();
+    };
+    return socket;
+  },
   
   // File upload
   uploadFile: (blockId: number, file: File, onUploadProgress?: (progress: number) => void) => {
@@ -119,4 +162,40 @@ export const api = {
       },
     });
   },
+  
+  // Загрузка по частям: обрыв соединения не начинает загрузку заново
+  uploadFileInChunks: async (blockId: number, file: File, onUploadProgress?: (progress: number) => void) => {
+    const { data: upload } = await axiosInstance.post<Upload>('/uploads/', {
+      block: blockId,
+      file_name: file.name,
+      content_type: file.type,
+      size: file.size,
+    });
+    let received = upload.received;
+    let failures = 0;
+    while (received < file.size) {
+      const chunk = await file.slice(received, received + upload.chunk_size).arrayBuffer();
+      try {
+        const response = await axiosInstance.put<{ received: number }>(`/uploads/${upload.id}/append/`, chunk, {
+          headers: {
+            'Content-Type': 'application/octet-stream',
+            'Upload-Offset': String(received),
+            'X-Chunk-SHA256': await sha256Hex(chunk),
+          },
+        });
+        received = response.data.received;
+        failures = 0;
+      } catch (error) {
+        if (++failures > UPLOAD_CHUNK_RETRIES) {
+          throw error;
+        }
+        // Сервер сообщает принятую позицию (409) — продолжаем с нее
+        if (isAxiosError(error) && typeof error.response?.data?.received === 'number') {
+          received = error.response.data.received;
+        }
+      }
+      onUploadProgress?.(Math.round((received * 100) / file.size));
+    }
+    return axiosInstance.post<Block>(`/uploads/${upload.id}/complete/`);
+  },
 };
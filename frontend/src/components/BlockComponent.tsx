@@ -4,6 +4,7 @@ import { useSortable } from '@dnd-kit/sortable';
 import { CSS } from '@dnd-kit/utilities';
 import { FiMove, FiTrash2, FiBold, FiItalic, FiChevronUp, FiChevronDown } from 'react-icons/fi';
 import { useDropzone, Accept } from 'react-dropzone';
+import { mediaUrl, mediaSrcset } from '../utils/media';
 
 interface BlockComponentProps {
   block: Block;
@@ -214,13 +215,27 @@ function BlockComponent({
             {block.file_url ? (
               <>
                 {block.block_type === 'image' && (
-                  <img src={block.file_url} alt="uploaded" />
+                  <picture>
+                    {block.file_srcset?.avif && (
+                      <source type="image/avif" srcSet={mediaSrcset(block.file_srcset.avif)} sizes="(max-width: 900px) 100vw, 900px" />
+                    )}
+                    {block.file_srcset?.webp && (
+                      <source type="image/webp" srcSet={mediaSrcset(block.file_srcset.webp)} sizes="(max-width: 900px) 100vw, 900px" />
+                    )}
+                    <img
+                      src={mediaUrl(block.file_url)}
+                      alt="uploaded"
+                      loading="lazy"
+                      width={block.file_placeholder?.width}
+                      height={block.file_placeholder?.height}
+                    />
+                  </picture>
                 )}
                 {block.block_type === 'video' && (
-                  <video src={block.file_url} controls />
+                  <video src={mediaUrl(block.file_url)} controls />
                 )}
                 {block.block_type === 'audio' && (
-                  <audio src={block.file_url} controls />
+                  <audio src={mediaUrl(block.file_url)} controls />
                 )}
               </>
             ) : (
@@ -252,7 +267,7 @@ function BlockComponent({
         return (
           <div className="media-block">
             {block.file_url ? (
-              <a href={block.file_url} download className="file-download-link">
+              <a href={mediaUrl(block.file_url)} download className="file-download-link">
                 📎 {block.content || 'Скачать файл'} ({formatFileSize(block.file_size)})
               </a>
             ) : (
@@ -1,6 +1,7 @@
 import { useState, useEffect } from 'react';
-import { Page, Block } from '../types';
+import { Page, Block, BLOCK_ORDER_GAP } from '../types';
 import { api } from '../api';
+import { applyPageEvent } from '../utils/pageEvents';
 import BlockComponent from './BlockComponent';
 import BlockMenu from './BlockMenu';
 import { DndContext, closestCenter, DragEndEvent, DragOverlay, PointerSensor, useSensor, useSensors } from '@dnd-kit/core';
@@ -23,6 +24,8 @@ function PageView({ page, onUpdatePage, isEditMode = true }: PageViewProps) {
   const [shareUrl, setShareUrl] = useState<string>('');
   const [copied, setCopied] = useState(false);
   const [uploadProgress, setUploadProgress] = useState<{ [blockId: number]: number }>({});
+  // Счетчик переподключений WebSocket после пропущенных событий
+  const [subscription, setSubscription] = useState(0);
   
   // Настройка сенсоров для перетаскивания - отключаем на мобильных
   const isMobile = typeof window !== 'undefined' && window.innerWidth <= 768;
@@ -50,6 +53,19 @@ function PageView({ page, onUpdatePage, isEditMode = true }: PageViewProps) {
     }
   }, [page.id, page.share_url, page.blocks, page.share_token, isEditMode]);
 
+  // Изменения от соавторов и других вкладок приходят по WebSocket
+  useEffect(() => {
+    if (!isEditMode) return;
+    const socket = api.subscribeToPage(page.id, (event) => {
+      setBlocks(current => applyPageEvent(current, event));
+    }, () => {
+      // Часть событий пропущена: перечитываем блоки и подписываемся заново
+      loadBlocks();
+      setSubscription(value => value + 1);
+    });
+    return () => socket.close();
+  }, [page.id, isEditMode, subscription]);
+
   // Синхронизируем локальное состояние с пропсом page при его изменении
   useEffect(() => {
     // Обновляем только если значение действительно изменилось (не из нашего локального изменения)
@@ -103,7 +119,7 @@ function PageView({ page, onUpdatePage, isEditMode = true }: PageViewProps) {
         page: page.id,
         block_type: blockType as any,
         content: '',
-        order: blocks.length,
+        order: blocks.length ? blocks[blocks.length - 1].order + BLOCK_ORDER_GAP : 0,
       });
       setBlocks([...blocks, response.data]);
       setShowBlockMenu(false);
@@ -130,6 +146,25 @@ function PageView({ page, onUpdatePage, isEditMode = true }: PageViewProps) {
     }
   };
 
+  // Перемещение одного блока: сервер меняет только его order (или перенумеровывает страницу)
+  const placeBlock = async (oldIndex: number, newIndex: number) => {
+    const newBlocks = [...blocks];
+    const [movedBlock] = newBlocks.splice(oldIndex, 1);
+    newBlocks.splice(newIndex, 0, movedBlock);
+    const after = newIndex > 0 ? newBlocks[newIndex - 1].id : null;
+
+    setBlocks(newBlocks);
+
+    try {
+      const response = await api.moveBlock(movedBlock.id, after);
+      const orders = new Map(response.data.orders.map(item => [item.id, item.order]));
+      setBlocks(newBlocks.map(b => orders.has(b.id) ? { ...b, order: orders.get(b.id)! } : b));
+    } catch (error) {
+      console.error('Ошибка изменения порядка блоков:', error);
+      loadBlocks(); // Перезагрузить при ошибке
+    }
+  };
+
   const handleDragStart = (event: any) => {
     setActiveId(event.active.id);
   };
@@ -145,26 +180,7 @@ function PageView({ page, onUpdatePage, isEditMode = true }: PageViewProps) {
 
     if (oldIndex === -1 || newIndex === -1) return;
 
-    const newBlocks = [...blocks];
-    const [movedBlock] = newBlocks.splice(oldIndex, 1);
-    newBlocks.splice(newIndex, 0, movedBlock);
-
-    // Обновляем order для всех блоков
-    const updatedBlocks = newBlocks.map((block, index) => ({
-      ...block,
-      order: index,
-    }));
-
-    setBlocks(updatedBlocks);
-
-    try {
-      await api.reorderBlocks(
-        updatedBlocks.map((b, index) => ({ id: b.id, order: index }))
-      );
-    } catch (error) {
-      console.error('Ошибка изменения порядка блоков:', error);
-      loadBlocks(); // Перезагрузить при ошибке
-    }
+    await placeBlock(oldIndex, newIndex);
   };
 
   const moveBlock = async (blockId: number, direction: 'up' | 'down') => {
@@ -174,26 +190,7 @@ function PageView({ page, onUpdatePage, isEditMode = true }: PageViewProps) {
     const newIndex = direction === 'up' ? currentIndex - 1 : currentIndex + 1;
     if (newIndex < 0 || newIndex >= blocks.length) return;
 
-    const newBlocks = [...blocks];
-    const [movedBlock] = newBlocks.splice(currentIndex, 1);
-    newBlocks.splice(newIndex, 0, movedBlock);
-
-    // Обновляем order для всех блоков
-    const updatedBlocks = newBlocks.map((block, index) => ({
-      ...block,
-      order: index,
-    }));
-
-    setBlocks(updatedBlocks);
-
-    try {
-      await api.reorderBlocks(
-        updatedBlocks.map((b, index) => ({ id: b.id, order: index }))
-      );
-    } catch (error) {
-      console.error('Ошибка изменения порядка блоков:', error);
-      loadBlocks(); // Перезагрузить при ошибке
-    }
+    await placeBlock(currentIndex, newIndex);
   };
 
   const handleMoveUp = (blockId: number) => {
@@ -209,7 +206,7 @@ function PageView({ page, onUpdatePage, isEditMode = true }: PageViewProps) {
     setUploadProgress(prev => ({ ...prev, [blockId]: 0 }));
     
     try {
-      const response = await api.uploadFile(blockId, file, (progress) => {
+      const response = await api.uploadFileInChunks(blockId, file, (progress) => {
         setUploadProgress(prev => ({ ...prev, [blockId]: progress }));
       });
       setBlocks(blocks.map(b => b.id === blockId ? response.data : b));
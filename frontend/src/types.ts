@@ -5,15 +5,29 @@ export interface Page {
   background_color?: string;
   cover_image?: string;
   cover_image_url?: string;
+  cover_image_srcset?: ImageSrcset | null;
+  cover_image_placeholder?: ImagePlaceholder | null;
   parent?: number;
+  // Материализованный путь от корня: "1/5/9/"
+  path?: string;
   is_public?: boolean;
   share_token?: string;
   share_url?: string;
+  revision?: number;
   created_at: string;
   updated_at: string;
   blocks?: Block[];
 }
 
+// srcset по форматам: { avif: "url 320w, url 640w", webp: "..." }
+export type ImageSrcset = Partial<Record<'avif' | 'webp', string>>;
+
+export interface ImagePlaceholder {
+  width: number;
+  height: number;
+  blurhash: string;
+}
+
 export interface Block {
   id: number;
   page: number;
@@ -29,6 +43,9 @@ export interface Block {
   };
   file?: File | null;
   file_url?: string;
+  // Уменьшенные копии изображения; null, пока фоновый воркер их не построил
+  file_srcset?: ImageSrcset | null;
+  file_placeholder?: ImagePlaceholder | null;
   file_type?: string;
   file_size?: number;
   checked?: boolean;
@@ -38,6 +55,83 @@ export interface Block {
   updated_at: string;
 }
 
+// Шаг order между соседними блоками (Block.ORDER_GAP на бэкенде)
+export const BLOCK_ORDER_GAP = 1024;
+
+export type BlockOperation =
+  | { op: 'create'; client_id?: string; data: Partial<Block> }
+  | { op: 'update'; id: number; data: Partial<Block> }
+  | { op: 'delete'; id: number };
+
+export interface BlockBatchResult {
+  created: { id: number; client_id?: string; created_at: string; updated_at: string }[];
+  updated: (Partial<Block> & { id: number; updated_at: string })[];
+  deleted: number[];
+}
+
+export type BlockTreeNode = Block & { children: BlockTreeNode[] };
+
+export interface BlockSyncResult {
+  page: number;
+  revision: number;
+  // true: отметки об удалениях после since уже удалены, blocks — все блоки страницы
+  full: boolean;
+  blocks: Block[];
+  deleted: number[];
+}
+
+export interface HistoryOperation {
+  op: 'insert' | 'update' | 'move' | 'delete';
+  id: number;
+  before?: Record<string, unknown>;
+  after?: Record<string, unknown>;
+}
+
+export interface HistoryEntry {
+  id: number;
+  action: 'edit' | 'undo' | 'redo';
+  user: number | null;
+  operations: HistoryOperation[];
+  undone: boolean;
+  created_at: string;
+}
+
+export type PageEventBlock = Omit<Partial<Block>, 'file'> & { id: number; file?: string | null };
+
+export type PageEvent =
+  | { type: 'block.created'; block: PageEventBlock }
+  | { type: 'block.updated'; block: PageEventBlock }
+  | { type: 'block.deleted'; id: number }
+  | { type: 'blocks.reordered'; orders: { id: number; order: number }[] };
+
+export interface Upload {
+  id: number;
+  block: number;
+  file_name: string;
+  content_type: string;
+  size: number;
+  // Сколько байт уже принято сервером — с этой позиции продолжается загрузка
+  received: number;
+  chunk_size: number;
+  created_at: string;
+}
+
+export interface PageTreeNode {
+  id: number;
+  title: string;
+  icon?: string;
+  parent: number | null;
+  path: string;
+  children: PageTreeNode[];
+}
+
+export interface SearchResult {
+  query: string;
+  // highlight и snippet — экранированный HTML, совпадения обернуты в <mark>
+  pages: { id: number; title: string; icon?: string; highlight: string; rank: number }[];
+  blocks: { id: number; page: number; page_title: string; block_type: BlockType; snippet: string; rank: number }[];
+}
+
 export type BlockType = 
   | 'text' 
   | 'heading1' 
@@ -0,0 +1,31 @@
+// Файлы блоков отдаются через /api/media/ с проверкой доступа.
+// <img> и <video> не передают заголовок Authorization, поэтому доступ — в параметре URL:
+// токен публичной ссылки (?share=) или access-токен владельца (?token=).
+
+const shareTokenFromPath = () => window.location.pathname.match(/^\/share\/([^/]+)/)?.[1];
+
+export function mediaUrl(url: string): string;
+export function mediaUrl(url: string | undefined): string | undefined;
+export function mediaUrl(url: string | undefined) {
+  if (!url) return url;
+  const parsed = new URL(url, window.location.origin);
+  if (!parsed.searchParams.has('share')) {
+    const share = shareTokenFromPath();
+    if (share) {
+      parsed.searchParams.set('share', decodeURIComponent(share));
+    } else {
+      parsed.searchParams.set('token', localStorage.getItem('access_token') || '');
+    }
+  }
+  return parsed.toString();
+}
+
+// srcset вида "url 320w, url 640w"
+export const mediaSrcset = (srcset: string | undefined) =>
+  srcset
+    ?.split(', ')
+    .map((item) => {
+      const [url, width] = item.split(' ');
+      return `${mediaUrl(url)} ${width}`;
+    })
+    .join(', ');
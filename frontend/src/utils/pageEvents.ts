@@ -0,0 +1,26 @@
+import { Block, PageEvent, PageEventBlock } from '../types';
+
+const sortBlocks = (blocks: Block[]) =>
+  [...blocks].sort((a, b) => a.order - b.order || a.id - b.id);
+
+const toBlock = ({ file, ...block }: PageEventBlock): Partial<Block> =>
+  file === undefined ? block : { ...block, file_url: file ?? undefined };
+
+// Применяет событие WebSocket к локальному списку блоков страницы
+export function applyPageEvent(blocks: Block[], event: PageEvent): Block[] {
+  switch (event.type) {
+    case 'block.created':
+      if (blocks.some(b => b.id === event.block.id)) return blocks;
+      return sortBlocks([...blocks, toBlock(event.block) as Block]);
+    case 'block.updated':
+      return blocks.map(b => b.id === event.block.id ? { ...b, ...toBlock(event.block) } : b);
+    case 'block.deleted':
+      return blocks.filter(b => b.id !== event.id);
+    case 'blocks.reordered': {
+      const orders = new Map(event.orders.map(item => [item.id, item.order]));
+      return sortBlocks(blocks.map(b => orders.has(b.id) ? { ...b, order: orders.get(b.id)! } : b));
+    }
+    default:
+      return blocks;
+  }
+}
@@ -57,9 +57,9 @@ export default defineConfig({
         target: 'http://localhost:8000',
         changeOrigin: true,
       },
-      '/media': {
-        target: 'http://localhost:8000',
-        changeOrigin: true,
+      '/ws': {
+        target: 'ws://localhost:8000',
+        ws: true,
       }
     }
   }
@@ -20,7 +20,7 @@ if not exist "db.sqlite3" (
 )
 
 echo 🔥 Запуск Django сервера...
-start cmd /k "cd /d %cd% && venv\Scripts\activate.bat && python manage.py runserver"
+start cmd /k "cd /d %cd% && venv\Scripts\activate.bat && uvicorn notion_clone.asgi:application --reload --port 8000"
 
 cd ..
 
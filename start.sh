@@ -33,7 +33,7 @@ if [ ! -f "db.sqlite3" ]; then
 fi
 
 echo "🔥 Запуск Django сервера..."
-python manage.py runserver &
+uvicorn notion_clone.asgi:application --reload --port 8000 &
 BACKEND_PID=$!
 
 cd ..